@@ -1,15 +1,49 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Count
+from django.urls import reverse
 from django.utils.html import format_html
-from .models import Valuation, Property, Owner, Plot, VisitingTeam
+from .models import (
+    Valuation, Property, Owner, Plot, VisitingTeam, PartyIdentity, Job, ArchivedValuation, Attachment, Blob,
+)
+from . import collateral
+from . import jobs
+from . import projections
+from . import spatial
+
+
+class ProjectedChangeList(ChangeList):
+    """Changelist that loads only the admin's list_columns"""
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return projections.restrict(queryset, self.model_admin.list_columns)
+
+
+class CachedAllValuesFilter(admin.AllValuesFieldListFilter):
+    """Distinct-values filter whose choices are served from the query cache"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookup_choices = self.lookup_choices.cached()
+
+
+class ProjectedListMixin:
+    """Load just the columns list_display needs on changelists, full rows elsewhere"""
+    list_columns = ()
+
+    def get_changelist(self, request, **kwargs):
+        return ProjectedChangeList if self.list_columns else super().get_changelist(request, **kwargs)
 
 @admin.register(Valuation)
-class ValuationAdmin(admin.ModelAdmin):
+class ValuationAdmin(ProjectedListMixin, admin.ModelAdmin):
     list_display = ('report_number', 'bank_name', 'borrower_name', 'val_date', 'properties_count', 'created_at')
-    list_filter = ('val_date', 'bank_name', 'created_at')
+    list_filter = ('val_date', ('bank_name', CachedAllValuesFilter), 'created_at')
     search_fields = ('report_number', 'bank_name', 'borrower_name', 'bank_ref_no')
     date_hierarchy = 'val_date'
     ordering = ('-val_date',)
     readonly_fields = ('created_at',)
+    list_columns = projections.VALUATION_ADMIN_COLUMNS
     
     fieldsets = (
         ('Basic Information', {
@@ -27,16 +61,22 @@ class ValuationAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(properties_total=Count('properties'))
+    
     def properties_count(self, obj):
-        return obj.properties.count()
+        return obj.properties_total
     properties_count.short_description = 'Properties'
+    properties_count.admin_order_field = 'properties_total'
 
 @admin.register(Property)
-class PropertyAdmin(admin.ModelAdmin):
+class PropertyAdmin(ProjectedListMixin, admin.ModelAdmin):
     list_display = ('name', 'district', 'municipality', 'valuation_link', 'owners_count', 'plots_count', 'total_value_display', 'created_at')
-    list_filter = ('district', 'land_type', 'created_at')
+    list_filter = (('district', CachedAllValuesFilter), 'land_type', 'created_at')
     search_fields = ('name', 'district', 'municipality', 'address')
+    autocomplete_fields = ('valuation',)
     readonly_fields = ('created_at',)
+    list_columns = projections.PROPERTY_ADMIN_COLUMNS
     
     fieldsets = (
         ('Basic Information', {
@@ -56,24 +96,32 @@ class PropertyAdmin(admin.ModelAdmin):
                           obj.valuation.id, obj.valuation.report_number)
     valuation_link.short_description = 'Valuation Report'
     
+    def get_queryset(self, request):
+        return projections.with_property_totals(super().get_queryset(request))
+    
     def owners_count(self, obj):
-        return obj.owners.count()
+        return obj.owner_count
     owners_count.short_description = 'Owners'
+    owners_count.admin_order_field = 'owner_count'
     
     def plots_count(self, obj):
-        return obj.plots.count()
+        return obj.plot_count
     plots_count.short_description = 'Plots'
+    plots_count.admin_order_field = 'plot_count'
     
     def total_value_display(self, obj):
-        return f"Rs. {obj.total_value:,.2f}" if obj.total_value else "Rs. 0.00"
+        return f"Rs. {obj.total_value_sum:,.2f}" if obj.total_value_sum else "Rs. 0.00"
     total_value_display.short_description = 'Total Value'
+    total_value_display.admin_order_field = 'total_value_sum'
 
 @admin.register(Owner)
-class OwnerAdmin(admin.ModelAdmin):
+class OwnerAdmin(ProjectedListMixin, admin.ModelAdmin):
     list_display = ('name', 'property_link', 'contact_number', 'citizenship_number', 'pan_number', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('name', 'contact_number', 'citizenship_number', 'pan_number', 'property__name')
+    autocomplete_fields = ('property',)
     readonly_fields = ('created_at',)
+    list_columns = projections.OWNER_ADMIN_COLUMNS
     
     fieldsets = (
         ('Owner Information', {
@@ -97,15 +145,18 @@ class OwnerAdmin(admin.ModelAdmin):
     property_link.short_description = 'Property'
 
 @admin.register(Plot)
-class PlotAdmin(admin.ModelAdmin):
+class PlotAdmin(ProjectedListMixin, admin.ModelAdmin):
     list_display = ('plot_number', 'property_link', 'area_display', 'market_rate_display', 'fair_market_value_display', 'created_at')
     list_filter = ('created_at',)
-    search_fields = ('plot_number', 'sheet_number', 'property__name')
-    readonly_fields = ('created_at', 'area_sqft', 'area_sqmt', 'gov_value', 'market_value', 'fair_market_value')
+    search_fields = ('plot_number', 'sheet_number', 'property__name', '=parcel_key')
+    autocomplete_fields = ('property',)
+    readonly_fields = ('created_at', 'area_sqft', 'area_sqmt', 'gov_value', 'market_value', 'fair_market_value',
+                       'parcel_key')
+    list_columns = projections.PLOT_ADMIN_COLUMNS
     
     fieldsets = (
         ('Plot Identification', {
-            'fields': ('property', 'plot_number', 'sheet_number')
+            'fields': ('property', 'plot_number', 'sheet_number', 'parcel_key')
         }),
         ('Area Measurement - Ropani System (Hilly)', {
             'fields': ('ropani', 'ana', 'paisa', 'dam'),
@@ -130,6 +181,10 @@ class PlotAdmin(admin.ModelAdmin):
             'fields': ('north_boundary', 'south_boundary', 'east_boundary', 'west_boundary'),
             'classes': ('collapse',)
         }),
+        ('Location', {
+            'fields': ('latitude', 'longitude', 'boundary'),
+            'classes': ('collapse',)
+        }),
         ('Additional Details', {
             'fields': ('remarks',),
             'classes': ('collapse',)
@@ -162,17 +217,34 @@ class PlotAdmin(admin.ModelAdmin):
         obj.calculate_areas()
         obj.calculate_valuations()
         super().save_model(request, obj, form, change)
+        duplicates = list(collateral.other_pledges([obj]))
+        if duplicates:
+            self.message_user(request, 'Parcel already pledged: ' + '; '.join(
+                collateral.describe(plot) for plot in duplicates
+            ), messages.WARNING)
+        if obj.boundary:
+            overlaps = spatial.overlapping(obj.boundary, exclude=obj.pk)
+            if overlaps:
+                self.message_user(request, 'Boundary overlaps plot(s) already pledged: ' + ', '.join(
+                    f'{plot.plot_number} (#{plot.pk})' for plot in overlaps
+                ), messages.WARNING)
 
 @admin.register(VisitingTeam)
-class VisitingTeamAdmin(admin.ModelAdmin):
-    list_display = ('member_name', 'designation', 'valuation_link', 'contact_number', 'created_at')
-    list_filter = ('created_at',)
+class VisitingTeamAdmin(ProjectedListMixin, admin.ModelAdmin):
+    list_display = ('member_name', 'designation', 'valuation_link', 'visit_date', 'route_order', 'contact_number',
+                    'created_at')
+    list_filter = ('visit_date', 'created_at')
     search_fields = ('member_name', 'designation', 'valuation__report_number')
+    autocomplete_fields = ('valuation', 'user')
     readonly_fields = ('created_at',)
+    list_columns = projections.VISITING_TEAM_ADMIN_COLUMNS
     
     fieldsets = (
         ('Team Member Information', {
-            'fields': ('valuation', 'member_name', 'designation', 'contact_number')
+            'fields': ('valuation', 'member_name', 'designation', 'contact_number', 'user')
+        }),
+        ('Schedule', {
+            'fields': ('visit_date', 'route_order')
         }),
         ('System Information', {
             'fields': ('created_at',),
@@ -185,6 +257,111 @@ class VisitingTeamAdmin(admin.ModelAdmin):
                           obj.valuation.id, obj.valuation.report_number)
     valuation_link.short_description = 'Valuation Report'
 
+@admin.register(PartyIdentity)
+class PartyIdentityAdmin(admin.ModelAdmin):
+    list_display = ('id_number', 'id_type', 'name', 'role', 'valuation_link', 'property')
+    list_filter = ('id_type', 'role')
+    search_fields = ('=id_number', 'name')
+    list_select_related = ('valuation', 'property')
+    readonly_fields = ('id_type', 'id_number', 'role', 'name', 'valuation', 'property', 'owner')
+    
+    def has_add_permission(self, request):
+        # Rows are maintained from Owner/Valuation saves
+        return False
+    
+    def valuation_link(self, obj):
+        return format_html('<a href="/admin/report/valuation/{}/change/">{}</a>', 
+                          obj.valuation.id, obj.valuation.report_number)
+    valuation_link.short_description = 'Valuation Report'
+
+@admin.register(ArchivedValuation)
+class ArchivedValuationAdmin(admin.ModelAdmin):
+    list_display = ('report_number', 'fiscal_year', 'bank_name', 'borrower_name', 'val_date', 'archived_at')
+    list_filter = ('fiscal_year', 'bank_name')
+    search_fields = ('report_number', 'bank_name', 'borrower_name')
+    readonly_fields = ('original_id', 'fiscal_year', 'report_number', 'val_date', 'bank_name', 'borrower_name',
+                       'payload', 'archived_at')
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+            # Snapshots can be large; the list never shows them
+            queryset = queryset.defer('payload')
+        return queryset
+    
+    def has_add_permission(self, request):
+        # Rows are written by the archive_fiscal_year command
+        return False
+
+@admin.register(Attachment)
+class AttachmentAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'kind', 'valuation', 'property', 'plot', 'uploaded_by', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('original_name', 'caption', 'valuation__report_number', 'blob__sha256')
+    list_select_related = ('valuation', 'property', 'plot', 'uploaded_by')
+    raw_id_fields = ('valuation', 'property', 'plot', 'blob')
+    readonly_fields = ('blob', 'original_name', 'uploaded_by', 'created_at', 'updated_at')
+    
+    def has_add_permission(self, request):
+        # Files are uploaded from the report page
+        return False
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'content_type', 'size', 'attachment_count', 'has_thumbnail', 'created_at')
+    list_filter = ('content_type',)
+    search_fields = ('=sha256',)
+    readonly_fields = ('sha256', 'size', 'content_type', 'file', 'thumbnail', 'created_at')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(attachment_count=Count('attachments'))
+    
+    def attachment_count(self, obj):
+        return obj.attachment_count
+    attachment_count.short_description = 'Attachments'
+    attachment_count.admin_order_field = 'attachment_count'
+    
+    def has_thumbnail(self, obj):
+        return bool(obj.thumbnail)
+    has_thumbnail.boolean = True
+    has_thumbnail.short_description = 'Thumbnail'
+    
+    def has_add_permission(self, request):
+        # Blobs are created by uploads and removed by prune_blobs
+        return False
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'progress_display', 'attempts', 'worker', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('name', 'payload', 'status', 'attempts', 'progress', 'progress_total', 'progress_message',
+                       'result', 'error', 'worker', 'created_by', 'created_at', 'started_at', 'finished_at')
+    list_select_related = ('created_by',)
+    
+    fieldsets = (
+        ('Job', {
+            'fields': ('name', 'payload', 'status', 'attempts', 'max_attempts', 'run_after')
+        }),
+        ('Progress', {
+            'fields': ('progress', 'progress_total', 'progress_message')
+        }),
+        ('Outcome', {
+            'fields': ('result', 'error', 'worker')
+        }),
+        ('System Information', {
+            'fields': ('created_by', 'created_at', 'started_at', 'finished_at'),
+            'classes': ('collapse',)
+        })
+    )
+    
+    def has_add_permission(self, request):
+        # Jobs are queued from the app, not typed in
+        return False
+    
+    def progress_display(self, obj):
+        return f"{obj.progress}/{obj.progress_total} ({obj.percent}%)"
+    progress_display.short_description = 'Progress'
+
 # Custom Admin Site Header and Title
 admin.site.site_header = 'Nepali Land Valuation System Administration'
 admin.site.site_title = 'Valuation System Admin'
@@ -193,12 +370,14 @@ admin.site.index_title = 'Valuation System Management'
 
 # Custom admin actions
 def calculate_all_valuations(modeladmin, request, queryset):
-    """Admin action to recalculate all valuations for selected plots"""
-    for plot in queryset:
-        plot.calculate_areas()
-        plot.calculate_valuations()
-        plot.save()
-    modeladmin.message_user(request, f"Recalculated valuations for {queryset.count()} plots.")
+    """Admin action to queue a recalculation of the selected plots"""
+    plot_ids = list(queryset.values_list('pk', flat=True))
+    job = jobs.enqueue('recalculate_plots', user=request.user, plot_ids=plot_ids)
+    modeladmin.message_user(
+        request,
+        format_html('Queued recalculation of {} plots as <a href="{}">job #{}</a>.',
+                    len(plot_ids), reverse('admin:report_job_change', args=[job.pk]), job.pk),
+    )
 
 calculate_all_valuations.short_description = "Recalculate valuations for selected plots"
 
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ReportConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'report'
+
+    def ready(self):
+        from . import signals, spatial, tasks  # noqa: F401
+        post_migrate.connect(spatial.ensure_index, sender=self)
@@ -0,0 +1,174 @@
+import re
+from datetime import date
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import (
+    ArchivedPartyIdentity, ArchivedValuation, Attachment, Blob, Owner, PartyIdentity, Plot,
+    Property, Valuation, VisitingTeam,
+)
+
+# Nepal's fiscal year starts on Shrawan 1, which falls on July 16/17.
+# Labels use Bikram Sambat years, e.g. 2081/82 for July 2024 - July 2025.
+FISCAL_YEAR_START = getattr(settings, 'REPORT_FISCAL_YEAR_START', (7, 16))
+BS_YEAR_OFFSET = 57
+BATCH_SIZE = 200
+FISCAL_YEAR_LABEL = re.compile(r'([0-9]{4})/([0-9]{2})')
+
+
+def fiscal_year(day):
+    """Fiscal year label of a date"""
+    start_year = day.year if (day.month, day.day) >= FISCAL_YEAR_START else day.year - 1
+    bs_year = start_year + BS_YEAR_OFFSET
+    return f'{bs_year}/{(bs_year + 1) % 100:02d}'
+
+
+def normalize_fiscal_year(label):
+    """The label as stored in the archive, e.g. ' 2080/81 ' -> '2080/81'; ValueError if malformed"""
+    match = FISCAL_YEAR_LABEL.fullmatch((label or '').strip())
+    if match is None or int(match[2]) != (int(match[1]) + 1) % 100:
+        raise ValueError(f'Invalid fiscal year {label!r}; use the form 2080/81.')
+    return match[0]
+
+
+def fiscal_year_bounds(label):
+    """First and last day (inclusive start, exclusive end) of a fiscal year label"""
+    start_year = int(normalize_fiscal_year(label)[:4]) - BS_YEAR_OFFSET
+    month, day = FISCAL_YEAR_START
+    return date(start_year, month, day), date(start_year + 1, month, day)
+
+
+def current_fiscal_year():
+    return fiscal_year(timezone.localdate())
+
+
+def _dump(instance):
+    return {
+        field.attname: field.value_from_object(instance)
+        for field in instance._meta.concrete_fields
+    }
+
+
+def _load(model, data, **extra):
+    """Rebuild an unsaved, read-only instance from snapshot data"""
+    values = {
+        field.attname: field.to_python(data[field.attname])
+        for field in model._meta.concrete_fields
+        if field.attname in data
+    }
+    instance = model(**values)
+    instance._state.adding = False
+    for name, value in extra.items():
+        setattr(instance, name, value)
+    return instance
+
+
+def snapshot(valuation):
+    """Denormalized copy of a prefetched valuation and everything under it"""
+    return {
+        'valuation': _dump(valuation),
+        'properties': [
+            {
+                'property': _dump(property),
+                'owners': [_dump(owner) for owner in property.owners.all()],
+                'plots': [_dump(plot) for plot in property.plots.all()],
+            }
+            for property in valuation.properties.all()
+        ],
+        'visiting_team': [_dump(member) for member in valuation.visiting_teams.all()],
+        # Blobs stay in storage; prune_blobs keeps the ones archives refer to
+        'attachments': [_dump(attachment) for attachment in valuation.attachments.all()],
+    }
+
+
+def restore(archived):
+    """
+    Rebuild an archived report as unsaved model instances, shaped like the
+    live valuation_detail context (owner_rows/plot_rows on each property).
+    """
+    payload = archived.payload
+    valuation = _load(Valuation, payload['valuation'])
+    properties = []
+    for entry in payload['properties']:
+        properties.append(_load(
+            Property, entry['property'],
+            owner_rows=[_load(Owner, owner) for owner in entry['owners']],
+            plot_rows=[_load(Plot, plot) for plot in entry['plots']],
+        ))
+    visiting_team = [_load(VisitingTeam, member) for member in payload['visiting_team']]
+    return valuation, properties, visiting_team
+
+
+def restore_attachments(archived):
+    """Attachments of an archived report, with their blobs"""
+    entries = archived.payload.get('attachments', [])
+    blobs = Blob.objects.in_bulk([entry['blob_id'] for entry in entries])
+    return [
+        _load(Attachment, entry, blob=blobs[entry['blob_id']])
+        for entry in entries if entry['blob_id'] in blobs
+    ]
+
+
+def archived_blob_ids():
+    """Blobs attached to archived reports"""
+    blob_ids = set()
+    for attachments in ArchivedValuation.objects.values_list('payload__attachments', flat=True).iterator():
+        blob_ids.update(entry['blob_id'] for entry in attachments or ())
+    return blob_ids
+
+
+def archive_fiscal_year(label, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Move every valuation of a closed fiscal year into the archive tables.
+    Each batch is copied and then deleted from the hot tables in one transaction.
+    """
+    label = normalize_fiscal_year(label)
+    if label >= current_fiscal_year():
+        raise ValueError(f'Fiscal year {label} is not closed yet.')
+    start, end = fiscal_year_bounds(label)
+    valuations = Valuation.objects.filter(val_date__gte=start, val_date__lt=end)
+    if dry_run:
+        return valuations.count()
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(valuations.order_by('pk').prefetch_related(
+                'properties__owners', 'properties__plots', 'visiting_teams', 'attachments',
+            )[:batch_size])
+            if not batch:
+                break
+            archives = ArchivedValuation.objects.bulk_create([
+                ArchivedValuation(
+                    original_id=valuation.pk,
+                    fiscal_year=label,
+                    report_number=valuation.report_number,
+                    val_date=valuation.val_date,
+                    bank_name=valuation.bank_name,
+                    borrower_name=valuation.borrower_name,
+                    payload=snapshot(valuation),
+                )
+                for valuation in batch
+            ])
+            archive_ids = {
+                archive.original_id: archive.pk
+                for archive in ArchivedValuation.objects.filter(
+                    original_id__in=[valuation.pk for valuation in batch]
+                ).only('original_id')
+            }
+            ArchivedPartyIdentity.objects.bulk_create([
+                ArchivedPartyIdentity(
+                    id_type=identity.id_type,
+                    id_number=identity.id_number,
+                    role=identity.role,
+                    name=identity.name,
+                    archived_valuation_id=archive_ids[identity.valuation_id],
+                    property_name=identity.property.name if identity.property else '',
+                )
+                for identity in PartyIdentity.objects.filter(
+                    valuation__in=batch
+                ).select_related('property')
+            ])
+            Valuation.objects.filter(pk__in=archive_ids).delete()
+            archived += len(archives)
+    return archived
@@ -0,0 +1,236 @@
+"""
+Site photos, lalpurja scans and blueprints attached to valuation reports.
+
+Uploads stream through Django's chunked upload handlers; HashingUploadHandler
+hashes each chunk on the way, so a file is never read twice. Content is stored
+once per SHA-256 (Blob) however many reports attach it, and image thumbnails
+are made by the make_thumbnail background job, once per content.
+"""
+import hashlib
+import mimetypes
+import re
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from . import archive
+from .jobs import enqueue
+from .models import Attachment, Blob
+
+MAX_BYTES = getattr(settings, 'REPORT_ATTACHMENT_MAX_BYTES', 25 * 1024 * 1024)
+ALLOWED_TYPES = {
+    'image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/tiff', 'image/heic',
+    'application/pdf',
+}
+# Identify the content from its first bytes, not the client's claim
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'%PDF-', 'application/pdf'),
+]
+THUMBNAIL_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/tiff'}
+SERVE_CHUNK_SIZE = 64 * 1024
+PRUNE_MIN_AGE_HOURS = 24
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class AttachmentError(ValueError):
+    pass
+
+
+def sniff_content_type(head, name=''):
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1'):
+        return 'image/heic'
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Hashes and sizes every uploaded file while it streams to the next handler
+    (memory or temporary file). Install it first, before request.POST is read.
+    Files over MAX_BYTES are skipped rather than buffered.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}   # (field name, file name) -> [(sha256, size, first bytes), ...]
+        self.too_large = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > MAX_BYTES:
+            self.too_large.append(self.file_name)
+            raise SkipFile()
+        self.hasher.update(raw_data)
+        if len(self.head) < 16:
+            self.head += raw_data[:16]
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests.setdefault((self.field_name, self.file_name), []).append(
+            (self.hasher.hexdigest(), self.size, self.head)
+        )
+        # Let the next handler build the UploadedFile
+        return None
+
+    def info(self, field_name, uploaded_file):
+        digests = self.digests.get((field_name, uploaded_file.name))
+        return digests.pop(0) if digests else None
+
+
+def _hash_file(uploaded_file):
+    hasher = hashlib.sha256()
+    size = 0
+    head = b''
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+        size += len(chunk)
+        if len(head) < 16:
+            head += chunk[:16]
+    uploaded_file.seek(0)
+    return hasher.hexdigest(), size, head
+
+
+def _stored_copy_is_intact(name, sha256, size):
+    """Whether the file already at `name` holds exactly this content"""
+    if default_storage.size(name) != size:
+        return False
+    hasher = hashlib.sha256()
+    with default_storage.open(name, 'rb') as handle:
+        for chunk in handle.chunks():
+            hasher.update(chunk)
+    return hasher.hexdigest() == sha256
+
+
+def store(uploaded_file, digest=None):
+    """
+    The Blob for this content, storing the bytes only if they are new.
+    `digest` is (sha256, size, first bytes) from HashingUploadHandler.
+    """
+    sha256, size, head = digest or _hash_file(uploaded_file)
+    if size > MAX_BYTES:
+        raise AttachmentError(f'{uploaded_file.name} is larger than {MAX_BYTES // (1024 * 1024)} MB.')
+    content_type = sniff_content_type(head, uploaded_file.name)
+    if content_type not in ALLOWED_TYPES:
+        raise AttachmentError(f'{uploaded_file.name} is not a photo or PDF.')
+
+    blob = Blob.objects.filter(sha256=sha256).first()
+    if blob is not None:
+        return blob, False
+
+    blob = Blob(sha256=sha256, size=size, content_type=content_type)
+    name = blob.file.field.generate_filename(blob, uploaded_file.name)
+    if default_storage.exists(name):
+        # Left behind by an earlier upload of the same content. Only a
+        # complete copy is reused; a partial one from a crash is replaced.
+        if not _stored_copy_is_intact(name, sha256, size):
+            default_storage.delete(name)
+    blob.file.name = name if default_storage.exists(name) else default_storage.save(name, uploaded_file)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # The same file was uploaded concurrently; keep the other row
+        if blob.file.name != name:
+            default_storage.delete(blob.file.name)
+        return Blob.objects.get(sha256=sha256), False
+    if content_type in THUMBNAIL_TYPES:
+        transaction.on_commit(lambda: enqueue('make_thumbnail', blob_id=blob.pk))
+    return blob, True
+
+
+def attach(valuation, files, handler=None, field_name='files', kind=Attachment.KIND_PHOTO,
+           property=None, plot=None, caption='', user=None):
+    """Attachments for uploaded files; returns (attachments, errors)"""
+    attachments, errors = [], []
+    for uploaded_file in files:
+        digest = handler.info(field_name, uploaded_file) if handler is not None else None
+        try:
+            blob, _ = store(uploaded_file, digest)
+        except AttachmentError as exc:
+            errors.append(str(exc))
+            continue
+        attachments.append(Attachment(
+            valuation=valuation, property=property, plot=plot, blob=blob, kind=kind,
+            original_name=uploaded_file.name[:255], caption=caption,
+            uploaded_by=user if user is not None and user.is_authenticated else None,
+        ))
+    if handler is not None:
+        errors.extend(f'{name} is larger than {MAX_BYTES // (1024 * 1024)} MB.' for name in handler.too_large)
+    Attachment.objects.bulk_create(attachments)
+    return attachments, errors
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range header, or None for the whole file"""
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        raise AttachmentError('Range not satisfiable')
+    return start, end
+
+
+def read_range(file, start, end):
+    """Yield bytes start..end (inclusive) of an open file, then close it"""
+    try:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(SERVE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def orphan_blobs(min_age_hours=PRUNE_MIN_AGE_HOURS):
+    """Blobs no live or archived attachment refers to"""
+    # A blob found by an upload in progress gets its attachment moments later
+    cutoff = timezone.now() - timedelta(hours=min_age_hours)
+    return Blob.objects.filter(attachments__isnull=True, created_at__lt=cutoff).exclude(
+        pk__in=archive.archived_blob_ids()
+    )
+
+
+def prune_blobs(min_age_hours=PRUNE_MIN_AGE_HOURS, dry_run=False):
+    """Delete orphaned blobs with their files; returns (count, bytes)"""
+    count = size = 0
+    for blob in orphan_blobs(min_age_hours).iterator():
+        count += 1
+        size += blob.size
+        if not dry_run:
+            names = [name for name in (blob.file.name, blob.thumbnail.name) if name]
+            blob.delete()
+            for name in names:
+                default_storage.delete(name)
+    return count, size
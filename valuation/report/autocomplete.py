@@ -0,0 +1,145 @@
+import bisect
+import threading
+import time
+from django.db.models import Count
+from . import metrics
+from .models import Valuation, Property
+
+# Autocomplete field -> (model, column)
+FIELDS = {
+    'bank_name': (Valuation, 'bank_name'),
+    'bank_branch': (Valuation, 'bank_branch'),
+    'district': (Property, 'district'),
+    'municipality': (Property, 'municipality'),
+}
+
+# Full rebuilds pick up values written by other worker processes
+REBUILD_SECONDS = 300
+MAX_RESULTS = 10
+
+
+def fold(value):
+    """Grouping key: case-insensitive with collapsed whitespace"""
+    return ' '.join(value.split()).casefold()
+
+
+class PrefixIndex:
+    """Sorted array of distinct values answering prefix queries with bisect"""
+
+    def __init__(self):
+        self.keys = []       # sorted folded keys
+        self.spellings = {}  # folded key -> {spelling: count}
+        self.uses = {}       # folded key -> total count
+        self.built_at = time.monotonic()
+
+    def add(self, value, count=1):
+        value = ' '.join((value or '').split())
+        if not value:
+            return
+        key = fold(value)
+        spellings = self.spellings.get(key)
+        if spellings is None:
+            if count <= 0:
+                return
+            bisect.insort(self.keys, key)
+            spellings = self.spellings[key] = {}
+        spellings[value] = spellings.get(value, 0) + count
+        if spellings[value] <= 0:
+            del spellings[value]
+        self.uses[key] = self.uses.get(key, 0) + count
+        if not spellings:
+            # Last row with this name moved away
+            del self.spellings[key], self.uses[key]
+            self.keys.pop(bisect.bisect_left(self.keys, key))
+
+    def canonical(self, value):
+        """Most used spelling of the same grouping key, or None"""
+        spellings = self.spellings.get(fold(value or ''))
+        if not spellings:
+            return None
+        return max(spellings.items(), key=lambda item: (item[1], item[0]))[0]
+
+    def search(self, prefix, limit=MAX_RESULTS):
+        prefix = fold(prefix or '')
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', lo=start)
+        # Rank by usage so the established spelling comes first
+        matches = sorted(self.keys[start:end], key=lambda key: -self.uses[key])[:limit]
+        return [self.canonical(key) for key in matches]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def build_index(field):
+    model, column = FIELDS[field]
+    index = PrefixIndex()
+    rows = model.objects.order_by().values_list(column).annotate(uses=Count('pk'))
+    for value, uses in rows:
+        index.add(value, uses)
+    return index
+
+
+def get_index(field):
+    """The in-memory index for a field, rebuilt when it gets old"""
+    index = _indexes.get(field)
+    fresh = index is not None and time.monotonic() - index.built_at <= REBUILD_SECONDS
+    metrics.cache_result('autocomplete_index', fresh)
+    if not fresh:
+        with _lock:
+            index = _indexes.get(field)
+            if index is None or time.monotonic() - index.built_at > REBUILD_SECONDS:
+                index = _indexes[field] = build_index(field)
+    return index
+
+
+def record(field, value, previous=None):
+    """Move one use from `previous` to a freshly saved value in an already built index"""
+    index = _indexes.get(field)
+    if index is not None:
+        with _lock:
+            if previous is not None:
+                index.add(previous, -1)
+            index.add(value)
+
+
+def remember_values(instance):
+    """Note the loaded autocomplete columns of a model instance, to spot changes on save"""
+    instance._autocomplete_values = {
+        column: instance.__dict__[column]
+        for model, column in FIELDS.values()
+        if isinstance(instance, model) and column in instance.__dict__
+    }
+
+
+def record_changes(instance, created):
+    """Record the autocomplete columns of a saved instance that are new or changed"""
+    loaded = getattr(instance, '_autocomplete_values', {})
+    for field, (model, column) in FIELDS.items():
+        if not isinstance(instance, model) or column not in instance.__dict__:
+            continue
+        value = instance.__dict__[column]
+        if created:
+            record(field, value)
+        elif loaded.get(column) != value:
+            record(field, value, loaded.get(column))
+    remember_values(instance)
+
+
+def suggest(field, prefix, limit=MAX_RESULTS):
+    return get_index(field).search(prefix, limit)
+
+
+def canonical(field, value):
+    """Snap free text onto the established spelling of the same name"""
+    if not value:
+        return value
+    return get_index(field).canonical(value) or ' '.join(value.split())
+
+
+def reset():
+    with _lock:
+        _indexes.clear()
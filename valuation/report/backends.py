@@ -0,0 +1,60 @@
+"""
+Template and cache backends that feed report.metrics. They behave exactly
+like the Django backends they extend.
+"""
+from django.core.cache.backends import locmem
+from django.template.backends import django as django_backend
+from . import metrics
+
+try:
+    from django.template.backends import jinja2 as jinja2_backend
+except ImportError:
+    jinja2_backend = None
+
+_MISSING = object()
+
+
+class TimedTemplate:
+    """Wraps a backend template to time top-level renders"""
+
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        with metrics.TEMPLATE_RENDER.time(self.origin.template_name):
+            return self.template.render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+if jinja2_backend is not None:
+    class Jinja2(jinja2_backend.Jinja2):
+        def get_template(self, template_name):
+            return TimedTemplate(super().get_template(template_name))
+
+
+def cache_namespace(key):
+    """Metric label for a cache key: the fragment name or the key prefix"""
+    if key.startswith('template.cache.'):
+        return 'fragment.' + key.split('.')[2]
+    return key.split(':', 1)[0]
+
+
+class LocMemCache(locmem.LocMemCache):
+    """Local-memory cache counting hits and misses per key namespace"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        metrics.cache_result(cache_namespace(key), value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        for key in keys:
+            metrics.cache_result(cache_namespace(key), key in found)
+        return found
@@ -0,0 +1,96 @@
+"""
+Duplicate-collateral detection: the same cadastral parcel pledged in more
+than one valuation report, possibly to different banks.
+
+Plot.parcel_key holds the normalized district|municipality|ward|sheet|plot
+and is indexed, so every check below is an index probe or one grouped query.
+"""
+from itertools import groupby
+from operator import itemgetter
+from django.db.models import Count
+from django.utils import timezone
+from .models import Plot, parcel_key
+
+BACKFILL_BATCH_SIZE = 2000
+REKEY_FIELDS = ['parcel_key', 'updated_at']
+
+PLEDGE_FIELDS = (
+    'pk', 'parcel_key', 'plot_number', 'sheet_number', 'fair_market_value',
+    'property__name', 'property__district', 'property__municipality', 'property__ward_no',
+    'property__valuation_id', 'property__valuation__report_number', 'property__valuation__bank_name',
+    'property__valuation__val_date',
+)
+
+
+def other_pledges(plots):
+    """Plots elsewhere with the same parcel as any of `plots` (one indexed query)"""
+    keys = {plot.parcel_key for plot in plots if plot.parcel_key}
+    if not keys:
+        return Plot.objects.none()
+    return Plot.objects.filter(parcel_key__in=keys).exclude(
+        pk__in=[plot.pk for plot in plots]
+    ).select_related('property__valuation').order_by('parcel_key', 'pk')
+
+
+def describe(plot):
+    valuation = plot.property.valuation
+    return f'plot {plot.plot_number} in {valuation.report_number} ({valuation.bank_name})'
+
+
+def refresh_property(property):
+    """Re-key the plots of a property whose district, municipality or ward changed"""
+    changed = []
+    now = timezone.now()
+    for pk, sheet_number, plot_number, current in property.plots.values_list(
+        'pk', 'sheet_number', 'plot_number', 'parcel_key'
+    ):
+        key = parcel_key(property.district, property.municipality, property.ward_no, sheet_number, plot_number)
+        if key != current:
+            changed.append(Plot(pk=pk, parcel_key=key, updated_at=now))
+    # updated_at as well, so delta sync and the snapshot export see the rekey
+    Plot.objects.bulk_update(changed, REKEY_FIELDS)
+    return len(changed)
+
+
+def backfill(batch_size=BACKFILL_BATCH_SIZE):
+    """Set parcel_key on every plot whose stored key is missing or stale"""
+    rows = Plot.objects.order_by('pk').values_list(
+        'pk', 'property__district', 'property__municipality', 'property__ward_no',
+        'sheet_number', 'plot_number', 'parcel_key',
+    )
+    checked = updated = 0
+    batch = []
+    for pk, *parts, current in rows.iterator(chunk_size=batch_size):
+        checked += 1
+        key = parcel_key(*parts)
+        if key != current:
+            batch.append(Plot(pk=pk, parcel_key=key, updated_at=timezone.now()))
+        if len(batch) >= batch_size:
+            updated += Plot.objects.bulk_update(batch, REKEY_FIELDS)
+            batch = []
+    if batch:
+        updated += Plot.objects.bulk_update(batch, REKEY_FIELDS)
+    return checked, updated
+
+
+def duplicate_parcels(across_banks=False):
+    """
+    Every parcel pledged more than once, with its pledges. The grouping runs
+    in the database as a subquery of the single query that loads the pledges.
+    """
+    groups = Plot.objects.exclude(parcel_key='').values('parcel_key').annotate(
+        pledges=Count('pk'),
+        banks=Count('property__valuation__bank_name', distinct=True),
+    ).filter(pledges__gt=1)
+    if across_banks:
+        groups = groups.filter(banks__gt=1)
+    pledges = Plot.objects.filter(parcel_key__in=groups.values('parcel_key')).order_by(
+        'parcel_key', 'property__valuation__val_date', 'pk'
+    ).values(*PLEDGE_FIELDS)
+    for key, rows in groupby(pledges.iterator(), itemgetter('parcel_key')):
+        rows = list(rows)
+        yield {
+            'parcel_key': key,
+            'pledges': rows,
+            'banks': sorted({row['property__valuation__bank_name'] for row in rows}),
+        }
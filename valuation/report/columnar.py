@@ -0,0 +1,255 @@
+"""
+Plot-level analytics snapshot in columnar files, one partition per valuation month.
+
+Every row is one plot joined with its property, valuation and owners. The
+export goes to <directory>/val_month=YYYY-MM/plots.parquet (or .arrow for
+Arrow IPC files, which can be memory-mapped), so pandas, DuckDB or
+pyarrow.dataset read it without touching the live database.
+
+Runs are incremental: _manifest.json records a fingerprint per month (row
+count, id sum and the latest Plot, Property and Valuation updated_at) and only
+months whose fingerprint changed are rewritten. Owner and plot edits bump
+Property.updated_at, and deletions change the count, so both are picked up.
+Rows are read in chunks and written one record batch per chunk. When a read
+replica is configured, export() sends all of these reads to it.
+
+Needs pyarrow (pip install pyarrow).
+"""
+import json
+import os
+from datetime import date
+from itertools import islice
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import Owner, Plot
+from .routers import replica_reads
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+SNAPSHOT_DIR = getattr(settings, 'REPORT_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'snapshots')
+EXPORT_CHUNK_SIZE = 20000
+MANIFEST = '_manifest.json'
+# Bump when COLUMNS change so the next run rewrites every partition
+SCHEMA_VERSION = 1
+FORMATS = ('parquet', 'arrow')
+
+# Output column -> (ORM path from Plot, arrow type name and arguments)
+COLUMNS = {
+    'plot_id': ('pk', ('int64',)),
+    'valuation_id': ('property__valuation_id', ('int64',)),
+    'report_number': ('property__valuation__report_number', ('string',)),
+    'val_date': ('property__valuation__val_date', ('date32',)),
+    'bank_name': ('property__valuation__bank_name', ('string',)),
+    'bank_branch': ('property__valuation__bank_branch', ('string',)),
+    'property_id': ('property_id', ('int64',)),
+    'property_name': ('property__name', ('string',)),
+    'district': ('property__district', ('string',)),
+    'municipality': ('property__municipality', ('string',)),
+    'ward_no': ('property__ward_no', ('int32',)),
+    'land_type': ('property__land_type', ('string',)),
+    'plot_number': ('plot_number', ('string',)),
+    'sheet_number': ('sheet_number', ('string',)),
+    'ropani': ('ropani', ('int32',)),
+    'ana': ('ana', ('int32',)),
+    'paisa': ('paisa', ('int32',)),
+    'dam': ('dam', ('decimal128', 6, 4)),
+    'bigha': ('bigha', ('int32',)),
+    'kattha': ('kattha', ('int32',)),
+    'dhur': ('dhur', ('int32',)),
+    'area_sqft': ('area_sqft', ('decimal128', 15, 2)),
+    'area_sqmt': ('area_sqmt', ('decimal128', 15, 2)),
+    'gov_rate_per_sqft': ('gov_rate_per_sqft', ('decimal128', 10, 2)),
+    'market_rate_per_sqft': ('market_rate_per_sqft', ('decimal128', 10, 2)),
+    'gov_value': ('gov_value', ('decimal128', 15, 2)),
+    'market_value': ('market_value', ('decimal128', 15, 2)),
+    'fair_market_value': ('fair_market_value', ('decimal128', 15, 2)),
+    'latitude': ('latitude', ('decimal128', 9, 6)),
+    'longitude': ('longitude', ('decimal128', 9, 6)),
+    'created_at': ('created_at', ('timestamp', 'us', 'UTC')),
+    'updated_at': ('updated_at', ('timestamp', 'us', 'UTC')),
+}
+# Filled per chunk from one owners query
+OWNER_COLUMNS = {
+    'owner_count': ('int32',),
+    'owner_names': ('string',),
+}
+
+
+class ColumnarError(ValueError):
+    pass
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ColumnarError('The snapshot export needs pyarrow (pip install pyarrow).')
+
+
+def schema():
+    _require_pyarrow()
+    fields = {**{name: arrow for name, (_, arrow) in COLUMNS.items()}, **OWNER_COLUMNS}
+    return pyarrow.schema([
+        (name, getattr(pyarrow, arrow[0])(*arrow[1:])) for name, arrow in fields.items()
+    ])
+
+
+def month_fingerprints():
+    """{'YYYY-MM': fingerprint} for every month with plots, in one grouped query"""
+    months = Plot.objects.annotate(month=TruncMonth('property__valuation__val_date')).order_by().values(
+        'month'
+    ).annotate(
+        rows=Count('pk'),
+        id_sum=Sum('pk'),
+        plot_changed=Max('updated_at'),
+        property_changed=Max('property__updated_at'),
+        valuation_changed=Max('property__valuation__updated_at'),
+    )
+    return {
+        month['month'].strftime('%Y-%m'): [
+            month['rows'], month['id_sum'], month['plot_changed'].isoformat(),
+            month['property_changed'].isoformat(), month['valuation_changed'].isoformat(),
+        ]
+        for month in months
+    }
+
+
+def _month_bounds(label):
+    year, month = map(int, label.split('-'))
+    return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+
+def _batches(label, chunk_size):
+    """Record batches of one month's plots, chunk_size rows at a time"""
+    start, end = _month_bounds(label)
+    paths = [path for path, _ in COLUMNS.values()]
+    rows = Plot.objects.filter(
+        property__valuation__val_date__gte=start, property__valuation__val_date__lt=end,
+    ).order_by('property__valuation__val_date', 'pk').values_list(*paths).iterator(chunk_size=chunk_size)
+    arrow_schema = schema()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        columns = dict(zip(COLUMNS, zip(*chunk)))
+        owners = {}
+        for property_id, name in Owner.objects.filter(
+            property_id__in=set(columns['property_id'])
+        ).order_by('pk').values_list('property_id', 'name'):
+            owners.setdefault(property_id, []).append(name)
+        columns['owner_count'] = [len(owners.get(pk, ())) for pk in columns['property_id']]
+        columns['owner_names'] = ['; '.join(owners.get(pk, ())) for pk in columns['property_id']]
+        yield pyarrow.RecordBatch.from_pydict(
+            {name: list(values) for name, values in columns.items()}, schema=arrow_schema,
+        )
+
+
+def _write_partition(path, batches, file_format):
+    """Write record batches to path atomically; returns the row count"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.partial')
+    arrow_schema = schema()
+    rows = 0
+    if file_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(partial, arrow_schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_file(partial, arrow_schema)
+    try:
+        for batch in batches:
+            # One row group (Parquet) or record batch (Arrow) per chunk
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    os.replace(partial, path)
+    return rows
+
+
+def _remove_partition(directory, entry):
+    path = directory / entry['file']
+    path.unlink(missing_ok=True)
+    try:
+        path.parent.rmdir()
+    except OSError:
+        pass
+
+
+def _read_manifest(directory):
+    try:
+        with open(directory / MANIFEST) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_manifest(directory, manifest):
+    partial = directory / (MANIFEST + '.partial')
+    with open(partial, 'w') as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    os.replace(partial, directory / MANIFEST)
+
+
+@replica_reads()
+def export(directory=SNAPSHOT_DIR, file_format='parquet', chunk_size=EXPORT_CHUNK_SIZE, full=False):
+    """
+    Bring the snapshot in `directory` up to date; returns {'written': [months],
+    'removed': [months], 'unchanged': count, 'rows': rows written}
+    """
+    _require_pyarrow()
+    if file_format not in FORMATS:
+        raise ColumnarError(f'Unknown format {file_format!r}; use parquet or arrow.')
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    manifest = _read_manifest(directory)
+    if full or manifest.get('schema_version') != SCHEMA_VERSION or manifest.get('format') != file_format:
+        for entry in manifest.get('partitions', {}).values():
+            _remove_partition(directory, entry)
+        manifest = {'schema_version': SCHEMA_VERSION, 'format': file_format, 'partitions': {}}
+    partitions = manifest['partitions']
+    current = month_fingerprints()
+
+    result = {'written': [], 'removed': [], 'unchanged': 0, 'rows': 0}
+    for label, fingerprint in sorted(current.items()):
+        entry = partitions.get(label)
+        if entry and entry['fingerprint'] == fingerprint and (directory / entry['file']).exists():
+            result['unchanged'] += 1
+            continue
+        name = f'val_month={label}/plots.{file_format}'
+        rows = _write_partition(directory / name, _batches(label, chunk_size), file_format)
+        partitions[label] = {
+            'file': name, 'rows': rows, 'fingerprint': fingerprint,
+            'exported_at': timezone.now().isoformat(),
+        }
+        # Saved per partition so an interrupted run resumes where it stopped
+        _write_manifest(directory, manifest)
+        result['written'].append(label)
+        result['rows'] += rows
+
+    for label in sorted(set(partitions) - set(current)):
+        _remove_partition(directory, partitions.pop(label))
+        result['removed'].append(label)
+    manifest['exported_at'] = timezone.now().isoformat()
+    _write_manifest(directory, manifest)
+    return result
+
+
+def dataset(directory=SNAPSHOT_DIR):
+    """
+    The exported snapshot as a pyarrow dataset with val_month as a partition
+    column, e.g. dataset().to_table(filter=...).to_pandas()
+    """
+    _require_pyarrow()
+    directory = Path(directory)
+    file_format = _read_manifest(directory).get('format', 'parquet')
+    return pyarrow.dataset.dataset(
+        directory, format='ipc' if file_format == 'arrow' else 'parquet', partitioning='hive',
+        exclude_invalid_files=True,
+    )
@@ -1,6 +1,19 @@
 from django import forms
+from django.urls import reverse_lazy
 from .models import Valuation, Property, Owner, Plot
 from django.forms import inlineformset_factory
+from . import autocomplete
+
+
+def autocomplete_attrs(field, **attrs):
+    """Widget attributes wiring a text input to the autocomplete endpoint"""
+    return {
+        'class': 'form-control',
+        'autocomplete': 'off',
+        'data-autocomplete-url': reverse_lazy('report:autocomplete', kwargs={'field': field}),
+        **attrs,
+    }
+
 
 
 class ValuationForm(forms.ModelForm):
@@ -11,8 +24,8 @@ class ValuationForm(forms.ModelForm):
             'val_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'bank_req_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'report_number': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g., VAL-2025-001'}),
-            'bank_name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Bank Name'}),
-            'bank_branch': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Bank Branch'}),
+            'bank_name': forms.TextInput(attrs=autocomplete_attrs('bank_name', placeholder='Bank Name')),
+            'bank_branch': forms.TextInput(attrs=autocomplete_attrs('bank_branch', placeholder='Bank Branch')),
             'bank_ref_no': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Bank Reference Number'}),
             'bank_address': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Bank Address'}),
             'borrower_name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Borrower Full Name'}),
@@ -29,6 +42,12 @@ class ValuationForm(forms.ModelForm):
                 raise forms.ValidationError("This report number already exists. Please use a unique report number.")
         return report_number
     
+    def clean_bank_name(self):
+        return autocomplete.canonical('bank_name', self.cleaned_data.get('bank_name'))
+    
+    def clean_bank_branch(self):
+        return autocomplete.canonical('bank_branch', self.cleaned_data.get('bank_branch'))
+    
     def clean_borrower_contact(self):
         contact = self.cleaned_data.get('borrower_contact')
         if contact:
@@ -51,8 +70,8 @@ class PropertyForm(forms.ModelForm):
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Property Name'}),
             'address': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Property Address'}),
-            'district': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'District'}),
-            'municipality': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Municipality'}),
+            'district': forms.TextInput(attrs=autocomplete_attrs('district', placeholder='District')),
+            'municipality': forms.TextInput(attrs=autocomplete_attrs('municipality', placeholder='Municipality')),
             'ward_no': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Ward Number'}),
             'land_type': forms.Select(attrs={'class': 'form-control'}),
         }
@@ -63,6 +82,12 @@ class PropertyForm(forms.ModelForm):
         self.fields['name'].required = True
         self.fields['address'].required = True
         self.fields['district'].required = True
+    
+    def clean_district(self):
+        return autocomplete.canonical('district', self.cleaned_data.get('district'))
+    
+    def clean_municipality(self):
+        return autocomplete.canonical('municipality', self.cleaned_data.get('municipality'))
 
         
 class OwnerForm(forms.ModelForm):
@@ -89,7 +114,9 @@ class OwnerForm(forms.ModelForm):
 class PlotForm(forms.ModelForm):
     class Meta:
         model = Plot
-        exclude = ['created_at', 'area_sqft', 'area_sqmt', 'gov_value', 'market_value', 'fair_market_value']
+        # The boundary polygon is drawn on the map / set via admin, never posted by the formset
+        exclude = ['created_at', 'area_sqft', 'area_sqmt', 'gov_value', 'market_value', 'fair_market_value',
+                   'boundary']
         widgets = {
             'plot_number': forms.TextInput(attrs={'class': 'form-control'}),
             'sheet_number': forms.TextInput(attrs={'class': 'form-control'}),
@@ -105,6 +132,8 @@ class PlotForm(forms.ModelForm):
             'south_boundary': forms.TextInput(attrs={'class': 'form-control'}),
             'east_boundary': forms.TextInput(attrs={'class': 'form-control'}),
             'west_boundary': forms.TextInput(attrs={'class': 'form-control'}),
+            'latitude': forms.NumberInput(attrs={'class': 'form-control', 'min': '-90', 'max': '90', 'step': '0.000001'}),
+            'longitude': forms.NumberInput(attrs={'class': 'form-control', 'min': '-180', 'max': '180', 'step': '0.000001'}),
             'remarks': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
         }
     
@@ -136,6 +165,23 @@ class PlotForm(forms.ModelForm):
         return cleaned_data
 
 
+class PlotRowForm(PlotForm):
+    """One plot as a row of the incremental plot editor; validated exactly like PlotForm"""
+    class Meta(PlotForm.Meta):
+        fields = [
+            'plot_number', 'sheet_number', 'ropani', 'ana', 'paisa', 'dam', 'bigha', 'kattha', 'dhur',
+            'gov_rate_per_sqft', 'market_rate_per_sqft',
+        ]
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Inputs sit in table cells and belong to the row's own <form> by id
+        self.form_id = f'plot-row-{self.instance.pk or "new"}'
+        self.auto_id = f'id_{self.form_id}_%s'
+        for field in self.fields.values():
+            field.widget.attrs.update({'class': 'form-control form-control-sm', 'form': self.form_id})
+
+
 OwnerFormSet = inlineformset_factory(
     Property, Owner, form=OwnerForm, 
     extra=1, can_delete=True, fields='__all__'
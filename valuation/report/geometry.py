@@ -0,0 +1,151 @@
+"""
+Plain-Python plane geometry for plot boundaries.
+
+Boundaries are GeoJSON Polygon geometries in WGS84 (lng, lat). Plots are small,
+so exact tests work in a local equirectangular projection in metres, which is
+well under a centimetre off at parcel scale.
+"""
+import math
+from django.core.exceptions import ValidationError
+
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE_LAT = 111320.0
+# Coordinates closer than this (in metres) are treated as the same point,
+# so neighbouring parcels sharing a boundary do not count as overlapping
+TOLERANCE_M = 0.05
+
+
+def parse_polygon(geometry):
+    """
+    Validate a GeoJSON Polygon (or a Feature wrapping one) and return its
+    outer ring as a closed list of (lng, lat) floats.
+    """
+    if isinstance(geometry, dict) and geometry.get('type') == 'Feature':
+        geometry = geometry.get('geometry')
+    if not isinstance(geometry, dict) or geometry.get('type') != 'Polygon':
+        raise ValidationError('Boundary must be a GeoJSON Polygon.')
+    try:
+        ring = [(float(lng), float(lat)) for lng, lat, *_ in geometry['coordinates'][0]]
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise ValidationError('Boundary coordinates must be [longitude, latitude] pairs.') from None
+    if ring and ring[0] != ring[-1]:
+        ring.append(ring[0])
+    if len(ring) < 4:
+        raise ValidationError('Boundary needs at least three distinct corners.')
+    for lng, lat in ring:
+        if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+            raise ValidationError('Boundary coordinates are out of range.')
+    return ring
+
+
+def to_geojson(ring):
+    return {'type': 'Polygon', 'coordinates': [[list(point) for point in ring]]}
+
+
+def ring_bounds(ring):
+    """(min_lng, min_lat, max_lng, max_lat) of a ring"""
+    lngs = [lng for lng, _ in ring]
+    lats = [lat for _, lat in ring]
+    return min(lngs), min(lats), max(lngs), max(lats)
+
+
+def radius_bounds(lat, lng, metres):
+    """Bounding box (min_lng, min_lat, max_lng, max_lat) of a circle"""
+    dlat = metres / METRES_PER_DEGREE_LAT
+    dlng = metres / (METRES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return lng - dlng, lat - dlat, lng + dlng, lat + dlat
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class Projection:
+    """Local tangent-plane projection (metres) around a reference latitude"""
+
+    def __init__(self, lat):
+        self.x_scale = METRES_PER_DEGREE_LAT * math.cos(math.radians(lat))
+
+    def point(self, lng, lat):
+        return lng * self.x_scale, lat * METRES_PER_DEGREE_LAT
+
+    def ring(self, ring):
+        return [self.point(lng, lat) for lng, lat in ring]
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _segment_distance(p, a, b):
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+def _edges(ring):
+    return zip(ring, ring[1:])
+
+
+def boundary_distance(p, ring):
+    return min(_segment_distance(p, a, b) for a, b in _edges(ring))
+
+
+def contains(ring, p):
+    """Even-odd point-in-polygon test on a projected ring"""
+    inside = False
+    for (x1, y1), (x2, y2) in _edges(ring):
+        if (y1 > p[1]) != (y2 > p[1]):
+            if p[0] < x1 + (p[1] - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+    return inside
+
+
+def strictly_inside(ring, p):
+    return contains(ring, p) and boundary_distance(p, ring) > TOLERANCE_M
+
+
+def distance_to_ring(p, ring):
+    """Metres from a projected point to a projected polygon (0 when inside)"""
+    return 0.0 if contains(ring, p) else boundary_distance(p, ring)
+
+
+def _crosses(a, b, c, d):
+    """Segments ab and cd cross at a single interior point"""
+    d1, d2 = _cross(c, d, a), _cross(c, d, b)
+    d3, d4 = _cross(a, b, c), _cross(a, b, d)
+    eps = TOLERANCE_M * max(math.dist(a, b), math.dist(c, d), 1.0)
+    return ((d1 > eps and d2 < -eps) or (d1 < -eps and d2 > eps)) and \
+        ((d3 > eps and d4 < -eps) or (d3 < -eps and d4 > eps))
+
+
+def _probe_points(ring):
+    """Vertices, edge midpoints and the vertex centroid of a ring"""
+    points = ring[:-1] + [((a[0] + b[0]) / 2, (a[1] + b[1]) / 2) for a, b in _edges(ring)]
+    n = len(ring) - 1
+    points.append((sum(x for x, _ in ring[:-1]) / n, sum(y for _, y in ring[:-1]) / n))
+    return points
+
+
+def rings_overlap(a, b):
+    """
+    Whether two projected rings share interior area. Touching along an edge
+    or at a corner is not an overlap.
+    """
+    for p1, p2 in _edges(a):
+        for q1, q2 in _edges(b):
+            if _crosses(p1, p2, q1, q2):
+                return True
+    if any(strictly_inside(b, p) for p in _probe_points(a)):
+        return True
+    if any(strictly_inside(a, p) for p in _probe_points(b)):
+        return True
+    # Identical outlines: every probe lies on the other boundary
+    probe = _probe_points(a)[-1]
+    return contains(a, probe) and contains(b, probe) and boundary_distance(probe, a) > TOLERANCE_M
@@ -0,0 +1,132 @@
+from django.db import transaction
+from django.db.models import DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import (
+    ArchivedPartyIdentity, Owner, PartyIdentity, Plot, Valuation, normalize_identity_number,
+)
+
+BATCH_SIZE = 500
+
+
+def _identity_rows(role, name, valuation_id, citizenship, pan, property_id=None, owner_id=None):
+    """Build the index rows for one person on one report"""
+    rows = []
+    for id_type, raw in ((PartyIdentity.ID_CITIZENSHIP, citizenship), (PartyIdentity.ID_PAN, pan)):
+        id_number = normalize_identity_number(raw)
+        if id_number:
+            rows.append(PartyIdentity(
+                id_type=id_type,
+                id_number=id_number,
+                role=role,
+                name=name,
+                valuation_id=valuation_id,
+                property_id=property_id,
+                owner_id=owner_id,
+            ))
+    return rows
+
+
+def owner_identity_rows(owner):
+    return _identity_rows(
+        PartyIdentity.ROLE_OWNER, owner.name, owner.property.valuation_id,
+        owner.citizenship_number, owner.pan_number,
+        property_id=owner.property_id, owner_id=owner.pk,
+    )
+
+
+def borrower_identity_rows(valuation):
+    return _identity_rows(
+        PartyIdentity.ROLE_BORROWER, valuation.borrower_name, valuation.pk,
+        valuation.borrower_citizenship, valuation.borrower_pan,
+    )
+
+
+@transaction.atomic
+def sync_owner(owner):
+    """Replace the index rows of a single owner"""
+    PartyIdentity.objects.filter(owner=owner).delete()
+    PartyIdentity.objects.bulk_create(owner_identity_rows(owner))
+
+
+@transaction.atomic
+def sync_borrower(valuation):
+    """Replace the borrower index rows of a single valuation"""
+    PartyIdentity.objects.filter(valuation=valuation, role=PartyIdentity.ROLE_BORROWER).delete()
+    PartyIdentity.objects.bulk_create(borrower_identity_rows(valuation))
+
+
+def sync_property(property):
+    """Keep the denormalized valuation in step when a property moves reports"""
+    PartyIdentity.objects.filter(property=property).exclude(
+        valuation_id=property.valuation_id
+    ).update(valuation_id=property.valuation_id)
+
+
+@transaction.atomic
+def rebuild_index():
+    """Rebuild the whole party index from owners and valuations"""
+    PartyIdentity.objects.all().delete()
+    created = 0
+    batch = []
+
+    owners = Owner.objects.select_related('property').only(
+        'name', 'citizenship_number', 'pan_number', 'property__valuation'
+    )
+    for owner in owners.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(owner_identity_rows(owner))
+        if len(batch) >= BATCH_SIZE:
+            created += len(PartyIdentity.objects.bulk_create(batch))
+            batch = []
+
+    valuations = Valuation.objects.only('borrower_name', 'borrower_citizenship', 'borrower_pan')
+    for valuation in valuations.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(borrower_identity_rows(valuation))
+        if len(batch) >= BATCH_SIZE:
+            created += len(PartyIdentity.objects.bulk_create(batch))
+            batch = []
+
+    if batch:
+        created += len(PartyIdentity.objects.bulk_create(batch))
+    return created
+
+
+def _identity_condition(citizenship, pan):
+    condition = Q()
+    for id_type, raw in ((PartyIdentity.ID_CITIZENSHIP, citizenship), (PartyIdentity.ID_PAN, pan)):
+        id_number = normalize_identity_number(raw)
+        if id_number:
+            condition |= Q(id_type=id_type, id_number=id_number)
+    return condition
+
+
+def exposure(citizenship=None, pan=None):
+    """
+    Every report a citizenship/PAN holder appears on, with pledged values.
+    Runs as one query against the (id_type, id_number) index.
+    """
+    condition = _identity_condition(citizenship, pan)
+    if not condition:
+        return PartyIdentity.objects.none()
+
+    zero = Value(0, output_field=DecimalField(max_digits=15, decimal_places=2))
+    property_value = Plot.objects.filter(property=OuterRef('property')).values('property').annotate(
+        total=Sum('fair_market_value')
+    ).values('total')
+    valuation_value = Plot.objects.filter(property__valuation=OuterRef('valuation')).values(
+        'property__valuation'
+    ).annotate(total=Sum('fair_market_value')).values('total')
+
+    return PartyIdentity.objects.filter(condition).select_related('valuation', 'property').annotate(
+        property_value=Coalesce(Subquery(property_value), zero),
+        valuation_value=Coalesce(Subquery(valuation_value), zero),
+    ).order_by('-valuation__val_date', 'valuation_id', 'role')
+
+
+def archived_exposure(citizenship=None, pan=None):
+    """Archived reports a citizenship/PAN holder appeared on"""
+    condition = _identity_condition(citizenship, pan)
+    if not condition:
+        return ArchivedPartyIdentity.objects.none()
+    return ArchivedPartyIdentity.objects.filter(condition).select_related(
+        'archived_valuation'
+    ).defer('archived_valuation__payload').order_by('-archived_valuation__val_date', 'role')
@@ -0,0 +1,25 @@
+from django.contrib.messages import get_messages
+from django.template.defaultfilters import floatformat, truncatewords
+from django.templatetags.static import static
+from django.urls import reverse
+from jinja2 import Environment
+
+
+def url(name, *args, **kwargs):
+    """Jinja2 counterpart of the {% url %} tag"""
+    return reverse(name, args=args or None, kwargs=kwargs or None)
+
+
+def environment(**options):
+    """Jinja2 environment for the report list pages"""
+    env = Environment(**options)
+    env.globals.update({
+        'static': static,
+        'url': url,
+        'get_messages': get_messages,
+    })
+    env.filters.update({
+        'floatformat': floatformat,
+        'truncatewords': truncatewords,
+    })
+    return env
@@ -0,0 +1,116 @@
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+from django.db import router
+from django.db.models import F
+from django.utils import timezone
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# name -> callable(job, **payload)
+REGISTRY = {}
+
+# Seconds before retry n (capped at the last entry)
+RETRY_DELAYS = [10, 60, 300, 900]
+
+
+def task(name):
+    """Register a function as a background task under `name`"""
+    def decorator(func):
+        REGISTRY[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, user=None, max_attempts=3, **payload):
+    """Queue a registered task and return its Job immediately"""
+    if name not in REGISTRY:
+        raise KeyError(f'Unknown background task: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next(worker=None):
+    """
+    Atomically take the oldest runnable job, or return None.
+    The conditional UPDATE means two workers can never claim the same row.
+    Candidates are read from the database the claim writes to, never a replica.
+    """
+    worker = worker or worker_name()
+    now = timezone.now()
+    queue = Job.objects.using(router.db_for_write(Job))
+    candidates = queue.filter(
+        status=Job.STATUS_PENDING, run_after__lte=now
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:10]
+
+    for pk in candidates:
+        claimed = queue.filter(pk=pk, status=Job.STATUS_PENDING).update(
+            status=Job.STATUS_RUNNING,
+            worker=worker,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return queue.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Execute a claimed job and record success, retry or failure"""
+    func = REGISTRY.get(job.name)
+    try:
+        if func is None:
+            raise KeyError(f'Unknown background task: {job.name}')
+        result = func(job, **job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.name, job.attempts)
+        if func is not None and job.attempts < job.max_attempts:
+            delay = RETRY_DELAYS[min(job.attempts, len(RETRY_DELAYS)) - 1]
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_PENDING,
+                run_after=timezone.now() + timedelta(seconds=delay),
+                error=error,
+            )
+            metrics.JOBS.inc(job.name, 'retried')
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_FAILED,
+                finished_at=timezone.now(),
+                error=error,
+            )
+            metrics.JOBS.inc(job.name, 'failed')
+        return False
+
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.STATUS_SUCCEEDED,
+        finished_at=timezone.now(),
+        result=result,
+        error='',
+    )
+    metrics.JOBS.inc(job.name, 'succeeded')
+    return True
+
+
+def requeue_stale(timeout):
+    """Return jobs left running by a crashed worker to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, started_at__lt=cutoff)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED,
+        finished_at=timezone.now(),
+        error='Worker stopped before the job finished.',
+    )
+    return stale.update(status=Job.STATUS_PENDING, run_after=timezone.now())
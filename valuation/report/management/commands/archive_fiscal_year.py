@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from report.archive import archive_fiscal_year, current_fiscal_year, normalize_fiscal_year
+
+
+class Command(BaseCommand):
+    help = 'Move all valuations of a closed fiscal year (e.g. 2080/81) into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fiscal_year', help='Fiscal year label, e.g. 2080/81')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the valuations that would be archived')
+
+    def handle(self, *args, **options):
+        try:
+            label = normalize_fiscal_year(options['fiscal_year'])
+            count = archive_fiscal_year(label, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        except ValueError as exc:
+            raise CommandError(f'{exc} (current fiscal year is {current_fiscal_year()})')
+
+        if options['dry_run']:
+            self.stdout.write(f"{count} valuations would be archived from {label}.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} valuations from {label}."))
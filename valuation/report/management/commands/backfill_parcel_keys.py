@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from report.collateral import BACKFILL_BATCH_SIZE, backfill
+
+
+class Command(BaseCommand):
+    help = 'Compute the duplicate-collateral parcel key of every plot (run once after migrating)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        checked, updated = backfill(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} plots, updated {updated} parcel keys.'))
@@ -0,0 +1,89 @@
+import multiprocessing
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count, Sum
+from report.models import Valuation, Property, Plot
+from report.routers import replica_alias, replica_reads, use_primary
+
+
+def _reader(mode, stop, counter):
+    """Reader process: replay the report query until told to stop"""
+    with use_primary(mode == 'primary'), replica_reads(mode == 'replica'):
+        while not stop.is_set():
+            report_query()
+            with counter.get_lock():
+                counter.value += 1
+    connections.close_all()
+
+
+def report_query():
+    """The property_list annotation query, the heaviest read we serve"""
+    return list(Property.objects.select_related('valuation').annotate(
+        owner_count=Count('owners'),
+        plot_count=Count('plots'),
+        total_value_sum=Sum('plots__fair_market_value'),
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure plot write latency while concurrent reader processes hit the '
+        'primary or the replica. Writes scratch rows to the primary and removes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', default='0,2,4,8',
+                            help='Comma separated reader process counts to step through')
+        parser.add_argument('--writes', type=int, default=50,
+                            help='Plot saves timed at each reader level')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['readers'].split(',')]
+        modes = ['primary'] + (['replica'] if replica_alias() else [])
+        if len(modes) == 1:
+            self.stdout.write(self.style.WARNING(
+                'No replica configured (REPORT_REPLICA_DB); benchmarking the primary only.'
+            ))
+
+        valuation = Valuation.objects.create(bank_name='Benchmark', borrower_name='Benchmark')
+        property = Property.objects.create(valuation=valuation, name='Benchmark', address='-', district='-')
+        try:
+            self.stdout.write(f"{'route':<8} {'readers':>7} {'reads/s':>9} {'write p50':>10} {'write p95':>10}")
+            for mode in modes:
+                for level in levels:
+                    reads, latencies = self._run_level(mode, level, property, options['writes'])
+                    p50 = statistics.median(latencies) * 1000
+                    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else p50
+                    self.stdout.write(f'{mode:<8} {level:>7} {reads:>9.1f} {p50:>8.2f}ms {p95:>8.2f}ms')
+        finally:
+            valuation.delete()
+
+    def _run_level(self, mode, level, property, writes):
+        # Readers run in separate processes so they contend for the database,
+        # not for this process's GIL.
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        counter = context.Value('i', 0)
+        # Never hand an open connection across fork
+        connections.close_all()
+        workers = [context.Process(target=_reader, args=(mode, stop, counter), daemon=True)
+                   for _ in range(level)]
+        for worker in workers:
+            worker.start()
+
+        latencies = []
+        started = time.perf_counter()
+        for number in range(writes):
+            begin = time.perf_counter()
+            Plot.objects.create(property=property, plot_number=f'B{number}', ropani=1,
+                                gov_rate_per_sqft=100, market_rate_per_sqft=200)
+            latencies.append(time.perf_counter() - begin)
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        for worker in workers:
+            worker.join()
+        Plot.objects.filter(property=property).delete()
+        return counter.value / elapsed, latencies
@@ -0,0 +1,40 @@
+import csv
+from django.core.management.base import BaseCommand
+from report.collateral import duplicate_parcels
+
+
+class Command(BaseCommand):
+    help = 'List every parcel pledged in more than one valuation report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--across-banks', action='store_true',
+                            help='Only parcels pledged to more than one bank')
+        parser.add_argument('--csv', dest='output', help='Write one row per pledge to this CSV file')
+
+    def handle(self, *args, **options):
+        parcels = list(duplicate_parcels(across_banks=options['across_banks']))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as handle:
+                writer = csv.writer(handle)
+                writer.writerow(['parcel_key', 'report_number', 'bank_name', 'val_date', 'property',
+                                 'plot_number', 'sheet_number', 'fair_market_value'])
+                for parcel in parcels:
+                    for row in parcel['pledges']:
+                        writer.writerow([
+                            parcel['parcel_key'], row['property__valuation__report_number'],
+                            row['property__valuation__bank_name'], row['property__valuation__val_date'],
+                            row['property__name'], row['plot_number'], row['sheet_number'],
+                            row['fair_market_value'],
+                        ])
+
+        for parcel in parcels:
+            self.stdout.write(f"{parcel['parcel_key']}  ({len(parcel['pledges'])} pledges, "
+                              f"{len(parcel['banks'])} banks)")
+            for row in parcel['pledges']:
+                self.stdout.write(
+                    f"    {row['property__valuation__report_number'][:20]:<20} "
+                    f"{row['property__valuation__bank_name'][:30]:<30} {row['property__valuation__val_date']} "
+                    f"Rs. {row['fair_market_value']:,.2f}"
+                )
+        self.stdout.write(self.style.SUCCESS(f'{len(parcels)} parcels pledged more than once.'))
@@ -0,0 +1,252 @@
+import http.client
+import json
+import math
+import random
+import re
+import statistics
+import threading
+import time
+import uuid
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+DISTRICTS = ['Kathmandu', 'Lalitpur', 'Bhaktapur', 'Kaski', 'Chitwan', 'Morang', 'Rupandehi']
+BANKS = ['Nabil Bank', 'NIC Asia Bank', 'Global IME Bank', 'Nepal Investment Bank', 'Himalayan Bank']
+
+
+class Recorder:
+    """Thread-safe store of (endpoint, latency, ok) samples"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, latency, ok):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency, ok))
+
+
+class ValuerSession:
+    """One simulated valuer: a keep-alive connection plus its own cookies"""
+
+    def __init__(self, base_url, recorder, timeout):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, endpoint, method, path, data=None, expect=(200,)):
+        body = urlencode(data, doseq=True) if data is not None else None
+        headers = {'Host': f'{self.host}:{self.port}'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{key}={value}' for key, value in self.cookies.items())
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        endpoint = f'{endpoint} {method}'
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read().decode('utf-8', 'replace')
+        except (OSError, http.client.HTTPException):
+            self.recorder.add(endpoint, time.perf_counter() - started, False)
+            self.close()
+            return None, None, ''
+        self.recorder.add(endpoint, time.perf_counter() - started, response.status in expect)
+
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for key, morsel in SimpleCookie(header).items():
+                self.cookies[key] = morsel.value
+        return response.status, response.getheader('Location'), content
+
+    def csrf_token(self, content):
+        match = CSRF_INPUT.search(content or '')
+        return match.group(1) if match else self.cookies.get('csrftoken', '')
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def location_pk(location, pattern):
+    match = re.search(pattern, location or '')
+    return int(match.group(1)) if match else None
+
+
+def run_session(session, run_id, plots):
+    """Create a report, add a property, post its formsets, then browse"""
+    _, _, page = session.request('valuation_create', 'GET', '/reports/create/')
+    _, location, _ = session.request('valuation_create', 'POST', '/reports/create/', {
+        'csrfmiddlewaretoken': session.csrf_token(page),
+        'report_number': f'LT-{run_id}-{uuid.uuid4().hex[:10]}',
+        'val_date': time.strftime('%Y-%m-%d'),
+        'bank_name': random.choice(BANKS),
+        'bank_branch': 'Main Branch',
+        'borrower_name': 'Load Test Borrower',
+        'borrower_contact': '98' + ''.join(random.choices('0123456789', k=8)),
+    }, expect=(302,))
+    valuation_pk = location_pk(location, r'/reports/(\d+)/')
+    if valuation_pk is None:
+        return
+
+    add_path = f'/properties/add/{valuation_pk}/'
+    _, _, page = session.request('property_add', 'GET', add_path)
+    _, location, _ = session.request('property_add', 'POST', add_path, {
+        'csrfmiddlewaretoken': session.csrf_token(page),
+        'name': 'Load Test Land',
+        'address': 'Ward office road',
+        'district': random.choice(DISTRICTS),
+        'municipality': 'Test Municipality',
+        'ward_no': random.randint(1, 32),
+        'land_type': 'residential',
+    }, expect=(302,))
+    property_pk = location_pk(location, r'/properties/(\d+)/edit/')
+    if property_pk is None:
+        return
+
+    edit_path = f'/properties/{property_pk}/edit/'
+    _, _, page = session.request('property_edit', 'GET', edit_path)
+    data = {
+        'csrfmiddlewaretoken': session.csrf_token(page),
+        'owners-TOTAL_FORMS': 1, 'owners-INITIAL_FORMS': 0,
+        'owners-MIN_NUM_FORMS': 0, 'owners-MAX_NUM_FORMS': 1000,
+        'owners-0-name': 'Load Test Owner',
+        'owners-0-citizenship_number': f'{random.randint(10, 99)}-01-{random.randint(10000, 99999)}',
+        'plots-TOTAL_FORMS': plots, 'plots-INITIAL_FORMS': 0,
+        'plots-MIN_NUM_FORMS': 0, 'plots-MAX_NUM_FORMS': 1000,
+    }
+    for index in range(plots):
+        data.update({
+            f'plots-{index}-plot_number': str(100 + index),
+            f'plots-{index}-sheet_number': str(random.randint(1, 50)),
+            f'plots-{index}-ropani': random.randint(0, 4),
+            f'plots-{index}-ana': random.randint(0, 15),
+            f'plots-{index}-paisa': random.randint(0, 3),
+            f'plots-{index}-dam': random.randint(0, 3),
+            f'plots-{index}-bigha': 0, f'plots-{index}-kattha': 0, f'plots-{index}-dhur': 0,
+            f'plots-{index}-gov_rate_per_sqft': random.randint(500, 3000),
+            f'plots-{index}-market_rate_per_sqft': random.randint(3000, 15000),
+        })
+    session.request('property_edit', 'POST', edit_path, data, expect=(302,))
+
+    for endpoint, path in (
+        ('valuation_detail', f'/reports/{valuation_pk}/'),
+        ('dashboard', '/'),
+        ('valuation_list', '/reports/'),
+        ('property_list', '/properties/'),
+        ('plot_list', '/plots/'),
+        ('owner_list', '/owners/'),
+    ):
+        session.request(endpoint, 'GET', path)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))
+    return values[rank]
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay realistic valuer sessions against a running server '
+        '(runserver, gunicorn or uvicorn) and report per-endpoint latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=10,
+                            help='Concurrent simulated valuers')
+        parser.add_argument('--duration', type=float, default=60,
+                            help='Seconds to keep starting new sessions')
+        parser.add_argument('--plots', type=int, default=5,
+                            help='Plots posted per property formset')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', default='loadtest-results.json',
+                            help='Where to write the JSON results')
+
+    def handle(self, *args, **options):
+        if urlsplit(options['base_url']).scheme != 'http':
+            raise CommandError('Only plain http:// targets are supported.')
+
+        recorder = Recorder()
+        run_id = uuid.uuid4().hex[:6]
+        deadline = time.monotonic() + options['duration']
+        sessions_done = [0]
+        lock = threading.Lock()
+
+        def valuer():
+            session = ValuerSession(options['base_url'], recorder, options['timeout'])
+            try:
+                while time.monotonic() < deadline:
+                    run_session(session, run_id, options['plots'])
+                    with lock:
+                        sessions_done[0] += 1
+            finally:
+                session.close()
+
+        self.stdout.write(
+            f"Running {options['concurrency']} valuers against {options['base_url']} "
+            f"for {options['duration']:.0f}s..."
+        )
+        started = time.perf_counter()
+        threads = [threading.Thread(target=valuer, daemon=True) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        results = self.summarize(recorder, elapsed)
+        results.update({
+            'base_url': options['base_url'],
+            'concurrency': options['concurrency'],
+            'duration': elapsed,
+            'sessions': sessions_done[0],
+            'plots_per_property': options['plots'],
+        })
+        with open(options['output'], 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+        self.stdout.write(
+            f"{'endpoint':<24} {'requests':>8} {'req/s':>8} {'errors':>7} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        )
+        for endpoint, stats in results['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<24} {stats['requests']:>8} {stats['throughput']:>8.1f} "
+                f"{stats['error_rate']:>6.1%} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+                f"{stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{results['sessions']} sessions in {elapsed:.1f}s; results written to {options['output']}"
+        ))
+
+    def summarize(self, recorder, elapsed):
+        endpoints = {}
+        for endpoint, samples in sorted(recorder.samples.items()):
+            latencies = sorted(latency * 1000 for latency, _ in samples)
+            errors = sum(1 for _, ok in samples if not ok)
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': errors,
+                'error_rate': errors / len(samples),
+                'throughput': len(samples) / elapsed,
+                'mean_ms': statistics.fmean(latencies),
+                'p50_ms': percentile(latencies, 0.50),
+                'p90_ms': percentile(latencies, 0.90),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+                'max_ms': latencies[-1],
+            }
+        return {'endpoints': endpoints}
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from report.attachments import PRUNE_MIN_AGE_HOURS, prune_blobs
+
+
+class Command(BaseCommand):
+    help = 'Delete stored attachment files that no live or archived report refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-hours', type=int, default=PRUNE_MIN_AGE_HOURS)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        count, size = prune_blobs(options['min_age_hours'], options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {count} blobs ({size / (1024 * 1024):.1f} MB).'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from report.sync import TOMBSTONE_DAYS, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete sync tombstones older than REPORT_SYNC_TOMBSTONE_DAYS (devices that old resync fully)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=TOMBSTONE_DAYS)
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones.'))
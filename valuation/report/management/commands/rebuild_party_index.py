@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from report.identity import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the citizenship/PAN party index from owners and borrowers'
+
+    def handle(self, *args, **options):
+        created = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {created} party identities.'))
@@ -0,0 +1,28 @@
+import sqlite3
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from report.routers import replica_alias
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the local read replica file'
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError('No read replica configured; set REPORT_REPLICA_DB first.')
+
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replica = connections[alias].settings_dict
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('refresh_replica only copies SQLite files; use database replication for other engines.')
+
+        connections[alias].close()
+        source = sqlite3.connect(str(primary['NAME']))
+        target = sqlite3.connect(str(replica['NAME']))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary['NAME']} to {replica['NAME']}."))
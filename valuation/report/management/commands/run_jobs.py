@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import time
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from report import jobs
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between retries while the database keeps failing
+MAX_BACKOFF_SECONDS = 60
+# How often each worker returns jobs stranded by a crashed worker to the queue
+REQUEUE_INTERVAL_SECONDS = 60
+
+
+def work(poll_interval, burst, stale_after):
+    """Worker loop: claim and run jobs until the queue is empty (burst) or forever"""
+    name = jobs.worker_name()
+    backoff = 0
+    next_requeue = time.monotonic() + REQUEUE_INTERVAL_SECONDS
+    try:
+        while True:
+            try:
+                if time.monotonic() >= next_requeue:
+                    jobs.requeue_stale(stale_after)
+                    next_requeue = time.monotonic() + REQUEUE_INTERVAL_SECONDS
+                job = jobs.claim_next(name)
+                if job is not None:
+                    jobs.run_job(job)
+            except DatabaseError:
+                # e.g. "database is locked"; a job whose result could not be
+                # recorded stays running until requeue_stale picks it up
+                backoff = min(max(backoff * 2, poll_interval, 1), MAX_BACKOFF_SECONDS)
+                logger.exception('Job worker %s hit a database error; retrying in %.0fs', name, backoff)
+                connections.close_all()
+                time.sleep(backoff)
+                continue
+            backoff = 0
+            if job is None:
+                if burst:
+                    return
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=3600,
+                            help='Requeue jobs left running longer than this many seconds '
+                                 '(checked at start and every minute)')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs.'))
+
+        processes = max(1, options['processes'])
+        self.stdout.write(f'Starting {processes} job worker(s).')
+        if processes == 1:
+            work(options['poll'], options['burst'], options['stale_after'])
+            return
+
+        # Never hand an open connection across fork
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=work, args=(options['poll'], options['burst'], options['stale_after']))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,59 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from report import scenarios
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate a rate shock on every plot without saving anything, e.g. '
+        '--rule district=Kathmandu,market_pct=-20 --rule land_type=agricultural,gov_pct=10'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rule', action='append', default=[],
+                            help='district/land_type/municipality matches plus market_pct/gov_pct shocks')
+        parser.add_argument('--file', help='JSON file with a list of rules')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Valuations to list, largest loss first')
+        parser.add_argument('--python', action='store_true',
+                            help='Use the pure-Python engine even when numpy is installed')
+        parser.add_argument('--json', dest='output', help='Write the full result to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            rules = [scenarios.parse_rule_string(rule) for rule in options['rule']]
+            if options['file']:
+                with open(options['file']) as handle:
+                    loaded = json.load(handle)
+                if not isinstance(loaded, list):
+                    raise CommandError(f"{options['file']} must contain a JSON list of rules.")
+                rules += loaded
+            result = scenarios.run(rules, use_numpy=not options['python'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(result, handle, indent=2)
+
+        self.stdout.write(
+            f"{result['plots']} plots, {result['affected_plots']} affected "
+            f"({result['engine']} engine, {result['seconds']:.2f}s)"
+        )
+        self.stdout.write(
+            f"Portfolio: Rs. {result['baseline']:,.2f} -> Rs. {result['shocked']:,.2f} "
+            f"({result['change_pct']:+.2f}%)"
+        )
+        self.stdout.write(f"\n{'bank':<30} {'plots':>8} {'baseline':>18} {'shocked':>18} {'change':>8}")
+        for bank in result['banks']:
+            self.stdout.write(
+                f"{bank['bank_name'][:30]:<30} {bank['plots']:>8} {bank['baseline']:>18,.2f} "
+                f"{bank['shocked']:>18,.2f} {bank['change_pct']:>+7.2f}%"
+            )
+        if options['top']:
+            self.stdout.write(f"\n{'report':<20} {'bank':<30} {'baseline':>18} {'change':>18}")
+            for valuation in result['valuations'][:options['top']]:
+                self.stdout.write(
+                    f"{valuation['report_number'][:20]:<20} {valuation['bank_name'][:30]:<30} "
+                    f"{valuation['baseline']:>18,.2f} {valuation['change']:>+18,.2f}"
+                )
@@ -0,0 +1,89 @@
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from report import scheduling
+
+
+class Command(BaseCommand):
+    help = 'Plan site visits for valuations without a visiting team and assign the crews in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--crew', action='append', required=True,
+                            help='Comma-separated members travelling together: usernames, or '
+                                 '"Name:Designation" for members without a login. Repeat per crew.')
+        parser.add_argument('--start', type=date.fromisoformat,
+                            help='First visit day, YYYY-MM-DD (default: today)')
+        parser.add_argument('--days', type=int, default=5, help='Working days to plan')
+        parser.add_argument('--capacity', type=int, default=scheduling.DEFAULT_CAPACITY,
+                            help='Most site visits per crew per day')
+        parser.add_argument('--designation', default='Valuer',
+                            help='Designation of members given by username')
+        parser.add_argument('--district', help='Only valuations in this district')
+        parser.add_argument('--bank', help='Only valuations for this bank')
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help=f'Only valuations dated from YYYY-MM-DD on '
+                                 f'(default: the last {scheduling.PENDING_DAYS} days)')
+        parser.add_argument('--dry-run', action='store_true', help='Print the plan without assigning anyone')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['capacity'] < 1:
+            raise CommandError('--days and --capacity must be at least 1.')
+        crews = self.parse_crews(options['crew'], options['designation'])
+
+        visits = scheduling.pending_visits(
+            district=options['district'], bank_name=options['bank'], since=options['since'],
+        )
+        routes, unscheduled = scheduling.plan(
+            visits, crews, options['start'] or date.today(), options['days'], options['capacity'],
+        )
+
+        for route in sorted(routes, key=lambda route: (route['crew'], route['date'])):
+            crew = ', '.join(member.member_name for member in crews[route['crew']])
+            self.stdout.write(
+                f"{route['date']}  {crew[:40]:<40} {route['district'][:15]:<15} "
+                f"{len(route['visits']):>2} stops  {route['distance_m'] / 1000:6.1f} km"
+            )
+            for stop, visit in enumerate(route['visits'], 1):
+                self.stdout.write(f'    {stop:>2}. {visit.report_number}  {visit.municipality} ward {visit.ward_no}')
+
+        scheduled = sum(len(route['visits']) for route in routes)
+        skipped = []
+        if routes and not options['dry_run']:
+            skipped = scheduling.assign(routes, crews)
+            scheduled -= len(skipped)
+        per_day = scheduled / len(routes) if routes else 0
+        summary = (f'{scheduled} of {len(visits)} pending visits in {len(routes)} team-days '
+                   f'({per_day:.1f} per team-day), {len(unscheduled)} left for a later run.')
+        if options['dry_run']:
+            self.stdout.write(f'Dry run: {summary}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Assigned {summary}'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {len(skipped)} valuation(s) assigned while planning: "
+                f"{', '.join(visit.report_number for visit in skipped)}."
+            ))
+
+    def parse_crews(self, specs, designation):
+        """[[Member, ...], ...] from --crew values, looking up every username at once"""
+        tokens = [[token.strip() for token in spec.split(',') if token.strip()] for spec in specs]
+        usernames = {token for crew in tokens for token in crew if ':' not in token}
+        users = get_user_model().objects.filter(username__in=usernames, is_active=True).in_bulk(field_name='username')
+        missing = usernames - set(users)
+        if missing:
+            raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}.")
+
+        crews = []
+        for crew in tokens:
+            if not crew:
+                raise CommandError('Every --crew needs at least one member.')
+            members = []
+            for token in crew:
+                if ':' in token:
+                    name, member_designation = (part.strip() for part in token.split(':', 1))
+                    members.append(scheduling.Member(name, member_designation or designation, '', None))
+                else:
+                    user = users[token]
+                    members.append(scheduling.Member(user.get_full_name() or user.username, designation, '', user))
+            crews.append(members)
+        return crews
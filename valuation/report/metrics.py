@@ -0,0 +1,219 @@
+"""
+Prometheus-compatible metrics without external dependencies.
+
+Each process keeps its samples in plain dicts. With several worker processes
+(gunicorn, run_jobs --processes) set REPORT_METRICS_DIR: every process then
+writes its samples to its own file there at most once per FLUSH_SECONDS, and
+/metrics sums the files. Clear the directory when deploying.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from django.conf import settings
+
+FLUSH_SECONDS = 1.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_metrics = {}     # name -> metric, in declaration order
+_state = {'file': None, 'flushed_at': 0.0}
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        _metrics[name] = self
+
+    def inc(self, *labels, amount=1):
+        key = (self.name, labels)
+        with _lock:
+            _counters[key] = _counters.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        _metrics[name] = self
+
+    def observe(self, value, *labels):
+        key = (self.name, labels)
+        with _lock:
+            sample = _histograms.get(key)
+            if sample is None:
+                sample = _histograms[key] = [0] * (len(self.buckets) + 3)
+            # Non-cumulative here; made cumulative on exposition
+            sample[bisect_left(self.buckets, value)] += 1
+            sample[-2] += value
+            sample[-1] += 1
+        _maybe_flush()
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+REQUESTS = Counter('report_http_requests_total', 'HTTP requests by view, method and status',
+                   ('view', 'method', 'status'))
+REQUEST_LATENCY = Histogram('report_http_request_duration_seconds', 'Request latency by view', ('view',))
+DB_QUERIES = Counter('report_db_queries_total', 'Database queries by view', ('view',))
+DB_QUERY_TIME = Counter('report_db_query_seconds_total', 'Time spent in database queries by view', ('view',))
+DB_QUERIES_PER_REQUEST = Histogram('report_db_queries_per_request', 'Database queries per request by view',
+                                   ('view',), buckets=QUERY_COUNT_BUCKETS)
+TEMPLATE_RENDER = Histogram('report_template_render_seconds', 'Top-level template render time', ('template',))
+PLOT_SAVES = Counter('report_plot_saves_total', 'Plot.save() calls by outcome', ('outcome',))
+PLOT_RECALCULATIONS = Counter('report_plot_recalculations_total', 'Plots recalculated in bulk by outcome',
+                              ('outcome',))
+JOBS = Counter('report_jobs_total', 'Background jobs run by task and outcome', ('name', 'outcome'))
+SYNC_CHANGES = Counter('report_sync_changes_total', 'Field device edits by model and result', ('model', 'status'))
+CACHE_REQUESTS = Counter('report_cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+QUERY_CACHE_EVICTIONS = Counter('report_query_cache_evictions_total', 'Query cache entries dropped by reason',
+                                ('reason',))
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+def _directory():
+    return getattr(settings, 'REPORT_METRICS_DIR', None)
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(sample)] for (name, labels), sample in _histograms.items()],
+        }
+
+
+def flush():
+    """Write this process's samples to its file in REPORT_METRICS_DIR"""
+    directory = _directory()
+    if not directory:
+        return
+    if _state['file'] is None:
+        os.makedirs(directory, exist_ok=True)
+        _state['file'] = os.path.join(directory, f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+    _state['flushed_at'] = time.monotonic()
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as handle:
+        json.dump(_snapshot(), handle)
+    os.replace(temporary, _state['file'])
+
+
+def _maybe_flush():
+    if _directory() and time.monotonic() - _state['flushed_at'] > FLUSH_SECONDS:
+        flush()
+
+
+def _reset_after_fork():
+    """A forked child starts empty so the parent's samples are not counted twice"""
+    global _lock
+    _lock = threading.Lock()
+    _counters.clear()
+    _histograms.clear()
+    _state['file'] = None
+    _state['flushed_at'] = 0.0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush)
+
+
+def collect():
+    """Samples of every process (or just this one without REPORT_METRICS_DIR)"""
+    directory = _directory()
+    if not directory:
+        snapshots = [_snapshot()]
+    else:
+        flush()
+        snapshots = []
+        for filename in os.listdir(directory):
+            if filename.startswith('metrics-') and filename.endswith('.json'):
+                try:
+                    with open(os.path.join(directory, filename)) as handle:
+                        snapshots.append(json.load(handle))
+                except (OSError, ValueError):
+                    continue
+
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, sample in snapshot['histograms']:
+            key = (name, tuple(labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], sample)]
+            else:
+                histograms[key] = sample
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    """Render all samples in the Prometheus text format (version 0.0.4)"""
+    counters, histograms = collect()
+    lines = []
+    for metric in _metrics.values():
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind == 'counter':
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric.name:
+                    lines.append(f'{name}{_labels(metric.labelnames, labels)} {_number(value)}')
+            continue
+        for (name, labels), sample in sorted(histograms.items()):
+            if name != metric.name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*metric.buckets, '+Inf'), sample):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, labels)} {_number(float(sample[-2]))}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, labels)} {sample[-1]}')
+    return '\n'.join(lines) + '\n'
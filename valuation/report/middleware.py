@@ -0,0 +1,88 @@
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from . import metrics
+from .routers import allow_replica_reads, replica_reads, use_primary
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+PIN_COOKIE = 'report_pin_primary'
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pin a client to the primary database for a short window after it writes,
+    so replica lag never hides the report it just saved. Only views marked
+    @replica_safe read from the replica at all; edit forms and the row
+    editor always load what they change from the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.window = getattr(settings, 'REPORT_READ_YOUR_WRITES_SECONDS', 5)
+
+    def __call__(self, request):
+        writing = request.method not in SAFE_METHODS
+        with use_primary(writing or self._recently_wrote(request)), replica_reads(False):
+            response = self.get_response(request)
+
+        if writing and self.window:
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + self.window:.3f}',
+                max_age=self.window, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'replica_safe', False):
+            allow_replica_reads()
+
+    def _recently_wrote(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status and database work per view. Sits first in
+    MIDDLEWARE so the timings include every other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else '<unmatched>'
+        metrics.REQUESTS.inc(view, request.method, str(response.status_code))
+        metrics.REQUEST_LATENCY.observe(elapsed, view)
+        metrics.DB_QUERIES.inc(view, amount=queries.count)
+        metrics.DB_QUERY_TIME.inc(view, amount=queries.seconds)
+        metrics.DB_QUERIES_PER_REQUEST.observe(queries.count, view)
+        return response
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
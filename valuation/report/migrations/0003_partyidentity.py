@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0002_alter_plot_options_alter_property_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartyIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_type', models.CharField(choices=[('citizenship', 'Citizenship'), ('pan', 'PAN')], max_length=12, verbose_name='ID Type')),
+                ('id_number', models.CharField(max_length=20, verbose_name='Normalized ID Number')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('borrower', 'Borrower')], max_length=10, verbose_name='Role')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='identities', to='report.owner')),
+                ('property', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='party_identities', to='report.property')),
+                ('valuation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='party_identities', to='report.valuation')),
+            ],
+            options={
+                'verbose_name': 'Party Identity',
+                'verbose_name_plural': 'Party Identities',
+                'indexes': [models.Index(fields=['id_type', 'id_number'], name='report_party_lookup_idx')],
+            },
+        ),
+    ]
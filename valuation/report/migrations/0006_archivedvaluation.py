@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:45
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0005_property_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True, verbose_name='Original Valuation ID')),
+                ('fiscal_year', models.CharField(db_index=True, max_length=7, verbose_name='Fiscal Year')),
+                ('report_number', models.CharField(db_index=True, max_length=50, verbose_name='Report Number')),
+                ('val_date', models.DateField(verbose_name='Valuation Date')),
+                ('bank_name', models.CharField(max_length=100, verbose_name='Bank Name')),
+                ('borrower_name', models.CharField(max_length=100, verbose_name='Borrower Name')),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Report Snapshot')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archived Valuation Report',
+                'verbose_name_plural': 'Archived Valuation Reports',
+                'ordering': ['-val_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPartyIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_type', models.CharField(choices=[('citizenship', 'Citizenship'), ('pan', 'PAN')], max_length=12, verbose_name='ID Type')),
+                ('id_number', models.CharField(max_length=20, verbose_name='Normalized ID Number')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('borrower', 'Borrower')], max_length=10, verbose_name='Role')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('property_name', models.CharField(blank=True, max_length=100, verbose_name='Property Name')),
+                ('archived_valuation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='party_identities', to='report.archivedvaluation')),
+            ],
+            options={
+                'verbose_name': 'Archived Party Identity',
+                'verbose_name_plural': 'Archived Party Identities',
+                'indexes': [models.Index(fields=['id_type', 'id_number'], name='report_archived_party_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0006_archivedvaluation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plot',
+            name='boundary',
+            field=models.JSONField(blank=True, null=True, verbose_name='Boundary (GeoJSON Polygon)'),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Latitude'),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True, verbose_name='Longitude'),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='max_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='max_lng',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='min_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='min_lng',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='plot',
+            index=models.Index(fields=['min_lat', 'min_lng'], name='report_plot_bbox_idx'),
+        ),
+    ]
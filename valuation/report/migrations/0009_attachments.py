@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:04
+
+import django.db.models.deletion
+import report.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0008_sync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('size', models.BigIntegerField(verbose_name='Size (bytes)')),
+                ('content_type', models.CharField(max_length=100, verbose_name='Content Type')),
+                ('file', models.FileField(max_length=200, upload_to=report.models.blob_path, verbose_name='File')),
+                ('thumbnail', models.FileField(blank=True, max_length=200, upload_to=report.models.thumbnail_path, verbose_name='Thumbnail')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('photo', 'Site Photo'), ('lalpurja', 'Lalpurja'), ('blueprint', 'Blueprint'), ('other', 'Other Document')], default='photo', max_length=10, verbose_name='Kind')),
+                ('original_name', models.CharField(max_length=255, verbose_name='File Name')),
+                ('caption', models.CharField(blank=True, max_length=200, verbose_name='Caption')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('plot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='report.plot')),
+                ('property', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='report.property')),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_attachments', to=settings.AUTH_USER_MODEL)),
+                ('valuation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='report.valuation')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='report.blob')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0009_attachments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plot',
+            name='parcel_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=160, verbose_name='Parcel Key'),
+        ),
+    ]
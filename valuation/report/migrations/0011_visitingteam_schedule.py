@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0010_plot_parcel_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitingteam',
+            name='route_order',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name="Stop in Day's Route"),
+        ),
+        migrations.AddField(
+            model_name='visitingteam',
+            name='visit_date',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Visit Date'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0011_visitingteam_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='owner',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='plot',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
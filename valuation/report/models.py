@@ -1,9 +1,57 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.urls import reverse
 from datetime import date
 from django.utils import timezone
 from decimal import Decimal
+import unicodedata
 from django.core.exceptions import ValidationError
+from . import geometry, metrics
+from .querycache import CachingQuerySet
+
+# Fair market value weights of the government and market rates
+GOV_RATE_WEIGHT = Decimal('0.3')
+MARKET_RATE_WEIGHT = Decimal('0.7')
+
+# Devanagari digits are common on citizenship certificates
+DEVANAGARI_DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+
+
+def normalize_identity_number(value):
+    """Normalize a citizenship/PAN number into its index key"""
+    if not value:
+        return ''
+    value = value.translate(DEVANAGARI_DIGITS)
+    return ''.join(ch for ch in value if ch.isalnum()).upper()
+
+
+def normalize_parcel_part(value):
+    """Case, spacing, punctuation, Devanagari digits and leading zeros do not matter"""
+    value = str(value or '').translate(DEVANAGARI_DIGITS).casefold()
+    # Letters, digits and combining marks (Devanagari vowel signs) form tokens
+    tokens = ''.join(ch if unicodedata.category(ch)[0] in 'LMN' else ' ' for ch in value).split()
+    return '-'.join(token.lstrip('0') or '0' if token.isdigit() else token for token in tokens)
+
+
+def parcel_key(district, municipality, ward_no, sheet_number, plot_number):
+    """Normalized identity of a cadastral parcel; blank without a plot number"""
+    if not normalize_parcel_part(plot_number):
+        return ''
+    return '|'.join(normalize_parcel_part(part) for part in (
+        district, municipality, ward_no, sheet_number, plot_number,
+    ))
+
+
+def format_area(ropani, ana, paisa, dam, bigha, kattha, dhur, area_sqft):
+    """Format a plot area in whichever Nepali system it was measured in"""
+    if ropani > 0 or ana > 0 or paisa > 0 or dam > 0:
+        return f"{ropani}-{ana}-{paisa}-{dam} (R-A-P-D)"
+    elif bigha > 0 or kattha > 0 or dhur > 0:
+        return f"{bigha}-{kattha}-{dhur} (B-K-D)"
+    else:
+        return f"{area_sqft:,.2f} Sq.Ft"
+
 
 class Valuation(models.Model):
     # Basic Information
@@ -24,8 +72,11 @@ class Valuation(models.Model):
     borrower_pan = models.CharField(max_length=15, blank=True, verbose_name="PAN Number")
     borrower_citizenship = models.CharField(max_length=20, blank=True, verbose_name="Citizenship Number")
     
-    # Auto-generated timestamp (remove from form)
+    # Auto-generated timestamps (remove from form); updated_at drives field sync
     created_at = models.DateTimeField(auto_now_add=True)  # Changed to auto_now_add
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    objects = CachingQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Valuation Report"
@@ -61,13 +112,13 @@ class Valuation(models.Model):
         
         super().save(*args, **kwargs)
 
-        @property
-        def total_valuation(self):
-            """Calculate total valuation from all properties"""
-            total = 0
-            for property in self.properties.all():
-                total += property.total_value
-            return total
+    @property
+    def total_valuation(self):
+        """Calculate total valuation from all properties"""
+        total = 0
+        for property in self.properties.all():
+            total += property.total_value
+        return total
 
 class Property(models.Model):
     valuation = models.ForeignKey(Valuation, on_delete=models.CASCADE, related_name='properties')
@@ -86,8 +137,13 @@ class Property(models.Model):
         ('other', 'Other')
     ], default='residential')
     
-    # Auto-generated timestamp
+    # Auto-generated timestamps; updated_at also moves when owners/plots change
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Bumped by saves of this row only; field sync detects conflicts with it
+    version = models.PositiveIntegerField(default=1, editable=False)
+    
+    objects = CachingQuerySet.as_manager()
     
     class Meta:
         verbose_name_plural = "Properties"
@@ -99,6 +155,16 @@ class Property(models.Model):
     def get_absolute_url(self):
         return reverse('report:property_edit', kwargs={'pk': self.pk})
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def touch(cls, *pks):
+        """Mark properties as changed (invalidates their cached fragments)"""
+        cls.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+    
     @property
     def total_value(self):
         """Calculate total value from all plots"""
@@ -117,14 +183,24 @@ class Owner(models.Model):
     citizenship_number = models.CharField(max_length=20, blank=True, verbose_name="Citizenship Number")
     pan_number = models.CharField(max_length=15, blank=True, verbose_name="PAN Number")
     
-    # Auto-generated timestamp
+    # Auto-generated timestamps
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Bumped by every save; field sync detects conflicts with it
+    version = models.PositiveIntegerField(default=1, editable=False)
+    
+    objects = CachingQuerySet.as_manager()
     
     class Meta:
         verbose_name_plural = "Property Owners"
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+        super().save(*args, **kwargs)
 
 class Plot(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='plots')
@@ -163,15 +239,39 @@ class Plot(models.Model):
     east_boundary = models.CharField(max_length=100, blank=True, verbose_name="East Boundary")
     west_boundary = models.CharField(max_length=100, blank=True, verbose_name="West Boundary")
     
+    # Location (optional, WGS84)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name="Latitude")
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, verbose_name="Longitude")
+    boundary = models.JSONField(null=True, blank=True, verbose_name="Boundary (GeoJSON Polygon)")
+    
+    # Bounding box of the boundary or point, mirrored into the spatial index
+    min_lat = models.FloatField(null=True, blank=True, editable=False)
+    max_lat = models.FloatField(null=True, blank=True, editable=False)
+    min_lng = models.FloatField(null=True, blank=True, editable=False)
+    max_lng = models.FloatField(null=True, blank=True, editable=False)
+    
     # Additional Details
     remarks = models.TextField(blank=True, verbose_name="Remarks")
     
-    # Auto-generated timestamp
+    # district|municipality|ward|sheet|plot, normalized, for duplicate-collateral checks
+    parcel_key = models.CharField(max_length=160, blank=True, db_index=True, editable=False,
+                                  verbose_name="Parcel Key")
+    
+    # Auto-generated timestamps
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Bumped by every save; field sync detects conflicts with it
+    version = models.PositiveIntegerField(default=1, editable=False)
+    
+    objects = CachingQuerySet.as_manager()
     
     class Meta:
         verbose_name_plural = "Land Plots"
         ordering = ['plot_number']
+        indexes = [
+            # Portable fallback where the SQLite R*Tree is unavailable
+            models.Index(fields=['min_lat', 'min_lng'], name='report_plot_bbox_idx'),
+        ]
     
     def __str__(self):
         return f"Plot {self.plot_number} - {self.get_area_display()}"
@@ -194,13 +294,32 @@ class Plot(models.Model):
         if self.dhur < 0 or self.dhur > 19:
             errors['dhur'] = 'Dhur must be between 0 and 19'
         
+        # Location validation
+        if (self.latitude is None) != (self.longitude is None):
+            errors['longitude'] = 'Enter both latitude and longitude, or neither'
+        if self.boundary:
+            try:
+                geometry.parse_polygon(self.boundary)
+            except ValidationError as exc:
+                errors['boundary'] = exc.messages
+        
         if errors:
             raise ValidationError(errors)
     
     def save(self, *args, **kwargs):
-        self.calculate_areas()
-        self.calculate_valuations()
-        super().save(*args, **kwargs)
+        outcome = 'created' if self._state.adding else 'updated'
+        if not self._state.adding:
+            self.version += 1
+        try:
+            self.calculate_areas()
+            self.calculate_valuations()
+            self.calculate_bounds()
+            self.parcel_key = self.compute_parcel_key()
+            super().save(*args, **kwargs)
+        except Exception:
+            metrics.PLOT_SAVES.inc('failed')
+            raise
+        metrics.PLOT_SAVES.inc(outcome)
     
     def calculate_areas(self):
         """Calculate area in square feet and square meters"""
@@ -222,30 +341,290 @@ class Plot(models.Model):
             
             # Fair market value (weighted average: 30% gov + 70% market)
             if self.gov_rate_per_sqft > 0 or self.market_rate_per_sqft > 0:
-                weighted_rate = (self.gov_rate_per_sqft * Decimal('0.3')) + (self.market_rate_per_sqft * Decimal('0.7'))
+                weighted_rate = (self.gov_rate_per_sqft * GOV_RATE_WEIGHT) + (self.market_rate_per_sqft * MARKET_RATE_WEIGHT)
                 self.fair_market_value = self.area_sqft * weighted_rate
     
     def get_area_display(self):
         """Get formatted area display"""
-        if self.ropani > 0 or self.ana > 0 or self.paisa > 0 or self.dam > 0:
-            return f"{self.ropani}-{self.ana}-{self.paisa}-{self.dam} (R-A-P-D)"
-        elif self.bigha > 0 or self.kattha > 0 or self.dhur > 0:
-            return f"{self.bigha}-{self.kattha}-{self.dhur} (B-K-D)"
+        return format_area(self.ropani, self.ana, self.paisa, self.dam,
+                           self.bigha, self.kattha, self.dhur, self.area_sqft)
+    
+    def compute_parcel_key(self, property=None):
+        property = property or self.property
+        return parcel_key(property.district, property.municipality, property.ward_no,
+                          self.sheet_number, self.plot_number)
+    
+    def calculate_bounds(self):
+        """Bounding box of the boundary polygon, or of the point when there is none"""
+        if self.boundary:
+            ring = geometry.parse_polygon(self.boundary)
+            self.boundary = geometry.to_geojson(ring)
+            self.min_lng, self.min_lat, self.max_lng, self.max_lat = geometry.ring_bounds(ring)
+        elif self.latitude is not None and self.longitude is not None:
+            self.min_lat = self.max_lat = float(self.latitude)
+            self.min_lng = self.max_lng = float(self.longitude)
         else:
-            return f"{self.area_sqft:,.2f} Sq.Ft"
+            self.min_lat = self.max_lat = self.min_lng = self.max_lng = None
 
 class VisitingTeam(models.Model):
     valuation = models.ForeignKey(Valuation, on_delete=models.CASCADE, related_name='visiting_teams')
     member_name = models.CharField(max_length=100, verbose_name="Team Member Name")
     designation = models.CharField(max_length=100, verbose_name="Designation")
     contact_number = models.CharField(max_length=15, blank=True, verbose_name="Contact Number")
-    
-    # Auto-generated timestamp
+    # Login of the member, for syncing their assigned reports to a field device
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='visits', verbose_name="User Account")
+    # Set by the site-visit scheduler (manage.py schedule_visits)
+    visit_date = models.DateField(null=True, blank=True, db_index=True, verbose_name="Visit Date")
+    route_order = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Stop in Day's Route")
+    
+    # Auto-generated timestamps
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    
+    objects = CachingQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Visiting Team Member"
         verbose_name_plural = "Visiting Team Members"
     
     def __str__(self):
-        return f"{self.member_name} - {self.designation}"
\ No newline at end of file
+        return f"{self.member_name} - {self.designation}"
+
+class PartyIdentity(models.Model):
+    """Normalized citizenship/PAN index over property owners and borrowers"""
+    ID_CITIZENSHIP = 'citizenship'
+    ID_PAN = 'pan'
+    ID_TYPE_CHOICES = [
+        (ID_CITIZENSHIP, 'Citizenship'),
+        (ID_PAN, 'PAN'),
+    ]
+
+    ROLE_OWNER = 'owner'
+    ROLE_BORROWER = 'borrower'
+    ROLE_CHOICES = [
+        (ROLE_OWNER, 'Owner'),
+        (ROLE_BORROWER, 'Borrower'),
+    ]
+
+    id_type = models.CharField(max_length=12, choices=ID_TYPE_CHOICES, verbose_name="ID Type")
+    id_number = models.CharField(max_length=20, verbose_name="Normalized ID Number")
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, verbose_name="Role")
+    name = models.CharField(max_length=100, verbose_name="Name")
+
+    # Denormalized so a single indexed lookup reaches the report
+    valuation = models.ForeignKey(Valuation, on_delete=models.CASCADE, related_name='party_identities')
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, null=True, blank=True, related_name='party_identities')
+    owner = models.ForeignKey(Owner, on_delete=models.CASCADE, null=True, blank=True, related_name='identities')
+
+    class Meta:
+        verbose_name = "Party Identity"
+        verbose_name_plural = "Party Identities"
+        indexes = [
+            models.Index(fields=['id_type', 'id_number'], name='report_party_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_id_type_display()} {self.id_number} - {self.name}"
+
+
+class Job(models.Model):
+    """Background job queued for the `run_jobs` worker"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name="Task")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Payload")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+
+    # Retries
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Attempts")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Max Attempts")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Run After")
+
+    # Progress reporting
+    progress = models.PositiveIntegerField(default=0, verbose_name="Progress")
+    progress_total = models.PositiveIntegerField(default=0, verbose_name="Progress Total")
+    progress_message = models.CharField(max_length=200, blank=True, verbose_name="Progress Message")
+
+    # Outcome
+    result = models.JSONField(null=True, blank=True, verbose_name="Result")
+    error = models.TextField(blank=True, verbose_name="Error")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Worker")
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Background Job"
+        verbose_name_plural = "Background Jobs"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='report_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def percent(self):
+        if not self.progress_total:
+            return 100 if self.status == self.STATUS_SUCCEEDED else 0
+        return min(100, int(self.progress * 100 / self.progress_total))
+
+    def report_progress(self, done, total=None, message=''):
+        """Record progress without touching the rest of the row"""
+        self.progress = done
+        if total is not None:
+            self.progress_total = total
+        self.progress_message = message[:200]
+        Job.objects.filter(pk=self.pk).update(
+            progress=self.progress,
+            progress_total=self.progress_total,
+            progress_message=self.progress_message,
+        )
+
+
+class ArchivedValuation(models.Model):
+    """A closed fiscal year's valuation report, moved out of the hot tables"""
+    original_id = models.BigIntegerField(unique=True, verbose_name="Original Valuation ID")
+    fiscal_year = models.CharField(max_length=7, db_index=True, verbose_name="Fiscal Year")
+
+    # Search columns copied from the report
+    report_number = models.CharField(max_length=50, db_index=True, verbose_name="Report Number")
+    val_date = models.DateField(verbose_name="Valuation Date")
+    bank_name = models.CharField(max_length=100, verbose_name="Bank Name")
+    borrower_name = models.CharField(max_length=100, verbose_name="Borrower Name")
+
+    # Valuation, properties, owners, plots and visiting team as stored
+    payload = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="Report Snapshot")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Archived Valuation Report"
+        verbose_name_plural = "Archived Valuation Reports"
+        ordering = ['-val_date']
+
+    def __str__(self):
+        return f"{self.report_number} - {self.bank_name} ({self.fiscal_year})"
+
+    def get_absolute_url(self):
+        return reverse('report:valuation_detail', kwargs={'pk': self.original_id})
+
+
+class ArchivedPartyIdentity(models.Model):
+    """Party index rows of archived reports, for exposure checks"""
+    id_type = models.CharField(max_length=12, choices=PartyIdentity.ID_TYPE_CHOICES, verbose_name="ID Type")
+    id_number = models.CharField(max_length=20, verbose_name="Normalized ID Number")
+    role = models.CharField(max_length=10, choices=PartyIdentity.ROLE_CHOICES, verbose_name="Role")
+    name = models.CharField(max_length=100, verbose_name="Name")
+    archived_valuation = models.ForeignKey(ArchivedValuation, on_delete=models.CASCADE, related_name='party_identities')
+    property_name = models.CharField(max_length=100, blank=True, verbose_name="Property Name")
+
+    class Meta:
+        verbose_name = "Archived Party Identity"
+        verbose_name_plural = "Archived Party Identities"
+        indexes = [
+            models.Index(fields=['id_type', 'id_number'], name='report_archived_party_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_id_type_display()} {self.id_number} - {self.name}"
+
+class Tombstone(models.Model):
+    """Record of a deleted report row, so field devices can drop their copy"""
+    model = models.CharField(max_length=20, verbose_name="Model")
+    object_id = models.BigIntegerField(verbose_name="Object ID")
+    # Scope for sync: set from the row itself, or from its property when the
+    # property still exists (a deleted property has its own tombstone)
+    valuation_id = models.BigIntegerField(null=True, blank=True)
+    property_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['deleted_at']
+    
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+class SyncReceipt(models.Model):
+    """Rows created by a field device, so a retried upload does not create them twice"""
+    client_id = models.CharField(max_length=64, unique=True, verbose_name="Client ID")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sync_receipts')
+    model = models.CharField(max_length=20, verbose_name="Model")
+    object_id = models.BigIntegerField(verbose_name="Object ID")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.client_id} -> {self.model} #{self.object_id}"
+
+def blob_path(instance, filename):
+    """Content-addressed: the same bytes are stored once"""
+    return f'blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}'
+
+def thumbnail_path(instance, filename):
+    return f'thumbs/{instance.sha256[:2]}/{instance.sha256}.jpg'
+
+class Blob(models.Model):
+    """Stored file content, shared by every attachment with the same bytes"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    size = models.BigIntegerField(verbose_name="Size (bytes)")
+    content_type = models.CharField(max_length=100, verbose_name="Content Type")
+    file = models.FileField(upload_to=blob_path, max_length=200, verbose_name="File")
+    # Made by the make_thumbnail job for images
+    thumbnail = models.FileField(upload_to=thumbnail_path, max_length=200, blank=True, verbose_name="Thumbnail")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = CachingQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.content_type}, {self.size} bytes)"
+    
+    @property
+    def is_image(self):
+        return self.content_type.startswith('image/')
+
+class Attachment(models.Model):
+    """A site photo or document of a report, optionally of one property or plot"""
+    KIND_PHOTO = 'photo'
+    KIND_LALPURJA = 'lalpurja'
+    KIND_BLUEPRINT = 'blueprint'
+    KIND_OTHER = 'other'
+    KIND_CHOICES = [
+        (KIND_PHOTO, 'Site Photo'),
+        (KIND_LALPURJA, 'Lalpurja'),
+        (KIND_BLUEPRINT, 'Blueprint'),
+        (KIND_OTHER, 'Other Document'),
+    ]
+    
+    valuation = models.ForeignKey(Valuation, on_delete=models.CASCADE, related_name='attachments')
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, null=True, blank=True, related_name='attachments')
+    plot = models.ForeignKey(Plot, on_delete=models.CASCADE, null=True, blank=True, related_name='attachments')
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, related_name='attachments')
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=KIND_PHOTO, verbose_name="Kind")
+    original_name = models.CharField(max_length=255, verbose_name="File Name")
+    caption = models.CharField(max_length=200, blank=True, verbose_name="Caption")
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='report_attachments')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CachingQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['created_at']
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.original_name}"
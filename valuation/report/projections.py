@@ -0,0 +1,113 @@
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Substr
+from .models import Plot, format_area
+
+ADDRESS_PREVIEW_LENGTH = 120
+
+
+class Row:
+    """
+    Light read-only row built from a values() projection.
+    Subclasses map attribute names to ORM lookups (or expressions) in `columns`.
+    """
+    __slots__ = ()
+    columns = {}
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+        self.prepare()
+
+    def prepare(self):
+        """Precompute display fields once per row"""
+
+    @classmethod
+    def project(cls, queryset):
+        fields = {name: lookup for name, lookup in cls.columns.items() if isinstance(lookup, str)}
+        expressions = {name: lookup for name, lookup in cls.columns.items() if not isinstance(lookup, str)}
+        return [
+            cls(
+                **{name: row[lookup] for name, lookup in fields.items()},
+                **{name: row[name] for name in expressions},
+            )
+            for row in queryset.values(*fields.values(), **expressions)
+        ]
+
+
+class PlotRow(Row):
+    columns = {
+        'pk': 'pk',
+        'plot_number': 'plot_number',
+        'ropani': 'ropani',
+        'ana': 'ana',
+        'paisa': 'paisa',
+        'dam': 'dam',
+        'bigha': 'bigha',
+        'kattha': 'kattha',
+        'dhur': 'dhur',
+        'area_sqft': 'area_sqft',
+        'market_rate_per_sqft': 'market_rate_per_sqft',
+        'fair_market_value': 'fair_market_value',
+        'property_name': 'property__name',
+        'bank_name': 'property__valuation__bank_name',
+    }
+    __slots__ = (*columns, 'area_system', 'area_display')
+
+    def prepare(self):
+        if self.ropani > 0 or self.ana > 0:
+            self.area_system = 'ropani'
+        elif self.bigha > 0 or self.kattha > 0:
+            self.area_system = 'bigha'
+        else:
+            self.area_system = None
+        self.area_display = format_area(self.ropani, self.ana, self.paisa, self.dam,
+                                        self.bigha, self.kattha, self.dhur, self.area_sqft)
+
+
+class OwnerRow(Row):
+    columns = {
+        'pk': 'pk',
+        'name': 'name',
+        'contact_number': 'contact_number',
+        'citizenship_number': 'citizenship_number',
+        'pan_number': 'pan_number',
+        'property_name': 'property__name',
+        'bank_name': 'property__valuation__bank_name',
+        # Only the start of the address is ever shown in lists
+        'address_preview': Substr('address', 1, ADDRESS_PREVIEW_LENGTH),
+    }
+    __slots__ = tuple(columns)
+
+
+# Columns fetched for admin changelists (model instances via only())
+VALUATION_ADMIN_COLUMNS = ('report_number', 'bank_name', 'borrower_name', 'val_date', 'created_at')
+PROPERTY_ADMIN_COLUMNS = ('name', 'district', 'municipality', 'created_at',
+                          'valuation__report_number')
+OWNER_ADMIN_COLUMNS = ('name', 'contact_number', 'citizenship_number', 'pan_number', 'created_at',
+                       'property__name')
+PLOT_ADMIN_COLUMNS = ('plot_number', 'ropani', 'ana', 'paisa', 'dam', 'bigha', 'kattha', 'dhur',
+                      'area_sqft', 'market_rate_per_sqft', 'fair_market_value', 'created_at',
+                      'property__name')
+VISITING_TEAM_ADMIN_COLUMNS = ('member_name', 'designation', 'contact_number', 'visit_date', 'route_order',
+                               'created_at', 'valuation__report_number')
+
+
+def restrict(queryset, columns):
+    """Model instances loading only `columns`, joining the related ones"""
+    related = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+    return queryset.select_related(*related).only(*columns)
+
+
+def with_property_totals(queryset):
+    """
+    Annotate owner/plot counts and plot value per property.
+    Correlated subqueries keep the owners and plots joins from multiplying
+    each other's rows.
+    """
+    zero = Value(0, output_field=DecimalField(max_digits=15, decimal_places=2))
+    plots = Plot.objects.filter(property=OuterRef('pk')).order_by().values('property')
+    return queryset.annotate(
+        owner_count=Count('owners', distinct=True),
+        plot_count=Coalesce(Subquery(plots.annotate(n=Count('pk')).values('n')), 0),
+        total_value_sum=Coalesce(Subquery(plots.annotate(total=Sum('fair_market_value')).values('total')), zero),
+    )
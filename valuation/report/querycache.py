@@ -0,0 +1,197 @@
+"""
+Opt-in cache of ORM query results for the report models.
+
+Querysets marked with .cached() keep their results in a per-process LRU,
+bounded by entry count and by pickled size. Entries are keyed on the
+normalized SQL and params together with a generation number for every table
+the SQL reads. post_save/post_delete (signals.py) and the queryset's bulk
+methods bump the generation of the table they write, so the next lookup
+misses instead of returning rows from before the edit.
+
+Like the read replica, the cache is skipped inside transactions and while a
+client is pinned to the primary after its own write (ReadYourWritesMiddleware).
+Entries expire after MAX_AGE seconds, which defaults to that read-your-writes
+window; that covers writes made by other worker processes.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, transaction
+from . import metrics
+from .routers import is_pinned
+
+MAX_ENTRIES = getattr(settings, 'REPORT_QUERY_CACHE_ENTRIES', 2000)
+MAX_BYTES = getattr(settings, 'REPORT_QUERY_CACHE_BYTES', 32 * 1024 * 1024)
+MAX_AGE = getattr(settings, 'REPORT_QUERY_CACHE_SECONDS', getattr(settings, 'REPORT_READ_YOUR_WRITES_SECONDS', 5))
+# A single result larger than this is not worth evicting everything else for
+MAX_ENTRY_BYTES = MAX_BYTES // 10
+
+_lock = threading.Lock()
+_entries = OrderedDict()   # key -> (pickled results, stored at)
+_generations = {}          # table -> generation
+_state = {'bytes': 0, 'tables': None}
+
+
+def cached_models():
+    """Models whose default manager is a CachingQuerySet"""
+    return [model for model in apps.get_models() if isinstance(model._default_manager.all(), CachingQuerySet)]
+
+
+def _model_tables():
+    """
+    (every model table, tables of models whose writes all pass through
+    CachingQuerySet or the model signals)
+    """
+    if _state['tables'] is None:
+        _state['tables'] = (
+            frozenset(model._meta.db_table for model in apps.get_models(include_auto_created=True)),
+            frozenset(model._meta.db_table for model in cached_models()),
+        )
+    return _state['tables']
+
+
+def _tables(connection, sql):
+    """(tracked tables the SQL reads, whether it also reads an untracked model table)"""
+    every, tracked = _model_tables()
+    named = {table for table in every if connection.ops.quote_name(table) in sql}
+    return named & tracked, bool(named - tracked)
+
+
+def _bump(tables):
+    with _lock:
+        for table in tables:
+            _generations[table] = _generations.get(table, 0) + 1
+
+
+def invalidate(*models, using=DEFAULT_DB_ALIAS):
+    """Drop cached results that read the tables of `models`"""
+    tables = {model._meta.db_table for model in models}
+    _bump(tables)
+    # Readers may cache the old rows until the write commits; bump again then
+    if connections[using].in_atomic_block:
+        transaction.on_commit(lambda: _bump(tables), using=using)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _state['bytes'] = 0
+
+
+def _get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > MAX_AGE:
+            _discard(key, 'expired')
+            return None
+        _entries.move_to_end(key)
+        return entry[0]
+
+
+def _set(key, data):
+    if len(data) > MAX_ENTRY_BYTES:
+        return
+    with _lock:
+        if key in _entries:
+            _discard(key, 'replaced')
+        _entries[key] = (data, time.monotonic())
+        _state['bytes'] += len(data)
+        while len(_entries) > MAX_ENTRIES:
+            _discard(next(iter(_entries)), 'entries')
+        while _state['bytes'] > MAX_BYTES:
+            _discard(next(iter(_entries)), 'bytes')
+
+
+def _discard(key, reason):
+    data, _ = _entries.pop(key)
+    _state['bytes'] -= len(data)
+    if reason != 'replaced':
+        metrics.QUERY_CACHE_EVICTIONS.inc(reason)
+
+
+class CachingQuerySet(models.QuerySet):
+    """QuerySet that can serve its results from the query cache, and invalidates it on bulk writes"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_results = False
+
+    def cached(self):
+        """Serve this query's results from the cache when they are still current"""
+        clone = self._chain()
+        clone._cache_results = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_results = self._cache_results
+        return clone
+
+    def _cache_key(self, kind):
+        """Key for the current results of this query, or None when it must not be cached"""
+        if not self._cache_results or not MAX_BYTES or is_pinned():
+            return None
+        if self._for_write or self._known_related_objects or self.query.select_for_update:
+            return None
+        connection = connections[self.db]
+        if connection.in_atomic_block:
+            return None
+        try:
+            sql, params = self.query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            return None
+        tables, untracked = _tables(connection, sql)
+        if untracked:
+            return None
+        generations = tuple(sorted((table, _generations.get(table, 0)) for table in tables))
+        shape = (self._iterable_class.__name__, self._fields)
+        digest = hashlib.sha1(repr((' '.join(sql.split()), params, shape)).encode()).hexdigest()
+        return (self.db, kind, digest, generations)
+
+    def _cached(self, kind, compute):
+        key = self._cache_key(kind)
+        if key is None:
+            return compute()
+        data = _get(key)
+        metrics.cache_result(f'queryset.{self.model._meta.model_name}', data is not None)
+        if data is not None:
+            return pickle.loads(data)
+        result = compute()
+        _set(key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        return result
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._cache_results:
+            self._result_cache = self._cached('rows', lambda: list(self._iterable_class(self)))
+        super()._fetch_all()
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return self._cached('count', super().count)
+
+    def _write_db(self):
+        return self._db or router.db_for_write(self.model, **self._hints)
+
+    def update(self, **kwargs):
+        invalidate(self.model, using=self._write_db())
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        invalidate(self.model, using=self._write_db())
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def delete(self):
+        invalidate(self.model, using=self._write_db())
+        return super().delete()
+
+    def _raw_delete(self, using):
+        invalidate(self.model, using=using)
+        return super()._raw_delete(using)
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Only report data is replicated for reads; sessions, auth and admin logs
+# always stay on the primary so logins and messages are never stale.
+REPLICATED_APPS = {'report'}
+
+_pin_primary = ContextVar('report_pin_primary', default=False)
+# Reads go to the replica only where allowed: views marked @replica_safe and
+# blocks wrapped in replica_reads() (the snapshot export). Everything else,
+# including the job queue, sync state and maintenance commands, reads the
+# primary it writes to.
+_replica_allowed = ContextVar('report_replica_allowed', default=False)
+
+
+def replica_alias():
+    """The configured read replica alias, or None when reads stay on default"""
+    alias = getattr(settings, 'REPORT_READ_REPLICA', None)
+    if alias and alias in connections.databases:
+        return alias
+    return None
+
+
+def is_pinned():
+    return _pin_primary.get()
+
+
+@contextmanager
+def use_primary(pinned=True):
+    """Send every read inside the block to the primary database"""
+    token = _pin_primary.set(pinned)
+    try:
+        yield
+    finally:
+        _pin_primary.reset(token)
+
+
+@contextmanager
+def replica_reads(allowed=True):
+    """Allow or forbid reads inside the block to go to the replica"""
+    token = _replica_allowed.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_allowed.reset(token)
+
+
+def allow_replica_reads():
+    """Let the rest of the current request read from the replica (inside a replica_reads block)"""
+    _replica_allowed.set(True)
+
+
+def replica_safe(view):
+    """
+    Mark a read-only or reporting view whose reads may lag the primary by the
+    replication delay. Forms and editors are left unmarked and read the primary.
+    """
+    view.replica_safe = True
+    return view
+
+
+class ReadReplicaRouter:
+    """
+    Route reads of report models to the replica and everything else to default.
+    Reads fall back to the primary while pinned (unsafe requests and the
+    read-your-writes window), in views not marked @replica_safe, or inside a
+    transaction on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICATED_APPS:
+            return None
+        alias = replica_alias()
+        if alias is None or is_pinned() or not _replica_allowed.get():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        allowed = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in allowed and obj2._state.db in allowed:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema from the primary
+        if db == getattr(settings, 'REPORT_READ_REPLICA', None):
+            return False
+        return None
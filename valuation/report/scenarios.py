@@ -0,0 +1,253 @@
+"""
+Rate-shock scenarios over the whole collateral portfolio.
+
+A scenario is a list of rules. Each rule matches plots by district, land_type
+and/or municipality, and shifts their market and/or government rate by a
+percentage. Matching rules compound. Fair market values are recomputed in
+memory with the Plot.calculate_valuations weighting; nothing is written back.
+
+numpy is used when installed (pip install numpy); otherwise a pure-Python
+loop gives the same figures, only more slowly.
+"""
+import math
+import time
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from .autocomplete import fold
+from .models import GOV_RATE_WEIGHT, MARKET_RATE_WEIGHT, Plot, Valuation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MATCH_FIELDS = ('district', 'land_type', 'municipality')
+SHOCK_FIELDS = ('market_pct', 'gov_pct')
+LOAD_CHUNK_SIZE = 10000
+# Compounded shocks beyond this could overflow to inf in the engines
+MAX_SHOCK_PCT = 10000
+
+GOV_WEIGHT = float(GOV_RATE_WEIGHT)
+MARKET_WEIGHT = float(MARKET_RATE_WEIGHT)
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+def parse_rules(rules):
+    """Validate rules like {'district': 'Kathmandu', 'market_pct': -20}"""
+    if not isinstance(rules, list) or not rules:
+        raise ScenarioError('A scenario needs at least one rule.')
+    parsed = []
+    for number, rule in enumerate(rules, 1):
+        if not isinstance(rule, dict):
+            raise ScenarioError(f'Rule {number} must be an object.')
+        unknown = set(rule) - set(MATCH_FIELDS) - set(SHOCK_FIELDS)
+        if unknown:
+            raise ScenarioError(f'Rule {number} has unknown keys: {", ".join(sorted(unknown))}.')
+        if not any(rule.get(field) for field in MATCH_FIELDS):
+            raise ScenarioError(f'Rule {number} must match a district, land_type or municipality.')
+        try:
+            shocks = {field: float(rule.get(field) or 0) for field in SHOCK_FIELDS}
+        except (TypeError, ValueError):
+            raise ScenarioError(f'Rule {number}: shocks must be percentages.') from None
+        if not all(math.isfinite(shock) for shock in shocks.values()):
+            raise ScenarioError(f'Rule {number}: shocks must be percentages.')
+        if any(shock <= -100 for shock in shocks.values()):
+            raise ScenarioError(f'Rule {number}: a rate cannot fall by 100% or more.')
+        if any(shock > MAX_SHOCK_PCT for shock in shocks.values()):
+            raise ScenarioError(f'Rule {number}: a rate cannot rise by more than {MAX_SHOCK_PCT}%.')
+        parsed.append({
+            **{field: str(rule[field]) for field in MATCH_FIELDS if rule.get(field)},
+            **shocks,
+        })
+    return parsed
+
+
+def parse_rule_string(text):
+    """Command-line form of a rule: district=Kathmandu,market_pct=-20"""
+    rule = {}
+    for part in text.split(','):
+        key, sep, value = part.partition('=')
+        if not sep:
+            raise ScenarioError(f'Expected key=value in {text!r}.')
+        rule[key.strip()] = value.strip()
+    return rule
+
+
+class Portfolio:
+    """Column arrays of every plot, with categories encoded as small integers"""
+
+    def __init__(self, queryset=None):
+        queryset = Plot.objects.all() if queryset is None else queryset
+        self.codes = {field: {} for field in MATCH_FIELDS}
+        self.area, self.gov, self.market, self.value = [], [], [], []
+        self.categories = {field: [] for field in MATCH_FIELDS}
+        self.valuation_ids = []
+
+        rows = queryset.order_by().values_list(
+            Cast('area_sqft', FloatField()), Cast('gov_rate_per_sqft', FloatField()),
+            Cast('market_rate_per_sqft', FloatField()), Cast('fair_market_value', FloatField()),
+            'property__district', 'property__land_type', 'property__municipality',
+            'property__valuation_id',
+        )
+        for area, gov, market, value, district, land_type, municipality, valuation_id in rows.iterator(
+            chunk_size=LOAD_CHUNK_SIZE
+        ):
+            self.area.append(area or 0.0)
+            self.gov.append(gov or 0.0)
+            self.market.append(market or 0.0)
+            self.value.append(value or 0.0)
+            for field, raw in zip(MATCH_FIELDS, (district, land_type, municipality)):
+                codes = self.codes[field]
+                self.categories[field].append(codes.setdefault(fold(raw or ''), len(codes)))
+            self.valuation_ids.append(valuation_id)
+
+    def __len__(self):
+        return len(self.area)
+
+    def compile(self, rules):
+        """Rules with category codes in place of names (-1: matches nothing)"""
+        return [
+            (
+                {field: self.codes[field].get(fold(rule[field]), -1) for field in MATCH_FIELDS if field in rule},
+                1 + rule['market_pct'] / 100,
+                1 + rule['gov_pct'] / 100,
+            )
+            for rule in rules
+        ]
+
+
+def _shock_numpy(portfolio, compiled):
+    n = len(portfolio)
+    area = numpy.array(portfolio.area)
+    gov = numpy.array(portfolio.gov)
+    market = numpy.array(portfolio.market)
+    value = numpy.array(portfolio.value)
+    categories = {field: numpy.array(codes, dtype=numpy.int32) for field, codes in portfolio.categories.items()}
+
+    market_factor = numpy.ones(n)
+    gov_factor = numpy.ones(n)
+    matched = numpy.zeros(n, dtype=bool)
+    for criteria, market_shock, gov_shock in compiled:
+        mask = numpy.ones(n, dtype=bool)
+        for field, code in criteria.items():
+            mask &= categories[field] == code
+        market_factor[mask] *= market_shock
+        gov_factor[mask] *= gov_shock
+        matched |= mask
+
+    # Plot.calculate_valuations only prices plots with an area and a rate
+    priced = matched & (area > 0) & ((gov > 0) | (market > 0))
+    delta = area * (gov * (gov_factor - 1) * GOV_WEIGHT + market * (market_factor - 1) * MARKET_WEIGHT)
+    shocked = value + numpy.where(priced, delta, 0.0)
+
+    valuation_ids, groups = numpy.unique(numpy.array(portfolio.valuation_ids), return_inverse=True)
+    return zip(
+        valuation_ids.tolist(),
+        numpy.bincount(groups).tolist(),
+        numpy.bincount(groups, weights=matched).astype(int).tolist(),
+        numpy.bincount(groups, weights=value).tolist(),
+        numpy.bincount(groups, weights=shocked).tolist(),
+    )
+
+
+def _shock_python(portfolio, compiled):
+    totals = {}
+    categories = [portfolio.categories[field] for field in MATCH_FIELDS]
+    compiled = [
+        ([(MATCH_FIELDS.index(field), code) for field, code in criteria.items()], market_shock, gov_shock)
+        for criteria, market_shock, gov_shock in compiled
+    ]
+    for i, valuation_id in enumerate(portfolio.valuation_ids):
+        value = portfolio.value[i]
+        market_factor = gov_factor = 1.0
+        matched = False
+        for criteria, market_shock, gov_shock in compiled:
+            if all(categories[index][i] == code for index, code in criteria):
+                market_factor *= market_shock
+                gov_factor *= gov_shock
+                matched = True
+        shocked = value
+        area, gov, market = portfolio.area[i], portfolio.gov[i], portfolio.market[i]
+        if matched and area > 0 and (gov > 0 or market > 0):
+            shocked += area * (gov * (gov_factor - 1) * GOV_WEIGHT + market * (market_factor - 1) * MARKET_WEIGHT)
+
+        entry = totals.get(valuation_id)
+        if entry is None:
+            entry = totals[valuation_id] = [0, 0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += matched
+        entry[2] += value
+        entry[3] += shocked
+    return ((valuation_id, *entry) for valuation_id, entry in sorted(totals.items()))
+
+
+def _summary(baseline, shocked):
+    change = shocked - baseline
+    return {
+        'baseline': round(baseline, 2),
+        'shocked': round(shocked, 2),
+        'change': round(change, 2),
+        'change_pct': round(change / baseline * 100, 2) if baseline else 0.0,
+    }
+
+
+def run(rules, queryset=None, use_numpy=None):
+    """
+    Apply a scenario to every plot (or `queryset`) and aggregate the result
+    per valuation and per bank. Reads only; nothing is saved.
+    """
+    started = time.perf_counter()
+    rules = parse_rules(rules)
+    use_numpy = numpy is not None if use_numpy is None else use_numpy and numpy is not None
+    portfolio = Portfolio(queryset)
+    compiled = portfolio.compile(rules)
+    groups = (_shock_numpy if use_numpy else _shock_python)(portfolio, compiled) if len(portfolio) else []
+
+    reports = {
+        pk: (report_number, bank_name)
+        for pk, report_number, bank_name in Valuation.objects.values_list('pk', 'report_number', 'bank_name')
+    }
+    valuations, banks = [], {}
+    for valuation_id, plots, affected, baseline, shocked in groups:
+        report_number, bank_name = reports.get(valuation_id, ('', ''))
+        valuations.append({
+            'valuation_id': valuation_id,
+            'report_number': report_number,
+            'bank_name': bank_name,
+            'plots': plots,
+            'affected_plots': affected,
+            **_summary(baseline, shocked),
+        })
+        bank = banks.setdefault(bank_name, {'valuations': 0, 'plots': 0, 'affected_plots': 0,
+                                            'baseline': 0.0, 'shocked': 0.0})
+        bank['valuations'] += 1
+        bank['plots'] += plots
+        bank['affected_plots'] += affected
+        bank['baseline'] += baseline
+        bank['shocked'] += shocked
+
+    valuations.sort(key=lambda entry: entry['change'])
+    bank_rows = sorted((
+        {
+            'bank_name': name,
+            'valuations': bank['valuations'],
+            'plots': bank['plots'],
+            'affected_plots': bank['affected_plots'],
+            **_summary(bank['baseline'], bank['shocked']),
+        }
+        for name, bank in banks.items()
+    ), key=lambda entry: entry['change'])
+    return {
+        'rules': rules,
+        'engine': 'numpy' if use_numpy else 'python',
+        'plots': len(portfolio),
+        'affected_plots': sum(entry['affected_plots'] for entry in valuations),
+        **_summary(sum(bank['baseline'] for bank in banks.values()),
+                   sum(bank['shocked'] for bank in banks.values())),
+        'banks': bank_rows,
+        'valuations': valuations,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,251 @@
+"""
+Site-visit scheduling for valuations that have no visiting team yet.
+
+Each pending valuation is placed at the mean coordinates of its plots, or
+only by the district, municipality and ward of its first property when no
+plot has coordinates. Visits are chained nearest-neighbour, first within each
+ward and then from ward to ward across a district, and the chain is cut into
+days of at most `capacity` stops. Routes never cross a district boundary.
+Each crew takes a contiguous run of those days so it stays in one area, and
+the assignments are written with one bulk_create, after re-checking inside
+the transaction that nobody assigned those valuations meanwhile.
+
+Distances are great-circle metres (geometry.haversine). Without coordinates
+they are estimated from ward numbers within a municipality. Large sets of
+located visits are searched along a sorted axis with bisect rather than by
+comparing every pair, so one ward of thousands of visits still plans in
+about a second.
+
+Only valuations dated within the last PENDING_DAYS count as pending; older
+reports without a visiting team are historical, not waiting for a visit.
+"""
+import bisect
+import math
+from collections import namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Exists, OuterRef
+from django.utils import timezone
+from . import geometry
+from .autocomplete import fold
+from .models import Plot, Property, Valuation, VisitingTeam
+
+DEFAULT_CAPACITY = 6
+# Saturday is the weekly holiday in Nepal (date.weekday() numbering)
+REST_WEEKDAYS = {5}
+# Estimated travel between wards of a municipality, and between municipalities
+WARD_DISTANCE_M = 1500
+MUNICIPALITY_DISTANCE_M = 20000
+PENDING_DAYS = getattr(settings, 'REPORT_SCHEDULE_PENDING_DAYS', 90)
+# Below this many points a plain scan is as quick as sorting them
+SWEEP_MIN_POINTS = 64
+
+Visit = namedtuple('Visit', 'valuation_id report_number district municipality ward_no lat lng')
+Member = namedtuple('Member', 'member_name designation contact_number user')
+
+
+def locality(visit):
+    """Grouping key: folded district and municipality, and the ward"""
+    return fold(visit.district), fold(visit.municipality), visit.ward_no
+
+
+def unassigned_valuations():
+    """Valuations nobody has been assigned to visit"""
+    return Valuation.objects.filter(~Exists(VisitingTeam.objects.filter(valuation=OuterRef('pk'))))
+
+
+def pending_valuations(since=None):
+    """Unassigned valuations dated on or after `since` (default: the last PENDING_DAYS)"""
+    if since is None:
+        since = timezone.localdate() - timedelta(days=PENDING_DAYS)
+    return unassigned_valuations().filter(val_date__gte=since)
+
+
+def pending_visits(district=None, bank_name=None, since=None):
+    """One Visit per pending valuation that has a property to visit (two queries)"""
+    valuations = pending_valuations(since)
+    if bank_name:
+        valuations = valuations.filter(bank_name__iexact=bank_name)
+    centres = {
+        row['property__valuation_id']: (float(row['lat']), float(row['lng']))
+        for row in Plot.objects.filter(
+            property__valuation__in=valuations, latitude__isnull=False, longitude__isnull=False,
+        ).order_by().values('property__valuation_id').annotate(lat=Avg('latitude'), lng=Avg('longitude'))
+    }
+    visits = {}
+    for valuation_id, report_number, district_name, municipality, ward_no in Property.objects.filter(
+        valuation__in=valuations
+    ).order_by('valuation_id', 'pk').values_list(
+        'valuation_id', 'valuation__report_number', 'district', 'municipality', 'ward_no',
+    ):
+        if valuation_id not in visits:
+            lat, lng = centres.get(valuation_id, (None, None))
+            visits[valuation_id] = Visit(valuation_id, report_number, district_name, municipality, ward_no,
+                                         lat, lng)
+    if district:
+        return [visit for visit in visits.values() if fold(visit.district) == fold(district)]
+    return list(visits.values())
+
+
+def distance(a, b):
+    """Metres between two visits, estimated from their wards without coordinates"""
+    if a.lat is not None and b.lat is not None:
+        return geometry.haversine(a.lat, a.lng, b.lat, b.lng)
+    if locality(a)[:2] == locality(b)[:2]:
+        return abs(a.ward_no - b.ward_no) * WARD_DISTANCE_M
+    return MUNICIPALITY_DISTANCE_M
+
+
+def nearest_neighbour(points, start):
+    """Order points by repeatedly moving to the nearest unvisited one, from `start`"""
+    remaining = list(points)
+    if len(remaining) >= SWEEP_MIN_POINTS and all(point.lat is not None for point in remaining):
+        return _sweep_nearest_neighbour(remaining, start)
+    route = []
+    last = start
+    while remaining:
+        index = min(range(len(remaining)), key=lambda i: distance(last, remaining[i]))
+        last = remaining.pop(index)
+        route.append(last)
+    return route
+
+
+def _sweep_nearest_neighbour(points, start):
+    """
+    nearest_neighbour for located points, kept sorted along their wider axis:
+    the search walks outward from the last stop with bisect and stops once
+    the distance along that axis alone exceeds the best candidate
+    """
+    lats = [point.lat for point in points]
+    lngs = [point.lng for point in points]
+    # Metres per degree, rounded down so axis gaps never exceed true distances
+    lat_m = geometry.METRES_PER_DEGREE_LAT * 0.99
+    lng_m = lat_m * math.cos(math.radians(max(map(abs, lats))))
+    if (max(lats) - min(lats)) * lat_m >= (max(lngs) - min(lngs)) * lng_m:
+        def axis(point):
+            return point.lat * lat_m
+    else:
+        def axis(point):
+            return point.lng * lng_m
+
+    remaining = sorted(points, key=axis)
+    keys = [axis(point) for point in remaining]
+    route = []
+    last = start
+    while remaining:
+        if last.lat is None:
+            # Entering from a ward without coordinates: any first stop is as good
+            best = min(range(len(remaining)), key=lambda i: distance(last, remaining[i]))
+        else:
+            x = axis(last)
+            high = bisect.bisect_left(keys, x)
+            low = high - 1
+            best, best_distance = None, math.inf
+            while low >= 0 or high < len(keys):
+                if high < len(keys) and (low < 0 or keys[high] - x <= x - keys[low]):
+                    index, high = high, high + 1
+                else:
+                    index, low = low, low - 1
+                # Farther along the axis than the best stop: nothing closer remains
+                if abs(keys[index] - x) >= best_distance:
+                    break
+                metres = distance(last, remaining[index])
+                if metres < best_distance:
+                    best, best_distance = index, metres
+        last = remaining.pop(best)
+        del keys[best]
+        route.append(last)
+    return route
+
+
+def _centre(visits):
+    """A visit-like point at the mean coordinates of the located visits"""
+    located = [visit for visit in visits if visit.lat is not None]
+    lat = sum(visit.lat for visit in located) / len(located) if located else None
+    lng = sum(visit.lng for visit in located) / len(located) if located else None
+    return visits[0]._replace(lat=lat, lng=lng)
+
+
+def district_chain(visits):
+    """Every visit of one district in travel order"""
+    wards = {}
+    for visit in sorted(visits, key=lambda visit: (locality(visit), visit.valuation_id)):
+        wards.setdefault(locality(visit), []).append(visit)
+    centres = [_centre(members) for members in wards.values()]
+
+    chain = []
+    for centre in nearest_neighbour(centres, centres[0]):
+        members = wards[locality(centre)]
+        located = [visit for visit in members if visit.lat is not None]
+        # Enter the ward at the stop nearest to where the previous ward ended
+        chain.extend(nearest_neighbour(located, chain[-1] if chain else centre))
+        chain.extend(visit for visit in members if visit.lat is None)
+    return chain
+
+
+def working_days(start, count):
+    days = []
+    day = start
+    while len(days) < count:
+        if day.weekday() not in REST_WEEKDAYS:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def plan(visits, crews, start, days, capacity=DEFAULT_CAPACITY):
+    """
+    Day routes for `crews` over `days` working days from `start`; returns
+    (routes, unscheduled visits). A route is a dict with crew (index into
+    crews), date, district, visits in stop order and distance_m.
+    """
+    districts = {}
+    for visit in visits:
+        districts.setdefault(fold(visit.district), []).append(visit)
+    routes = []
+    for key in sorted(districts):
+        chain = district_chain(districts[key])
+        for offset in range(0, len(chain), capacity):
+            stops = chain[offset:offset + capacity]
+            routes.append({
+                'district': stops[0].district,
+                'visits': stops,
+                'distance_m': sum(distance(a, b) for a, b in zip(stops, stops[1:])),
+            })
+
+    # Contiguous runs of the chain per crew, spread so every crew finishes early
+    dates = working_days(start, days)
+    per_crew = min(days, math.ceil(len(routes) / len(crews))) if crews and routes else 0
+    scheduled = routes[:per_crew * len(crews)]
+    for number, route in enumerate(scheduled):
+        route['crew'], day = divmod(number, per_crew)
+        route['date'] = dates[day]
+    unscheduled = [visit for route in routes[len(scheduled):] for visit in route['visits']]
+    return scheduled, unscheduled
+
+
+def assign(routes, crews):
+    """
+    Create the VisitingTeam rows of planned routes. Valuations assigned since
+    they were planned (by another run or by hand) are skipped and returned.
+    """
+    planned = [visit.valuation_id for route in routes for visit in route['visits']]
+    with transaction.atomic():
+        # Lock the planned valuations, then see which are still unassigned
+        list(Valuation.objects.select_for_update().filter(pk__in=planned).values_list('pk', flat=True))
+        pending = set(unassigned_valuations().filter(pk__in=planned).values_list('pk', flat=True))
+        rows = []
+        for route in routes:
+            visits = [visit for visit in route['visits'] if visit.valuation_id in pending]
+            rows.extend(
+                VisitingTeam(
+                    valuation_id=visit.valuation_id, member_name=member.member_name,
+                    designation=member.designation, contact_number=member.contact_number, user=member.user,
+                    visit_date=route['date'], route_order=stop,
+                )
+                for stop, visit in enumerate(visits, 1)
+                for member in crews[route['crew']]
+            )
+        VisitingTeam.objects.bulk_create(rows, batch_size=1000)
+    return [visit for route in routes for visit in route['visits'] if visit.valuation_id not in pending]
@@ -0,0 +1,85 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from .models import Valuation, Property, Owner, Plot, VisitingTeam
+from . import autocomplete, collateral, identity, querycache, sync
+
+
+@receiver(post_save, sender=Owner)
+def index_owner_identity(sender, instance, raw=False, **kwargs):
+    """Keep the party index in sync with owner ID numbers"""
+    if raw:
+        return
+    identity.sync_owner(instance)
+
+
+@receiver(post_save, sender=Valuation)
+def index_borrower_identity(sender, instance, raw=False, **kwargs):
+    """Keep the party index in sync with borrower ID numbers"""
+    if raw:
+        return
+    identity.sync_borrower(instance)
+
+
+@receiver(post_save, sender=Property)
+def reindex_property_owners(sender, instance, created=False, raw=False, **kwargs):
+    """Follow a property that was moved to another valuation"""
+    if raw or created:
+        return
+    identity.sync_property(instance)
+
+
+@receiver(post_save, sender=Property)
+def rekey_property_plots(sender, instance, created=False, raw=False, **kwargs):
+    """Keep plot parcel keys in step with the property's district, municipality and ward"""
+    if raw or created:
+        return
+    collateral.refresh_property(instance)
+
+
+@receiver(post_save, sender=Owner)
+@receiver(post_save, sender=Plot)
+@receiver(post_delete, sender=Owner)
+@receiver(post_delete, sender=Plot)
+def touch_parent_property(sender, instance, raw=False, **kwargs):
+    """Bump the property version so its cached report fragment is rebuilt"""
+    if raw:
+        return
+    Property.touch(instance.property_id)
+
+
+@receiver(post_init, sender=Valuation)
+@receiver(post_init, sender=Property)
+def remember_autocomplete_values(sender, instance, **kwargs):
+    """Keep the loaded bank/district values so saves only record real changes"""
+    autocomplete.remember_values(instance)
+
+
+@receiver(post_save, sender=Valuation)
+@receiver(post_save, sender=Property)
+def record_autocomplete_values(sender, instance, created=False, raw=False, **kwargs):
+    """Feed new or changed bank/district spellings into the in-memory prefix index"""
+    if raw:
+        return
+    autocomplete.record_changes(instance, created)
+
+
+@receiver(post_delete, sender=Valuation)
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=Owner)
+@receiver(post_delete, sender=Plot)
+@receiver(post_delete, sender=VisitingTeam)
+def record_sync_tombstone(sender, instance, **kwargs):
+    """Let field devices know the row is gone"""
+    sync.record_tombstone(instance)
+
+
+def invalidate_query_cache(sender, using=None, **kwargs):
+    """Cached querysets reading the written table miss from now on"""
+    querycache.invalidate(sender, using=using)
+
+
+# Only for cached models: any post_delete receiver turns off Django's fast
+# (unloaded) cascade deletes for its sender
+for model in querycache.cached_models():
+    post_save.connect(invalidate_query_cache, sender=model, dispatch_uid='invalidate_query_cache')
+    post_delete.connect(invalidate_query_cache, sender=model, dispatch_uid='invalidate_query_cache')
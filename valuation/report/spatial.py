@@ -0,0 +1,191 @@
+"""
+Spatial lookups over plot locations.
+
+On SQLite, plot bounding boxes are mirrored into an R*Tree virtual table by
+triggers, so every write path (save, bulk_update, cascading deletes, raw SQL)
+keeps the index current. Other databases fall back to the bbox B-tree index.
+Candidates from the index are then checked exactly in Python.
+"""
+import math
+from django.db import DatabaseError, connections, router
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.db.models.expressions import RawSQL
+from . import geometry
+from .models import Plot
+
+RTREE_TABLE = 'report_plot_rtree'
+
+# Triggers are dropped whenever Django rebuilds report_plot during a migration,
+# so this DDL is idempotent and re-run after every migrate (see apps.py)
+RTREE_DDL = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lng, max_lng, min_lat, max_lat)',
+    f'''CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_insert AFTER INSERT ON report_plot
+        WHEN NEW.min_lat IS NOT NULL BEGIN
+            INSERT OR REPLACE INTO {RTREE_TABLE} VALUES (NEW.id, NEW.min_lng, NEW.max_lng, NEW.min_lat, NEW.max_lat);
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_update AFTER UPDATE OF min_lat, max_lat, min_lng, max_lng ON report_plot
+        BEGIN
+            DELETE FROM {RTREE_TABLE} WHERE id = OLD.id;
+            INSERT INTO {RTREE_TABLE} SELECT NEW.id, NEW.min_lng, NEW.max_lng, NEW.min_lat, NEW.max_lat
+                WHERE NEW.min_lat IS NOT NULL;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_delete AFTER DELETE ON report_plot
+        BEGIN
+            DELETE FROM {RTREE_TABLE} WHERE id = OLD.id;
+        END''',
+]
+
+# Upper bound on plots returned to map views
+FEATURE_LIMIT = 1000
+MAX_RADIUS_M = 50000
+# A radius query with a limit reads this many times the limit of the boxes
+# nearest the point, so a wide radius never loads the whole plot table
+CANDIDATE_FACTOR = 4
+
+_rtree_available = {}
+
+
+def install_index(using='default'):
+    """
+    Create (or repair) the R*Tree mirror of plot bounding boxes. When any
+    trigger is missing the tree is refilled from report_plot.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [RTREE_TABLE, f'{RTREE_TABLE}_insert', f'{RTREE_TABLE}_update', f'{RTREE_TABLE}_delete'],
+        )
+        if cursor.fetchone()[0] == 4:
+            _rtree_available[using] = True
+            return True
+        try:
+            for statement in RTREE_DDL:
+                cursor.execute(statement)
+        except DatabaseError:
+            # SQLite built without the R*Tree module
+            _rtree_available[using] = False
+            return False
+        cursor.execute(f'DELETE FROM {RTREE_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {RTREE_TABLE} SELECT id, min_lng, max_lng, min_lat, max_lat '
+            f'FROM report_plot WHERE min_lat IS NOT NULL'
+        )
+    _rtree_available[using] = True
+    return True
+
+
+def ensure_index(sender, using='default', **kwargs):
+    """post_migrate hook"""
+    if router.allow_migrate_model(using, Plot):
+        install_index(using)
+
+
+def has_rtree(using):
+    if using not in _rtree_available:
+        connection = connections[using]
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [RTREE_TABLE])
+                available = cursor.fetchone() is not None
+        _rtree_available[using] = available
+    return _rtree_available[using]
+
+
+def in_bbox(min_lng, min_lat, max_lng, max_lat, queryset=None):
+    """Plots whose bounding box intersects the given box"""
+    queryset = Plot.objects.all() if queryset is None else queryset
+    using = queryset.db
+    queryset = queryset.filter(
+        min_lng__lte=max_lng, max_lng__gte=min_lng,
+        min_lat__lte=max_lat, max_lat__gte=min_lat,
+    )
+    if has_rtree(using):
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT id FROM {RTREE_TABLE} '
+            f'WHERE max_lng >= %s AND min_lng <= %s AND max_lat >= %s AND min_lat <= %s',
+            [min_lng, max_lng, min_lat, max_lat],
+        ))
+    return queryset
+
+
+def plot_ring(plot, projection):
+    """Projected boundary of a plot, or None when it only has a point"""
+    if plot.boundary:
+        return projection.ring(geometry.parse_polygon(plot.boundary))
+    return None
+
+
+def distance_to_plot(plot, lat, lng, projection):
+    ring = plot_ring(plot, projection)
+    if ring is None:
+        return geometry.haversine(lat, lng, plot.min_lat, plot.min_lng)
+    return geometry.distance_to_ring(projection.point(lng, lat), ring)
+
+
+def box_distance(lat, lng):
+    """Squared distance in degrees from a point to the centre of each plot's box, for ordering"""
+    dlat = (F('min_lat') + F('max_lat')) / 2 - lat
+    dlng = ((F('min_lng') + F('max_lng')) / 2 - lng) * math.cos(math.radians(lat))
+    return ExpressionWrapper(dlat * dlat + dlng * dlng, output_field=FloatField())
+
+
+def within_radius(lat, lng, metres, queryset=None, limit=None):
+    """
+    (plot, distance in metres) for plots within `metres` of a point, nearest
+    first. With a limit, at most that many from the limit * CANDIDATE_FACTOR
+    plots whose boxes are nearest.
+    """
+    projection = geometry.Projection(lat)
+    candidates = in_bbox(*geometry.radius_bounds(lat, lng, metres), queryset=queryset)
+    if limit is not None:
+        candidates = candidates.annotate(box_distance=box_distance(lat, lng)).order_by(
+            'box_distance', 'pk'
+        )[:limit * CANDIDATE_FACTOR]
+    matches = []
+    for plot in candidates:
+        distance = distance_to_plot(plot, lat, lng, projection)
+        if distance <= metres:
+            matches.append((plot, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches[:limit]
+
+
+def overlapping(boundary, queryset=None, exclude=None):
+    """Plots whose boundary shares area with a GeoJSON polygon"""
+    ring = geometry.parse_polygon(boundary)
+    min_lng, min_lat, max_lng, max_lat = geometry.ring_bounds(ring)
+    projection = geometry.Projection((min_lat + max_lat) / 2)
+    projected = projection.ring(ring)
+    candidates = in_bbox(min_lng, min_lat, max_lng, max_lat, queryset=queryset).filter(boundary__isnull=False)
+    if exclude is not None:
+        candidates = candidates.exclude(pk=exclude)
+    return [
+        plot for plot in candidates
+        if geometry.rings_overlap(projected, plot_ring(plot, projection))
+    ]
+
+
+def feature(plot, **extra):
+    """GeoJSON Feature for a plot (select_related property__valuation)"""
+    if plot.boundary:
+        shape = plot.boundary
+    else:
+        shape = {'type': 'Point', 'coordinates': [plot.min_lng, plot.min_lat]}
+    return {
+        'type': 'Feature',
+        'id': plot.pk,
+        'geometry': shape,
+        'properties': {
+            'plot_number': plot.plot_number,
+            'property_id': plot.property_id,
+            'property_name': plot.property.name,
+            'valuation_id': plot.property.valuation_id,
+            'bank_name': plot.property.valuation.bank_name,
+            'fair_market_value': str(plot.fair_market_value),
+            **extra,
+        },
+    }
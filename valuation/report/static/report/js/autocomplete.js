@@ -0,0 +1,58 @@
+// Autocomplete for bank, branch, district and municipality inputs
+// Suggestions come from the server-side prefix index; requests are debounced
+// and stale responses are discarded so typing never waits on the network.
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[data-autocomplete-url]').forEach(initializeAutocomplete);
+});
+
+function initializeAutocomplete(input) {
+    const DEBOUNCE_MS = 150;
+    const url = input.dataset.autocompleteUrl;
+    const datalist = document.createElement('datalist');
+    datalist.id = `${input.id || input.name}-suggestions`;
+    input.after(datalist);
+    input.setAttribute('list', datalist.id);
+
+    const cache = {};
+    let timer = null;
+    let controller = null;
+
+    function showSuggestions(results) {
+        datalist.innerHTML = '';
+        results.forEach(value => {
+            const option = document.createElement('option');
+            option.value = value;
+            datalist.appendChild(option);
+        });
+    }
+
+    function fetchSuggestions(prefix) {
+        if (cache[prefix]) {
+            showSuggestions(cache[prefix]);
+            return;
+        }
+        if (controller) controller.abort();
+        controller = new AbortController();
+
+        fetch(`${url}?q=${encodeURIComponent(prefix)}`, { signal: controller.signal })
+            .then(response => response.ok ? response.json() : { results: [] })
+            .then(data => {
+                cache[prefix] = data.results;
+                if (input.value.trim() === prefix) showSuggestions(data.results);
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') console.warn('Autocomplete failed', error);
+            });
+    }
+
+    input.addEventListener('input', function() {
+        const prefix = this.value.trim();
+        clearTimeout(timer);
+        if (!prefix) {
+            showSuggestions([]);
+            return;
+        }
+        timer = setTimeout(() => fetchSuggestions(prefix), DEBOUNCE_MS);
+    });
+}
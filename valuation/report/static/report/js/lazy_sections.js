@@ -0,0 +1,51 @@
+// Owner and plot tables of the valuation detail page, loaded on demand
+// The page itself only carries each property's header and totals; a section's
+// fragments are fetched the first time it is opened. The fragment views answer
+// with ETags, so reopening the page revalidates instead of re-downloading.
+
+document.addEventListener('DOMContentLoaded', function() {
+    const sections = document.querySelectorAll('[data-lazy-section]');
+
+    function load(container) {
+        if (container.dataset.loaded) return Promise.resolve();
+        container.dataset.loaded = 'loading';
+        container.innerHTML = '<div class="text-muted small mt-3"><i class="fas fa-spinner fa-spin me-2"></i>Loading...</div>';
+        return fetch(container.dataset.fragmentUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => {
+                if (!response.ok) throw new Error(response.statusText);
+                return response.text();
+            })
+            .then(html => {
+                container.innerHTML = html;
+                container.dataset.loaded = 'done';
+            })
+            .catch(() => {
+                delete container.dataset.loaded;
+                container.innerHTML = '<div class="alert alert-danger mt-3">Could not load this section. Open it again to retry.</div>';
+            });
+    }
+
+    function open(section, expanded) {
+        const toggle = section.querySelector('[data-lazy-toggle]');
+        const body = section.querySelector('[data-lazy-body]');
+        body.hidden = !expanded;
+        toggle.setAttribute('aria-expanded', expanded);
+        toggle.querySelector('i').className = `fas fa-chevron-${expanded ? 'up' : 'down'} me-1`;
+        if (expanded) body.querySelectorAll('[data-fragment-url]').forEach(load);
+    }
+
+    sections.forEach(section => {
+        const toggle = section.querySelector('[data-lazy-toggle]');
+        toggle.addEventListener('click', function() {
+            open(section, toggle.getAttribute('aria-expanded') !== 'true');
+        });
+    });
+
+    // A single property, or one linked to by #property-<pk>, opens straight away
+    const linked = location.hash && document.querySelector(`[data-lazy-section]#${CSS.escape(location.hash.slice(1))}`);
+    if (linked) {
+        open(linked, true);
+    } else if (sections.length === 1) {
+        open(sections[0], true);
+    }
+});
@@ -0,0 +1,125 @@
+// Row editor for the plots of a large property
+// Every row is its own small form: saving or deleting a plot posts just that
+// row and updates its computed figures and the property totals in place.
+
+document.addEventListener('DOMContentLoaded', function() {
+    const table = document.getElementById('plot-rows');
+    if (!table) return;
+
+    const formatNumber = value => parseFloat(value || 0).toLocaleString('en-IN', {
+        minimumFractionDigits: 2,
+        maximumFractionDigits: 2
+    });
+
+    function csrfToken(form) {
+        const input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+        return input ? input.value : '';
+    }
+
+    function rowOf(form) {
+        return table.querySelector(`tr[data-plot-row="${form.id}"]`);
+    }
+
+    function setStatus(row, message, isError) {
+        const status = row.querySelector('[data-row-status]');
+        if (!status) return;
+        status.textContent = message;
+        status.className = 'small ' + (isError ? 'text-danger' : 'text-success');
+    }
+
+    function showErrors(form, row, errors) {
+        const messages = [];
+        Object.entries(errors).forEach(([field, fieldErrors]) => {
+            const input = document.getElementById(`id_${form.id}_${field}`);
+            if (input) input.classList.add('is-invalid');
+            fieldErrors.forEach(error => messages.push(error.message));
+        });
+        setStatus(row, messages.join(' '), true);
+    }
+
+    function updateTotals(totals) {
+        document.querySelectorAll('[data-total]').forEach(element => {
+            const value = totals[element.dataset.total];
+            element.textContent = element.dataset.total === 'plots' ? value : formatNumber(value);
+        });
+    }
+
+    function updateRow(row, plot) {
+        row.querySelectorAll('[data-value]').forEach(element => {
+            const value = plot[element.dataset.value];
+            element.textContent = element.dataset.value === 'area_display' ? value : formatNumber(value);
+        });
+    }
+
+    function post(url, form, body) {
+        return fetch(url, {
+            method: 'POST',
+            body: body,
+            headers: { 'X-CSRFToken': csrfToken(form), 'X-Requested-With': 'XMLHttpRequest' }
+        }).then(response => response.json().then(data => ({ ok: response.ok, data: data })));
+    }
+
+    function saveRow(form) {
+        const row = rowOf(form);
+        row.querySelectorAll('.is-invalid').forEach(input => input.classList.remove('is-invalid'));
+        setStatus(row, 'Saving...', false);
+
+        post(form.action, form, new FormData(form)).then(({ ok, data }) => {
+            if (!ok) {
+                showErrors(form, row, data.errors || {});
+                return;
+            }
+            updateTotals(data.totals);
+            if (form.hasAttribute('data-new-row')) {
+                // Append the saved plot as a regular row and clear the add row
+                table.tBodies[0].insertAdjacentHTML('beforeend', data.html);
+                const added = table.tBodies[0].lastElementChild.querySelector('form[data-plot-form]');
+                bindForm(added);
+                row.querySelectorAll('input').forEach(input => {
+                    if (input.getAttribute('form') === form.id) input.value = input.defaultValue;
+                });
+                setStatus(row, 'Added', false);
+            } else {
+                updateRow(row, data.plot);
+                setStatus(row, 'Saved', false);
+            }
+            if (data.duplicates && data.duplicates.length) {
+                setStatus(row, 'Parcel already pledged: ' + data.duplicates.join('; '), true);
+            }
+        }).catch(() => setStatus(row, 'Could not save, please retry', true));
+    }
+
+    function deleteRow(form) {
+        const row = rowOf(form);
+        if (!confirm('Delete this plot?')) return;
+        post(form.dataset.deleteUrl, form, new FormData()).then(({ ok, data }) => {
+            if (!ok) {
+                setStatus(row, 'Could not delete', true);
+                return;
+            }
+            row.remove();
+            updateTotals(data.totals);
+        }).catch(() => setStatus(row, 'Could not delete, please retry', true));
+    }
+
+    function bindForm(form) {
+        form.addEventListener('submit', function(event) {
+            event.preventDefault();
+            saveRow(form);
+        });
+        const row = rowOf(form);
+        const deleteButton = row.querySelector('[data-plot-delete]');
+        if (deleteButton) deleteButton.addEventListener('click', () => deleteRow(form));
+        // Enter in any input of the row saves that row
+        row.querySelectorAll('input').forEach(input => {
+            input.addEventListener('keydown', function(event) {
+                if (event.key === 'Enter') {
+                    event.preventDefault();
+                    saveRow(form);
+                }
+            });
+        });
+    }
+
+    table.querySelectorAll('form[data-plot-form]').forEach(bindForm);
+});
@@ -0,0 +1,260 @@
+"""
+Delta sync for field devices of visiting team members.
+
+Pull returns the rows of the user's assigned valuations changed after the
+device's watermark, plus tombstones of rows deleted since. Push applies a batch
+of offline edits one at a time; an edit is rejected as a conflict when the
+server row was saved after the version the device edited. Rows carry a
+version number for this: Property.updated_at also moves when its owners or
+plots change, so a device editing a plot and then its property would
+otherwise conflict with itself.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import metrics
+from .models import Owner, Plot, Property, SyncReceipt, Tombstone, Valuation, VisitingTeam
+
+# Rows committed while a pull runs may carry a slightly older updated_at, so
+# the returned watermark overlaps the previous window; devices upsert by id.
+OVERLAP_SECONDS = 5
+TOMBSTONE_DAYS = getattr(settings, 'REPORT_SYNC_TOMBSTONE_DAYS', 90)
+MAX_PUSH_CHANGES = 500
+
+# Never sent to devices: derived spatial index and parcel key columns
+INTERNAL_FIELDS = {'min_lat', 'max_lat', 'min_lng', 'max_lng', 'parcel_key'}
+
+# Sync name -> model, lookup to its valuation, parent FK for creates, fields a device may write
+MODELS = {
+    'valuation': {'model': Valuation, 'scope': 'pk', 'parent': None, 'writable': ()},
+    'property': {
+        'model': Property, 'scope': 'valuation_id', 'parent': 'valuation',
+        'writable': ('name', 'address', 'district', 'municipality', 'ward_no', 'land_type'),
+    },
+    'owner': {
+        'model': Owner, 'scope': 'property__valuation_id', 'parent': 'property',
+        'writable': ('name', 'address', 'contact_number', 'citizenship_number', 'pan_number'),
+    },
+    'plot': {
+        'model': Plot, 'scope': 'property__valuation_id', 'parent': 'property',
+        'writable': (
+            'plot_number', 'sheet_number', 'ropani', 'ana', 'paisa', 'dam', 'bigha', 'kattha', 'dhur',
+            'gov_rate_per_sqft', 'market_rate_per_sqft', 'north_boundary', 'south_boundary',
+            'east_boundary', 'west_boundary', 'latitude', 'longitude', 'boundary', 'remarks',
+        ),
+    },
+    'visiting_team': {'model': VisitingTeam, 'scope': 'valuation_id', 'parent': None, 'writable': ()},
+}
+SYNC_NAMES = {spec['model']: name for name, spec in MODELS.items()}
+
+
+class SyncError(ValueError):
+    pass
+
+
+def sync_fields(model):
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if field.attname not in INTERNAL_FIELDS
+    ]
+
+
+def serialize(row):
+    row['updated_at'] = row['updated_at'].isoformat()
+    return row
+
+
+def assigned_valuations(user, valuation_ids=None):
+    """Valuation ids the user is on the visiting team of"""
+    assigned = VisitingTeam.objects.filter(user=user)
+    if valuation_ids:
+        assigned = assigned.filter(valuation_id__in=valuation_ids)
+    return sorted(set(assigned.values_list('valuation_id', flat=True)))
+
+
+def parse_timestamp(value, name):
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise SyncError(f'{name} must be an ISO 8601 timestamp.')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def pull(user, since=None, valuation_ids=None):
+    """Rows changed and deleted after `since` (everything when it is None or too old)"""
+    now = timezone.now()
+    assigned = assigned_valuations(user, valuation_ids)
+    reset = since is None or since < now - timedelta(days=TOMBSTONE_DAYS)
+
+    # Reports assigned since the last pull are sent whole
+    fresh = [] if reset else list(VisitingTeam.objects.filter(
+        user=user, valuation_id__in=assigned, updated_at__gt=since,
+    ).values_list('valuation_id', flat=True))
+
+    changes = {}
+    for name, spec in MODELS.items():
+        rows = spec['model'].objects.filter(**{f"{spec['scope']}__in": assigned})
+        if not reset:
+            rows = rows.filter(Q(updated_at__gt=since) | Q(**{f"{spec['scope']}__in": fresh}))
+        changes[name] = [serialize(row) for row in rows.order_by('pk').values(*sync_fields(spec['model']))]
+
+    deleted = {}
+    if not reset:
+        tombstones = Tombstone.objects.filter(deleted_at__gt=since).filter(
+            Q(valuation_id__in=assigned)
+            | Q(property_id__in=Property.objects.filter(valuation_id__in=assigned).values('pk'))
+        )
+        for model, object_id in tombstones.values_list('model', 'object_id'):
+            deleted.setdefault(model, []).append(object_id)
+
+    return {
+        'watermark': (now - timedelta(seconds=OVERLAP_SECONDS)).isoformat(),
+        'reset': reset,
+        'assigned': assigned,
+        'changes': changes,
+        'deleted': deleted,
+    }
+
+
+def _row_id(value, name):
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+        raise SyncError(f'{name} must be an integer id.')
+    return value
+
+
+def _valuation_of(instance):
+    if isinstance(instance, Property):
+        return instance.valuation_id
+    return instance.property.valuation_id
+
+
+def _server_row(instance):
+    model = type(instance)
+    row = model.objects.filter(pk=instance.pk).values(*sync_fields(model)).first()
+    return serialize(row) if row else None
+
+
+def _apply(user, change, assigned, receipts):
+    name = change.get('model')
+    spec = MODELS.get(name)
+    if spec is None or not spec['writable']:
+        raise SyncError(f'{name!r} cannot be changed from a device.')
+    model = spec['model']
+    op = change.get('op', 'upsert')
+    fields = change.get('fields') or {}
+    if not isinstance(fields, dict):
+        raise SyncError('fields must be an object.')
+    unknown = set(fields) - set(spec['writable'])
+    if unknown:
+        raise SyncError(f'Fields not writable: {", ".join(sorted(unknown))}.')
+
+    object_id = _row_id(change.get('id'), 'id')
+    if not isinstance(change.get('client_id'), (str, type(None))):
+        raise SyncError('client_id must be a string.')
+    if object_id is None and change.get('client_id') in receipts:
+        # Created by an earlier (possibly retried) upload
+        object_id = receipts[change['client_id']]
+        if op != 'delete' and 'base_version' not in change:
+            return {'status': 'applied', 'id': object_id}
+
+    if object_id is None:
+        if op == 'delete':
+            raise SyncError('Deleting needs an id.')
+        if not change.get('client_id'):
+            raise SyncError('New rows need a client_id.')
+        parent_model = model._meta.get_field(spec['parent']).related_model
+        parent_id = _row_id(change.get('parent'), 'parent')
+        if parent_id is None:
+            parent_id = receipts.get(change.get('parent_client_id'))
+        parent = parent_model.objects.filter(pk=parent_id).first() if parent_id is not None else None
+        if parent is None:
+            raise SyncError('Parent row not found.')
+        instance = model(**{spec['parent']: parent})
+        if _valuation_of(instance) not in assigned:
+            return {'status': 'forbidden'}
+    else:
+        queryset = model.objects.select_for_update()
+        if model is not Property:
+            queryset = queryset.select_related('property')
+        instance = queryset.filter(pk=object_id).first()
+        if instance is None:
+            # Deleted on the server meanwhile; a delete has nothing left to do
+            return {'status': 'applied' if op == 'delete' else 'conflict', 'id': object_id, 'server': None}
+        if _valuation_of(instance) not in assigned:
+            return {'status': 'forbidden', 'id': object_id}
+        base = change.get('base_version')
+        if not isinstance(base, int) or isinstance(base, bool):
+            raise SyncError('base_version must be the version the device edited.')
+        if instance.version != base:
+            return {'status': 'conflict', 'id': object_id, 'server': _server_row(instance)}
+        if op == 'delete':
+            instance.delete()
+            return {'status': 'applied', 'id': object_id}
+
+    for field, value in fields.items():
+        setattr(instance, model._meta.get_field(field).attname, value)
+    instance.full_clean()
+    instance.save()
+    if object_id is None:
+        SyncReceipt.objects.create(client_id=change['client_id'], user=user, model=name, object_id=instance.pk)
+        receipts[change['client_id']] = instance.pk
+    return {
+        'status': 'applied', 'id': instance.pk, 'version': instance.version,
+        'updated_at': instance.updated_at.isoformat(),
+    }
+
+
+def push(user, changes):
+    """Apply offline edits in order; each succeeds or fails on its own"""
+    if not isinstance(changes, list):
+        raise SyncError('changes must be a list.')
+    if len(changes) > MAX_PUSH_CHANGES:
+        raise SyncError(f'Send at most {MAX_PUSH_CHANGES} changes per request.')
+    assigned = set(assigned_valuations(user))
+    client_ids = {
+        key for change in changes if isinstance(change, dict)
+        for key in (change.get('client_id'), change.get('parent_client_id')) if key and isinstance(key, str)
+    }
+    receipts = dict(SyncReceipt.objects.filter(user=user, client_id__in=client_ids).values_list(
+        'client_id', 'object_id'
+    ))
+
+    results = []
+    for change in changes:
+        if not isinstance(change, dict):
+            result = {'status': 'invalid', 'errors': {'__all__': ['Each change must be an object.']}}
+        else:
+            try:
+                with transaction.atomic():
+                    result = _apply(user, change, assigned, receipts)
+            except ValidationError as exc:
+                result = {'status': 'invalid', 'errors': exc.message_dict if hasattr(exc, 'error_dict')
+                          else {'__all__': exc.messages}}
+            except (SyncError, TypeError, ValueError) as exc:
+                # One malformed change must not stop the rest of the batch
+                result = {'status': 'invalid', 'errors': {'__all__': [str(exc)]}}
+            result.update(model=change.get('model'), client_id=change.get('client_id'))
+        metrics.SYNC_CHANGES.inc(str(result.get('model')), result['status'])
+        results.append(result)
+    return {'results': results}
+
+
+def record_tombstone(instance):
+    """Called on post_delete of every synced model"""
+    Tombstone.objects.create(
+        model=SYNC_NAMES[type(instance)],
+        object_id=instance.pk,
+        valuation_id=instance.pk if isinstance(instance, Valuation) else getattr(instance, 'valuation_id', None),
+        property_id=getattr(instance, 'property_id', None),
+    )
+
+
+def prune_tombstones(days=TOMBSTONE_DAYS):
+    """Drop tombstones older than the longest watermark devices may keep"""
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
@@ -0,0 +1,91 @@
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.db.models import F
+from django.utils import timezone
+from . import metrics
+from .jobs import task
+from .models import Blob, Plot, Property
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+RECALCULATED_FIELDS = ['area_sqft', 'area_sqmt', 'gov_value', 'market_value', 'fair_market_value']
+CHUNK_SIZE = 500
+THUMBNAIL_SIZE = (320, 320)
+
+
+def save_recalculated(plots):
+    """Bulk path equivalent of Plot.save() for recalculated plots"""
+    now = timezone.now()
+    for plot in plots:
+        plot.updated_at = now
+        # Sync clients editing the old figures must see a conflict
+        plot.version = F('version') + 1
+    Plot.objects.bulk_update(plots, [*RECALCULATED_FIELDS, 'updated_at', 'version'])
+    Property.touch(*{plot.property_id for plot in plots})
+
+
+def _figures(plot):
+    """Recalculated values as stored (2 decimal places)"""
+    return [round(getattr(plot, field), 2) for field in RECALCULATED_FIELDS]
+
+
+@task('recalculate_plots')
+def recalculate_plots(job, plot_ids=None):
+    """Recompute areas and values for the given plots (or every plot)"""
+    plots = Plot.objects.order_by('pk')
+    if plot_ids is not None:
+        plots = plots.filter(pk__in=plot_ids)
+    total = plots.count()
+    job.report_progress(0, total, 'Starting')
+
+    done = changed = 0
+    batch = []
+    for plot in plots.iterator(chunk_size=CHUNK_SIZE):
+        before = _figures(plot)
+        plot.calculate_areas()
+        plot.calculate_valuations()
+        done += 1
+        # Only plots whose figures moved are written back
+        if _figures(plot) != before:
+            batch.append(plot)
+        if len(batch) >= CHUNK_SIZE:
+            save_recalculated(batch)
+            changed += len(batch)
+            batch = []
+        if done % CHUNK_SIZE == 0:
+            job.report_progress(done, total, f'Recalculated {done} of {total} plots')
+
+    if batch:
+        save_recalculated(batch)
+        changed += len(batch)
+    metrics.PLOT_RECALCULATIONS.inc('changed', amount=changed)
+    metrics.PLOT_RECALCULATIONS.inc('unchanged', amount=done - changed)
+    job.report_progress(done, total, f'Recalculated {done} plots, {changed} changed')
+    return {'plots': done, 'changed': changed}
+
+
+@task('make_thumbnail')
+def make_thumbnail(job, blob_id):
+    """JPEG thumbnail of an image attachment (needs Pillow: pip install Pillow)"""
+    blob = Blob.objects.filter(pk=blob_id).first()
+    if blob is None or blob.thumbnail:
+        return {'thumbnail': blob.thumbnail.name if blob else None}
+    if Image is None:
+        return {'thumbnail': None, 'skipped': 'Pillow is not installed'}
+
+    output = BytesIO()
+    try:
+        with blob.file.open('rb') as handle, Image.open(handle) as image:
+            # Phone photos are stored sideways with an EXIF rotation
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(THUMBNAIL_SIZE)
+            image.convert('RGB').save(output, 'JPEG', quality=80, optimize=True)
+    except UnidentifiedImageError:
+        # Retrying cannot help; the page shows a file icon instead
+        return {'thumbnail': None, 'skipped': 'Not a readable image'}
+    blob.thumbnail.save('thumbnail.jpg', ContentFile(output.getvalue()), save=False)
+    Blob.objects.filter(pk=blob.pk).update(thumbnail=blob.thumbnail.name)
+    return {'thumbnail': blob.thumbnail.name}
@@ -1,3 +1,671 @@
-from django.test import TestCase
+"""
+Query budgets for every page of the app and of its admin, followed by
+behaviour tests for the pieces those budgets cannot see.
 
-# Create your tests here.
+Each page is requested against a small fixture and again after the fixture has
+grown, and must run the same number of queries both times, within its budget.
+A failing page prints the SQL it ran, so N+1 patterns show up immediately.
+"""
+import itertools
+import json
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import (archive, attachments, autocomplete, collateral, columnar, identity, jobs, querycache, routers,
+               scenarios, scheduling, spatial, sync)
+from .models import ArchivedValuation, Attachment, Blob, Job, Owner, Plot, Property, Valuation, VisitingTeam
+from .urls import urlpatterns
+
+# Most queries each page may run, including the session and user lookups.
+# Every view in report/urls.py needs an entry.
+BUDGETS = {
+    'report:dashboard': 6,
+    'report:valuation_list': 4,
+    'report:valuation_create': 2,
+    'report:valuation_detail': 7,
+    'report:property_list': 3,
+    'report:property_add': 3,
+    'report:property_edit': 7,
+    'report:property_plots': 5,
+    'report:property_owners_fragment': 3,
+    'report:property_plots_fragment': 3,
+    'report:plot_row_create': 5,
+    'report:plot_row_update': 5,
+    'report:plot_row_delete': 8,
+    'report:plot_list': 3,
+    'report:owner_list': 3,
+    'report:party_exposure': 4,
+    'report:party_exposure_api': 3,
+    'report:plot_map_api': 1,
+    'report:plot_overlap_api': 1,
+    'report:scenario_api': 4,
+    'report:sync_pull': 8,
+    'report:sync_push': 9,
+    'report:autocomplete': 1,
+    'report:metrics': 0,
+    'report:job_list': 3,
+    'report:job_status': 3,
+    'report:attachment_upload': 6,
+    'report:attachment_delete': 3,
+    'report:attachment_file': 1,
+    'report:attachment_thumbnail': 1,
+}
+ADMIN_BUDGET = 8
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='report-tests-')
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 64
+
+
+def format_queries(queries):
+    return '\n'.join(f'{number:>3}. {query["sql"]}' for number, query in enumerate(queries, 1))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTestCase(TestCase):
+    """Builds the fixture in two sizes and compares the queries of each request"""
+    SMALL = 1
+    LARGE = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('budget', 'budget@example.com', 'budget')
+        blob, _ = attachments.store(SimpleUploadedFile('site.jpg', JPEG))
+        blob.thumbnail.save('thumbnail.jpg', ContentFile(JPEG))
+        cls.blob = blob
+        cls.valuation = cls.add_valuation(0)
+        cls.grow(cls.valuation, cls.SMALL)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def add_valuation(cls, number):
+        return Valuation.objects.create(
+            report_number=f'VR-{number:04d}', bank_name=f'Bank {number % 3}', bank_branch='Main',
+            borrower_name=f'Borrower {number}', borrower_citizenship=f'12-01-{number:05d}',
+        )
+
+    @classmethod
+    def grow(cls, valuation, count):
+        """Add `count` properties, each with owners, plots and attachments, and team members"""
+        for number in range(count):
+            property = Property.objects.create(
+                valuation=valuation, name=f'Property {number}', address='Ward 4', district='Kathmandu',
+                municipality='Kathmandu', ward_no=4, land_type='residential',
+            )
+            for owner in range(2):
+                Owner.objects.create(property=property, name=f'Owner {owner}', address='Ward 4',
+                                     citizenship_number=f'27-01-{property.pk:04d}{owner}')
+            for plot in range(2):
+                Plot.objects.create(property=property, plot_number=f'{property.pk}-{plot}', ropani=1,
+                                    market_rate_per_sqft=1000, gov_rate_per_sqft=400,
+                                    latitude='27.700000', longitude=f'85.3{property.pk:03d}{plot}')
+            Attachment.objects.create(valuation=valuation, property=property, blob=cls.blob,
+                                      original_name='site.jpg')
+            VisitingTeam.objects.create(valuation=valuation, member_name=f'Member {number}',
+                                        designation='Valuer', user=cls.user)
+            Job.objects.create(name='recalculate_plots', created_by=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.client_ids = itertools.count()
+
+    def enlarge(self):
+        self.grow(self.valuation, self.LARGE - self.SMALL)
+        for number in range(1, self.LARGE):
+            self.grow(self.add_valuation(number), self.LARGE)
+
+    def measure(self, request):
+        cache.clear()
+        autocomplete.reset()
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500)
+        return context.captured_queries
+
+    def assertFlat(self, requests, budget):
+        """Every request runs as many queries at LARGE as at SMALL, within budget(name)"""
+        # Warm per-process caches (content types, permissions) first
+        for request in requests().values():
+            self.measure(request)
+        small = {name: self.measure(request) for name, request in requests().items()}
+        self.enlarge()
+        large = {name: self.measure(request) for name, request in requests().items()}
+        for name, queries in large.items():
+            with self.subTest(page=name):
+                self.assertEqual(
+                    len(queries), len(small[name]),
+                    f'{name} ran {len(small[name])} queries with {self.SMALL} row(s) per level and '
+                    f'{len(queries)} with {self.LARGE}:\n{format_queries(queries)}',
+                )
+                self.assertLessEqual(
+                    len(queries), budget(name),
+                    f'{name} ran {len(queries)} queries, over its budget of {budget(name)}:\n'
+                    f'{format_queries(queries)}',
+                )
+
+
+class ViewQueryBudgetTests(QueryBudgetTestCase):
+
+    def requests(self):
+        client = self.client
+        valuation = self.valuation
+        property = valuation.properties.order_by('pk').first()
+        job = Job.objects.order_by('pk').first()
+
+        def get(name, *args, query=''):
+            return lambda: client.get(reverse(name, args=args) + query)
+
+        def post_json(name, body):
+            return lambda: client.post(reverse(name), json.dumps(body() if callable(body) else body),
+                                       content_type='application/json')
+
+        def upload():
+            return client.post(reverse('report:attachment_upload', args=[valuation.pk]), {
+                'files': SimpleUploadedFile('site.jpg', JPEG), 'target': f'property-{property.pk}',
+            })
+
+        def delete():
+            attachment = Attachment.objects.create(valuation=valuation, blob=self.blob, original_name='x.jpg')
+            return client.post(reverse('report:attachment_delete', args=[attachment.pk]))
+
+        def plot_row(number):
+            return {'plot_number': number, 'sheet_number': '102-1', 'ropani': 1, 'ana': 2, 'paisa': 0,
+                    'dam': 0, 'bigha': 0, 'kattha': 0, 'dhur': 0,
+                    'market_rate_per_sqft': 1000, 'gov_rate_per_sqft': 400}
+
+        def create_row():
+            return client.post(reverse('report:plot_row_create', args=[property.pk]),
+                               plot_row(f'row-{next(self.client_ids)}'))
+
+        def delete_row():
+            plot = Plot.objects.create(property=property, plot_number=f'row-{next(self.client_ids)}', ropani=1)
+            return client.post(reverse('report:plot_row_delete', args=[plot.pk]))
+
+        plot = property.plots.order_by('pk').first()
+
+        return {
+            'report:dashboard': get('report:dashboard'),
+            'report:valuation_list': get('report:valuation_list', query='?q=VR&fy=2081/82'),
+            'report:valuation_create': get('report:valuation_create'),
+            'report:valuation_detail': get('report:valuation_detail', valuation.pk),
+            'report:property_list': get('report:property_list'),
+            'report:property_add': get('report:property_add', valuation.pk),
+            'report:property_edit': get('report:property_edit', property.pk),
+            'report:property_plots': get('report:property_plots', property.pk),
+            'report:property_owners_fragment': get('report:property_owners_fragment', property.pk),
+            'report:property_plots_fragment': get('report:property_plots_fragment', property.pk),
+            'report:plot_row_create': create_row,
+            'report:plot_row_update': lambda: client.post(
+                reverse('report:plot_row_update', args=[plot.pk]), plot_row(plot.plot_number)),
+            'report:plot_row_delete': delete_row,
+            'report:plot_list': get('report:plot_list'),
+            'report:owner_list': get('report:owner_list'),
+            'report:party_exposure': get('report:party_exposure', query='?citizenship=12-01-00000'),
+            'report:party_exposure_api': get('report:party_exposure_api', query='?citizenship=12-01-00000'),
+            'report:plot_map_api': get('report:plot_map_api', query='?bbox=85,27,86,28'),
+            'report:plot_map_api radius': get('report:plot_map_api', query='?lat=27.7&lng=85.3&radius=5000'),
+            'report:plot_overlap_api': post_json('report:plot_overlap_api', {'type': 'Polygon', 'coordinates': [
+                [[85.29, 27.69], [85.4, 27.69], [85.4, 27.71], [85.29, 27.71], [85.29, 27.69]],
+            ]}),
+            'report:scenario_api': post_json('report:scenario_api', {'rules': [
+                {'district': 'Kathmandu', 'market_pct': -10},
+            ]}),
+            'report:sync_pull': get('report:sync_pull'),
+            'report:sync_push': post_json('report:sync_push', lambda: {'changes': [{
+                'model': 'property', 'client_id': f'budget-{next(self.client_ids)}', 'parent': valuation.pk,
+                'fields': {'name': 'New'},
+            }]}),
+            'report:autocomplete': get('report:autocomplete', 'district', query='?q=Kat'),
+            'report:metrics': get('report:metrics'),
+            'report:job_list': get('report:job_list'),
+            'report:job_status': get('report:job_status', job.pk),
+            'report:attachment_upload': upload,
+            'report:attachment_delete': delete,
+            'report:attachment_file': get('report:attachment_file', self.blob.sha256, query='?name=site.jpg'),
+            'report:attachment_thumbnail': get('report:attachment_thumbnail', self.blob.sha256),
+        }
+
+    def test_every_view_has_a_budget(self):
+        covered = {name.split()[0] for name in self.requests()}
+        for pattern in urlpatterns:
+            self.assertIn(f'report:{pattern.name}', covered)
+            self.assertIn(f'report:{pattern.name}', BUDGETS)
+
+    def test_views_run_a_fixed_number_of_queries(self):
+        self.assertFlat(self.requests, lambda name: BUDGETS[name.split()[0]])
+
+
+class AdminQueryBudgetTests(QueryBudgetTestCase):
+
+    def requests(self):
+        pages = {}
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label != 'report':
+                continue
+            info = (model._meta.app_label, model._meta.model_name)
+            pages[f'{model.__name__} changelist'] = self.get(reverse('admin:%s_%s_changelist' % info))
+            first = model.objects.order_by('pk').first()
+            if first is not None:
+                pages[f'{model.__name__} change'] = self.get(reverse('admin:%s_%s_change' % info, args=[first.pk]))
+            if model_admin.has_add_permission(self.request()):
+                pages[f'{model.__name__} add'] = self.get(reverse('admin:%s_%s_add' % info))
+        return pages
+
+    def get(self, url):
+        return lambda: self.client.get(url)
+
+    def request(self):
+        request = self.client.get(reverse('admin:index')).wsgi_request
+        request.user = self.user
+        return request
+
+    def test_admin_pages_run_a_fixed_number_of_queries(self):
+        self.assertFlat(self.requests, lambda name: ADMIN_BUDGET)
+
+
+class AutocompleteRecordTests(TestCase):
+
+    def setUp(self):
+        autocomplete.reset()
+        self.valuation = Valuation.objects.create(report_number='AC-1', bank_name='Nabil Bank', borrower_name='A')
+        self.index = autocomplete.get_index('bank_name')
+
+    def test_unchanged_save_is_not_counted(self):
+        for _ in range(3):
+            Valuation.objects.get(pk=self.valuation.pk).save()
+        self.assertEqual(self.index.uses['nabil bank'], 1)
+
+    def test_changed_value_moves_its_use(self):
+        valuation = Valuation.objects.get(pk=self.valuation.pk)
+        valuation.bank_name = 'Everest Bank'
+        valuation.save()
+        self.assertEqual(autocomplete.suggest('bank_name', 'e'), ['Everest Bank'])
+        self.assertEqual(autocomplete.suggest('bank_name', 'n'), [])
+
+
+class SyncPushTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('valuer')
+        cls.valuation = Valuation.objects.create(report_number='SY-1', bank_name='Nabil', borrower_name='A')
+        VisitingTeam.objects.create(valuation=cls.valuation, member_name='Valuer', designation='Valuer',
+                                    user=cls.user)
+        cls.property = Property.objects.create(valuation=cls.valuation, name='Home', address='Ward 4',
+                                               district='Kathmandu', ward_no=4)
+        cls.plot = Plot.objects.create(property=cls.property, plot_number='12', ropani=1)
+
+    def pulled(self, name, pk):
+        row, = [row for row in sync.pull(self.user)['changes'][name] if row['id'] == pk]
+        return row
+
+    def push(self, *changes):
+        return [result['status'] for result in sync.push(self.user, list(changes))['results']]
+
+    def test_plot_then_property_edit_in_one_batch_applies(self):
+        plot, property = self.pulled('plot', self.plot.pk), self.pulled('property', self.property.pk)
+        self.assertEqual(self.push(
+            {'model': 'plot', 'id': plot['id'], 'base_version': plot['version'], 'fields': {'ropani': 2}},
+            {'model': 'property', 'id': property['id'], 'base_version': property['version'],
+             'fields': {'name': 'Family home'}},
+        ), ['applied', 'applied'])
+        self.assertEqual(Property.objects.get(pk=self.property.pk).name, 'Family home')
+
+    def test_malformed_changes_fail_alone(self):
+        property = self.pulled('property', self.property.pk)
+        self.assertEqual(self.push(
+            {'model': 'property', 'id': 'abc', 'base_version': 1, 'fields': {'name': 'X'}},
+            {'model': 'owner', 'client_id': 'o-1', 'parent': 'abc', 'fields': {'name': 'X'}},
+            {'model': 'owner', 'client_id': ['o-2'], 'parent': self.property.pk, 'fields': {'name': 'X'}},
+            {'model': 'property', 'id': property['id'], 'base_version': property['version'],
+             'fields': {'name': 'Family home'}},
+        ), ['invalid', 'invalid', 'invalid', 'applied'])
+
+    def test_edit_of_a_row_saved_meanwhile_conflicts(self):
+        property = self.pulled('property', self.property.pk)
+        Property.objects.get(pk=self.property.pk).save()
+        self.assertEqual(self.push(
+            {'model': 'property', 'id': property['id'], 'base_version': property['version'],
+             'fields': {'name': 'Family home'}},
+        ), ['conflict'])
+
+
+class JobQueueTests(TransactionTestCase):
+    # Outside TestCase's transaction, where the router may pick the replica
+
+    def test_claim_reads_the_primary_with_a_replica_configured(self):
+        job = jobs.enqueue('recalculate_plots', plot_ids=[])
+        # Any read routed to the (missing) replica alias would raise
+        with mock.patch.object(routers, 'replica_alias', return_value='replica'):
+            with routers.replica_reads():
+                claimed = jobs.claim_next('worker')
+            self.assertEqual(claimed.pk, job.pk)
+            self.assertTrue(jobs.run_job(claimed))
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.STATUS_SUCCEEDED)
+        self.assertIsNone(jobs.claim_next('worker'))
+
+    def test_recalculation_bumps_plot_version(self):
+        valuation = Valuation.objects.create(report_number='JQ-1', bank_name='Nabil', borrower_name='A')
+        property = Property.objects.create(valuation=valuation, name='Home', address='Ward 4',
+                                           district='Kathmandu', ward_no=4)
+        plot = Plot.objects.create(property=property, plot_number='1', ropani=1, market_rate_per_sqft=1000)
+        Plot.objects.filter(pk=plot.pk).update(fair_market_value=0)
+        job = jobs.enqueue('recalculate_plots', plot_ids=[plot.pk])
+        self.assertTrue(jobs.run_job(jobs.claim_next('worker')))
+        self.assertEqual(Plot.objects.get(pk=plot.pk).version, plot.version + 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).result, {'plots': 1, 'changed': 1})
+
+
+def add_property(valuation, name='Home', district='Kathmandu', ward_no=4, **fields):
+    return Property.objects.create(valuation=valuation, name=name, address=f'Ward {ward_no}', district=district,
+                                   municipality=fields.pop('municipality', district), ward_no=ward_no, **fields)
+
+
+def square(lng, lat, size=0.001):
+    return {'type': 'Polygon', 'coordinates': [[
+        [lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat],
+    ]]}
+
+
+class QueryCacheTests(TransactionTestCase):
+    # The cache is skipped inside transactions, so TestCase would never use it
+
+    def setUp(self):
+        querycache.clear()
+        self.valuation = Valuation.objects.create(report_number='QC-1', bank_name='Nabil', borrower_name='A')
+        self.property = add_property(self.valuation)
+        Plot.objects.create(property=self.property, plot_number='1', ropani=1)
+
+    def count(self):
+        return Plot.objects.cached().filter(property__valuation=self.valuation).count()
+
+    def test_repeat_is_served_from_the_cache(self):
+        self.assertEqual(self.count(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(), 1)
+
+    def test_save_update_and_delete_invalidate(self):
+        self.assertEqual(self.count(), 1)
+        plot = Plot.objects.create(property=self.property, plot_number='2', ropani=1)
+        self.assertEqual(self.count(), 2)
+        Plot.objects.filter(pk=plot.pk).update(property=add_property(self.valuation, name='Shop'))
+        self.assertEqual(Plot.objects.cached().filter(property=self.property).count(), 1)
+        plot.delete()
+        self.assertEqual(self.count(), 1)
+
+    def test_cascade_delete_invalidates(self):
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(Plot.objects.cached().count(), 1)
+        self.valuation.delete()
+        self.assertEqual(Plot.objects.cached().count(), 0)
+
+
+class ArchiveTests(TestCase):
+
+    def test_fiscal_year_labels(self):
+        self.assertEqual(archive.normalize_fiscal_year(' 2080/81 '), '2080/81')
+        self.assertEqual(archive.normalize_fiscal_year('2099/00'), '2099/00')
+        self.assertEqual(archive.fiscal_year_bounds('2080/81'), (date(2023, 7, 16), date(2024, 7, 16)))
+        self.assertEqual(archive.fiscal_year(date(2024, 7, 15)), '2080/81')
+        for label in ('2080/82', '2080-81', '2080/81x', '', None):
+            with self.assertRaises(ValueError):
+                archive.normalize_fiscal_year(label)
+
+    def test_open_year_is_refused(self):
+        with self.assertRaises(ValueError):
+            archive.archive_fiscal_year(archive.current_fiscal_year())
+
+    def test_round_trip(self):
+        valuation = Valuation.objects.create(report_number='AR-1', bank_name='Nabil', borrower_name='A',
+                                             val_date=date(2023, 8, 1))
+        property = add_property(valuation)
+        Owner.objects.create(property=property, name='Ram', address='Ward 4', citizenship_number='27-01-123')
+        Plot.objects.create(property=property, plot_number='12', ropani=1, market_rate_per_sqft=1000)
+        VisitingTeam.objects.create(valuation=valuation, member_name='Sita', designation='Valuer')
+        later = Valuation.objects.create(report_number='AR-2', bank_name='Nabil', borrower_name='B',
+                                         val_date=date(2024, 7, 16))
+
+        self.assertEqual(archive.archive_fiscal_year('2080/81', dry_run=True), 1)
+        self.assertEqual(archive.archive_fiscal_year('2080/81', batch_size=1), 1)
+        self.assertFalse(Valuation.objects.filter(pk=valuation.pk).exists())
+        self.assertTrue(Valuation.objects.filter(pk=later.pk).exists())
+
+        archived = ArchivedValuation.objects.get(original_id=valuation.pk)
+        self.assertEqual(archived.fiscal_year, '2080/81')
+        restored, properties, team = archive.restore(archived)
+        self.assertEqual((restored.pk, restored.report_number), (valuation.pk, 'AR-1'))
+        self.assertEqual([owner.name for owner in properties[0].owner_rows], ['Ram'])
+        self.assertEqual([plot.plot_number for plot in properties[0].plot_rows], ['12'])
+        self.assertEqual([member.member_name for member in team], ['Sita'])
+        self.assertEqual([entry.archived_valuation_id for entry in identity.archived_exposure('27 01 123')],
+                         [archived.pk])
+
+
+class IdentityExposureTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('valuer', password='valuer')
+        for number, bank_name in enumerate(['Nabil', 'Everest']):
+            valuation = Valuation.objects.create(report_number=f'ID-{number}', bank_name=bank_name,
+                                                 borrower_name='B', borrower_citizenship='11-11-1')
+            Owner.objects.create(property=add_property(valuation), name='Ram', address='Ward 4',
+                                 citizenship_number='२७-०१-१२३' if number else '27/01/123')
+
+    def test_numbers_match_across_scripts_and_punctuation(self):
+        banks = [entry.valuation.bank_name for entry in identity.exposure('27-01-123')]
+        self.assertEqual(sorted(banks), ['Everest', 'Nabil'])
+        self.assertFalse(identity.exposure())
+
+    def test_edited_number_moves_in_the_index(self):
+        owner = Owner.objects.get(citizenship_number='27/01/123')
+        owner.citizenship_number = '99-01-1'
+        owner.save()
+        self.assertEqual(len(identity.exposure('27-01-123')), 1)
+        self.assertEqual(len(identity.exposure('99011')), 1)
+
+    def test_views_are_staff_only(self):
+        self.client.force_login(self.user)
+        for name in ('report:party_exposure', 'report:party_exposure_api'):
+            response = self.client.get(reverse(name), {'citizenship': '27-01-123'})
+            self.assertEqual(response.status_code, 302, name)
+
+
+class SpatialTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        valuation = Valuation.objects.create(report_number='SP-1', bank_name='Nabil', borrower_name='A')
+        property = add_property(valuation)
+        cls.near, cls.middle, cls.far = [
+            Plot.objects.create(property=property, plot_number=str(number), ropani=1,
+                                latitude='27.700000', longitude=longitude)
+            for number, longitude in enumerate(['85.301000', '85.310000', '85.400000'])
+        ]
+        cls.parcel = Plot.objects.create(property=property, plot_number='3', ropani=1,
+                                         boundary=square(85.3, 27.72))
+
+    def test_radius_is_nearest_first_and_limited(self):
+        matches = spatial.within_radius(27.7, 85.3, 2000)
+        self.assertEqual([plot for plot, _ in matches], [self.near, self.middle])
+        self.assertLess(matches[0][1], matches[1][1])
+        self.assertEqual([plot for plot, _ in spatial.within_radius(27.7, 85.3, 2000, limit=1)], [self.near])
+
+    def test_moved_plot_moves_in_the_index(self):
+        self.far.longitude = '85.302000'
+        self.far.save()
+        self.assertIn(self.far, spatial.in_bbox(85.3015, 27.69, 85.3025, 27.71))
+        self.assertNotIn(self.far, spatial.in_bbox(85.39, 27.69, 85.41, 27.71))
+
+    def test_overlap_needs_shared_area(self):
+        self.assertEqual(spatial.overlapping(square(85.3005, 27.7205)), [self.parcel])
+        self.assertEqual(spatial.overlapping(square(85.301, 27.72)), [])
+        self.assertEqual(spatial.overlapping(square(85.3005, 27.7205), exclude=self.parcel.pk), [])
+
+    def test_map_api_rejects_bad_radius(self):
+        self.client.force_login(get_user_model().objects.create_superuser('map', 'map@example.com', 'map'))
+        for lat, radius in (('27.7', 'nan'), ('27.7', '0'), ('27.7', '-5'), ('nan', '500'), ('inf', '500')):
+            response = self.client.get(reverse('report:plot_map_api'),
+                                       {'lat': lat, 'lng': '85.3', 'radius': radius})
+            self.assertEqual(response.status_code, 400, (lat, radius))
+
+
+class ScenarioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for number, district in enumerate(['Kathmandu', 'Lalitpur', 'Kathmandu']):
+            valuation = Valuation.objects.create(report_number=f'SC-{number}', bank_name=f'Bank {number % 2}',
+                                                 borrower_name='A')
+            property = add_property(valuation, district=district, land_type='residential')
+            for ropani in (1, 2):
+                Plot.objects.create(property=property, plot_number=str(ropani), ropani=ropani,
+                                    market_rate_per_sqft=1000 * (number + 1), gov_rate_per_sqft=400)
+
+    @skipUnless(scenarios.numpy, 'numpy is not installed')
+    def test_engines_agree(self):
+        rules = [{'district': 'kathmandu', 'market_pct': -20}, {'land_type': 'Residential', 'gov_pct': 10}]
+        vectorised = scenarios.run(rules, use_numpy=True)
+        plain = scenarios.run(rules, use_numpy=False)
+        self.assertEqual((vectorised['engine'], plain['engine']), ('numpy', 'python'))
+        for key in ('plots', 'affected_plots', 'baseline', 'shocked', 'banks', 'valuations'):
+            self.assertEqual(vectorised[key], plain[key], key)
+        self.assertEqual(plain['affected_plots'], 6)
+        self.assertLess(plain['shocked'], plain['baseline'])
+
+    def test_rules_are_validated(self):
+        for shock in ('nan', 'inf', float('nan'), -100, scenarios.MAX_SHOCK_PCT + 1, 'ten'):
+            with self.assertRaises(scenarios.ScenarioError, msg=shock):
+                scenarios.parse_rules([{'district': 'Kathmandu', 'market_pct': shock}])
+        for rules in ([], {'district': 'Kathmandu'}, [{'market_pct': 5}], [{'district': 'X', 'ward': 1}]):
+            with self.assertRaises(scenarios.ScenarioError, msg=rules):
+                scenarios.parse_rules(rules)
+
+
+class CollateralTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = Valuation.objects.create(report_number='CO-1', bank_name='Nabil', borrower_name='A')
+        cls.second = Valuation.objects.create(report_number='CO-2', bank_name='Everest', borrower_name='B')
+        cls.plot = Plot.objects.create(property=add_property(cls.first), plot_number='0012', ropani=1,
+                                       sheet_number='Ka 3')
+        cls.pledge = Plot.objects.create(property=add_property(cls.second, ward_no='४'), plot_number='१२',
+                                         ropani=1, sheet_number='ka-03')
+
+    def test_same_parcel_is_found_across_banks(self):
+        self.assertEqual(self.plot.parcel_key, self.pledge.parcel_key)
+        groups = list(collateral.duplicate_parcels(across_banks=True))
+        self.assertEqual([group['banks'] for group in groups], [['Everest', 'Nabil']])
+        self.assertEqual(list(collateral.other_pledges([self.plot])), [self.pledge])
+
+    def test_moving_a_property_rekeys_its_plots(self):
+        stamped = Plot.objects.get(pk=self.plot.pk).updated_at
+        property = self.plot.property
+        property.ward_no = 5
+        property.save()
+        plot = Plot.objects.get(pk=self.plot.pk)
+        self.assertNotEqual(plot.parcel_key, self.pledge.parcel_key)
+        self.assertGreater(plot.updated_at, stamped)
+        self.assertEqual(list(collateral.duplicate_parcels()), [])
+        self.assertEqual(collateral.backfill(), (2, 0))
+
+
+@skipUnless(columnar.pyarrow, 'pyarrow is not installed')
+class ColumnarExportTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='report-snapshot-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        for month in (5, 6):
+            valuation = Valuation.objects.create(report_number=f'CX-{month}', bank_name='Nabil',
+                                                 borrower_name='A', val_date=date(2025, month, 1))
+            Plot.objects.create(property=add_property(valuation), plot_number='1', ropani=1)
+
+    def test_export_is_incremental(self):
+        result = columnar.export(self.directory)
+        self.assertEqual((len(result['written']), result['rows']), (2, 2))
+        self.assertEqual(columnar.dataset(self.directory).count_rows(), 2)
+        result = columnar.export(self.directory)
+        self.assertEqual((result['written'], result['unchanged']), ([], 2))
+        Valuation.objects.get(report_number='CX-6').delete()
+        self.assertEqual(len(columnar.export(self.directory)['removed']), 1)
+
+
+class SchedulerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.localdate()
+        cls.valuations = [
+            Valuation.objects.create(report_number=f'SV-{number}', bank_name='Nabil', borrower_name='A',
+                                     val_date=today - timedelta(days=days))
+            for number, days in enumerate([1, 2, scheduling.PENDING_DAYS + 30])
+        ]
+        for number, valuation in enumerate(cls.valuations):
+            add_property(valuation, ward_no=number + 1)
+
+    def test_pending_leaves_out_old_reports(self):
+        pending = {visit.valuation_id for visit in scheduling.pending_visits()}
+        self.assertEqual(pending, {self.valuations[0].pk, self.valuations[1].pk})
+        since = timezone.localdate() - timedelta(days=scheduling.PENDING_DAYS + 60)
+        self.assertEqual(len(scheduling.pending_visits(since=since)), 3)
+
+    def test_assign_skips_valuations_assigned_meanwhile(self):
+        crews = [[scheduling.Member('Sita', 'Valuer', '', None)]]
+        routes, unscheduled = scheduling.plan(scheduling.pending_visits(), crews, timezone.localdate(), 5)
+        self.assertEqual((len(routes), unscheduled), (1, []))
+        taken = self.valuations[0]
+        VisitingTeam.objects.create(valuation=taken, member_name='Hari', designation='Valuer')
+        skipped = scheduling.assign(routes, crews)
+        self.assertEqual([visit.valuation_id for visit in skipped], [taken.pk])
+        self.assertEqual(list(VisitingTeam.objects.filter(valuation=taken).values_list('member_name', flat=True)),
+                         ['Hari'])
+        self.assertEqual(VisitingTeam.objects.get(valuation=self.valuations[1]).route_order, 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AttachmentStoreTests(TestCase):
+
+    def test_partial_leftover_file_is_replaced(self):
+        blob, _ = attachments.store(SimpleUploadedFile('site.jpg', JPEG))
+        name = blob.file.name
+        # A crash after writing part of the file, before the row was saved
+        Blob.objects.filter(pk=blob.pk).delete()
+        with blob.file.open('wb') as file:
+            file.write(JPEG[:10])
+        blob, created = attachments.store(SimpleUploadedFile('site.jpg', JPEG))
+        self.assertTrue(created)
+        self.assertEqual(blob.file.name, name)
+        with blob.file.open('rb') as file:
+            self.assertEqual(file.read(), JPEG)
+
+
+class MetricsTests(TestCase):
+
+    @override_settings(DEBUG=False, REPORT_METRICS_TOKEN='')
+    def test_closed_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('report:metrics')).status_code, 403)
+
+    @override_settings(REPORT_METRICS_TOKEN='secret')
+    def test_token_is_checked(self):
+        url = reverse('report:metrics')
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer secret'}).status_code, 200)
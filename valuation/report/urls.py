@@ -8,9 +8,30 @@ urlpatterns = [
     path('reports/', views.valuation_list, name='valuation_list'),
     path('reports/create/', views.valuation_create, name='valuation_create'),
     path('reports/<int:pk>/', views.valuation_detail, name='valuation_detail'),
+    path('reports/<int:valuation_pk>/attachments/', views.attachment_upload, name='attachment_upload'),
+    path('attachments/<int:pk>/delete/', views.attachment_delete, name='attachment_delete'),
+    path('attachments/<str:sha256>/', views.attachment_file, name='attachment_file'),
+    path('attachments/<str:sha256>/thumbnail/', views.attachment_thumbnail, name='attachment_thumbnail'),
     path('properties/', views.property_list, name='property_list'),
     path('properties/add/<int:valuation_pk>/', views.property_add, name='property_add'),
     path('properties/<int:pk>/edit/', views.property_edit, name='property_edit'),
+    path('properties/<int:pk>/plots/', views.property_plots, name='property_plots'),
+    path('properties/<int:pk>/fragments/owners/', views.property_owners_fragment, name='property_owners_fragment'),
+    path('properties/<int:pk>/fragments/plots/', views.property_plots_fragment, name='property_plots_fragment'),
+    path('properties/<int:property_pk>/plots/add/', views.plot_row_create, name='plot_row_create'),
     path('plots/', views.plot_list, name='plot_list'),
+    path('plots/<int:pk>/save/', views.plot_row_update, name='plot_row_update'),
+    path('plots/<int:pk>/delete/', views.plot_row_delete, name='plot_row_delete'),
     path('owners/', views.owner_list, name='owner_list'),
+    path('parties/', views.party_exposure, name='party_exposure'),
+    path('api/parties/', views.party_exposure_api, name='party_exposure_api'),
+    path('api/plots/map/', views.plot_map_api, name='plot_map_api'),
+    path('api/plots/overlaps/', views.plot_overlap_api, name='plot_overlap_api'),
+    path('api/scenarios/', views.scenario_api, name='scenario_api'),
+    path('api/sync/pull/', views.sync_pull, name='sync_pull'),
+    path('api/sync/push/', views.sync_push, name='sync_push'),
+    path('autocomplete/<slug:field>/', views.autocomplete_lookup, name='autocomplete'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('jobs/', views.job_list, name='job_list'),
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
 ]
\ No newline at end of file
@@ -1,10 +1,44 @@
+import hmac
+import json
+import math
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Count, Q
-from .models import Valuation, Property, Owner, Plot, VisitingTeam
-from .forms import ValuationForm, PropertyForm, OwnerForm, PlotForm
+from decimal import Decimal
+from django.core.paginator import Paginator
+from django.db.models import Count, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from .models import Valuation, Property, Owner, Plot, VisitingTeam, Job, ArchivedValuation, Attachment, Blob
+from .forms import ValuationForm, PropertyForm, OwnerForm, PlotForm, PlotRowForm
 from django.forms import inlineformset_factory
-from django.db.models import Sum
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from . import archive, attachments, autocomplete, collateral, identity, metrics, scenarios, spatial, sync, tasks
+from .projections import OwnerRow, PlotRow, with_property_totals
+from .routers import replica_safe
+
+# Cached per-property sections are keyed on Property.updated_at, so they
+# only expire to free memory, never for correctness
+FRAGMENT_CACHE_SECONDS = 24 * 60 * 60
+
+ARCHIVE_SEARCH_LIMIT = 100
+
+# Properties with more plots than this edit them in the row editor, not the formset
+ROW_EDITOR_THRESHOLD = 30
+PLOT_ROWS_PER_PAGE = 50
+
+# Optional Jinja2 engine for the heaviest list pages
+LIST_TEMPLATE_ENGINE = 'jinja2' if settings.REPORT_JINJA2_LISTS else None
 
 # Create formsets
 OwnerFormSet = inlineformset_factory(
@@ -17,20 +51,45 @@ PlotFormSet = inlineformset_factory(
     extra=1, can_delete=True, fields='__all__'
 )
 
+@replica_safe
 def dashboard(request):
     """Main dashboard view"""
     stats = {
-        'valuations': Valuation.objects.count(),
-        'properties': Property.objects.count(),
-        'owners': Owner.objects.count(),
-        'plots': Plot.objects.count(),
+        'valuations': Valuation.objects.cached().count(),
+        'properties': Property.objects.cached().count(),
+        'owners': Owner.objects.cached().count(),
+        'plots': Plot.objects.cached().count(),
     }
     return render(request, 'report/dashboard.html', {'stats': stats})
 
+@replica_safe
 def valuation_list(request):
-    """List all valuation reports"""
-    valuations = Valuation.objects.all().order_by('-val_date')
-    return render(request, 'report/valuation_list.html', {'valuations': valuations})
+    """List all valuation reports, searching archived fiscal years too"""
+    query = request.GET.get('q', '').strip()
+    year = request.GET.get('fy', '').strip()
+    valuations = Valuation.objects.annotate(property_count=Count('properties')).order_by('-val_date')
+    archived = ArchivedValuation.objects.none()
+    
+    if query:
+        condition = Q(report_number__icontains=query) | Q(bank_name__icontains=query) | Q(borrower_name__icontains=query)
+        valuations = valuations.filter(condition)
+        archived = ArchivedValuation.objects.filter(condition)
+    if year:
+        try:
+            year = archive.normalize_fiscal_year(year)
+            start, end = archive.fiscal_year_bounds(year)
+        except ValueError:
+            messages.error(request, f'"{year}" is not a fiscal year like 2081/82.')
+        else:
+            valuations = valuations.filter(val_date__gte=start, val_date__lt=end)
+            archived = (archived if query else ArchivedValuation.objects.all()).filter(fiscal_year=year)
+    
+    return render(request, 'report/valuation_list.html', {
+        'valuations': valuations,
+        'archived': archived.defer('payload')[:ARCHIVE_SEARCH_LIMIT],
+        'query': query,
+        'year': year,
+    })
 
 def valuation_create(request):
     """Create new valuation report"""
@@ -47,34 +106,117 @@ def valuation_create(request):
     
     return render(request, 'report/valuation_create.html', {'form': form})
 
+@replica_safe
 def valuation_detail(request, pk):
-    """View valuation report details"""
-    valuation = get_object_or_404(
-        Valuation.objects.prefetch_related('properties__owners', 'properties__plots'), 
-        pk=pk
-    )
-    return render(request, 'report/valuation_detail.html', {'valuation': valuation})
+    """
+    View valuation report details, live or archived. Live reports render the
+    header and per-property totals only; owner and plot tables load on demand
+    from the property fragment views.
+    """
+    valuation = Valuation.objects.cached().prefetch_related(
+        Prefetch('properties', queryset=Property.objects.cached().annotate(owner_count=Count('owners'))),
+        Prefetch('attachments', queryset=Attachment.objects.cached().select_related('blob')),
+        Prefetch('visiting_teams', queryset=VisitingTeam.objects.cached()),
+    ).filter(pk=pk).first()
+    
+    if valuation is not None:
+        archived = None
+        properties = list(valuation.properties.all())
+        # Just the plot columns the totals, labels and upload targets need
+        plot_rows = {}
+        for plot in Plot.objects.cached().filter(property__valuation=valuation).only(
+            'property_id', 'plot_number', 'area_sqft', 'fair_market_value'
+        ):
+            plot_rows.setdefault(plot.property_id, []).append(plot)
+        for property in properties:
+            property.plot_rows = plot_rows.get(property.pk, [])
+        visiting_team = list(valuation.visiting_teams.all())
+        attachment_rows = list(valuation.attachments.all())
+    else:
+        archived = get_object_or_404(ArchivedValuation, original_id=pk)
+        valuation, properties, visiting_team = archive.restore(archived)
+        attachment_rows = archive.restore_attachments(archived)
+        for property in properties:
+            property.owner_count = len(property.owner_rows)
+    
+    # Label attachments from the loaded rows rather than their foreign keys
+    property_names = {property.pk: property.name for property in properties}
+    plot_numbers = {plot.pk: plot.plot_number for property in properties for plot in property.plot_rows}
+    for attachment in attachment_rows:
+        if attachment.plot_id in plot_numbers:
+            attachment.target = f'Plot {plot_numbers[attachment.plot_id]}'
+        else:
+            attachment.target = property_names.get(attachment.property_id, '')
+    
+    for property in properties:
+        property.plot_count = len(property.plot_rows)
+        property.area_total = sum(plot.area_sqft or 0 for plot in property.plot_rows)
+        property.value_total = sum(plot.fair_market_value or 0 for plot in property.plot_rows)
+        property.avg_rate = property.value_total / property.area_total if property.area_total else 0
+    
+    return render(request, 'report/valuation_detail.html', {
+        'valuation': valuation,
+        'archived': archived,
+        'properties': properties,
+        'visiting_team': visiting_team,
+        'attachments': attachment_rows,
+        'attachment_kinds': Attachment.KIND_CHOICES,
+        'summary': {
+            'properties': len(properties),
+            'owners': sum(property.owner_count for property in properties),
+            'plots': sum(property.plot_count for property in properties),
+            'total_value': sum(property.value_total for property in properties),
+        },
+        'fragment_timeout': FRAGMENT_CACHE_SECONDS,
+    })
 
+def _property_etag(request, pk):
+    """Property.updated_at changes whenever one of its owners or plots does"""
+    updated_at = Property.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return f'{pk}-{updated_at.timestamp()}' if updated_at else None
+
+@replica_safe
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_property_etag)
+def property_owners_fragment(request, pk):
+    """Owners table of one property, for the lazily loaded detail page sections"""
+    property_instance = get_object_or_404(Property, pk=pk)
+    return render(request, 'report/property_owners.html', {
+        'property': property_instance,
+        'owners': property_instance.owners.all(),
+        'fragment_timeout': FRAGMENT_CACHE_SECONDS,
+    })
+
+@replica_safe
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_property_etag)
+def property_plots_fragment(request, pk):
+    """Plots table of one property, for the lazily loaded detail page sections"""
+    property_instance = get_object_or_404(Property, pk=pk)
+    return render(request, 'report/property_plot_table.html', {
+        'property': property_instance,
+        'plots': property_instance.plots.all(),
+        'fragment_timeout': FRAGMENT_CACHE_SECONDS,
+    })
+
+@replica_safe
 def property_list(request):
     """List all properties"""
-    properties = Property.objects.select_related('valuation').annotate(
-        owner_count=Count('owners'),
-        plot_count=Count('plots'),
-        # Use annotation to calculate total value
-        total_value_sum=Sum('plots__fair_market_value')
-    )
+    properties = with_property_totals(Property.objects.cached().select_related('valuation'))
     
     return render(request, 'report/property_list.html', {'properties': properties})
     
+@replica_safe
 def plot_list(request):
     """List all land plots"""
-    plots = Plot.objects.select_related('property__valuation')
-    return render(request, 'report/plot_list.html', {'plots': plots})
+    plots = PlotRow.project(Plot.objects.all())
+    return render(request, 'report/plot_list.html', {'plots': plots}, using=LIST_TEMPLATE_ENGINE)
 
+@replica_safe
 def owner_list(request):
     """List all property owners"""
-    owners = Owner.objects.select_related('property__valuation')
-    return render(request, 'report/owner_list.html', {'owners': owners})
+    owners = OwnerRow.project(Owner.objects.all())
+    return render(request, 'report/owner_list.html', {'owners': owners}, using=LIST_TEMPLATE_ENGINE)
 
 def property_add(request, valuation_pk):
     """Add a new property to a valuation"""
@@ -99,24 +241,385 @@ def property_add(request, valuation_pk):
 def property_edit(request, pk):
     """Edit property with owners and plots"""
     property_instance = get_object_or_404(Property, pk=pk)
+    plot_count = property_instance.plots.count()
+    # Large estates keep only the blank "add" form here; existing plots go to the row editor
+    plots = Plot.objects.none() if plot_count > ROW_EDITOR_THRESHOLD else None
     
     if request.method == 'POST':
         owner_formset = OwnerFormSet(request.POST, instance=property_instance, prefix='owners')
-        plot_formset = PlotFormSet(request.POST, instance=property_instance, prefix='plots')
+        plot_formset = PlotFormSet(request.POST, instance=property_instance, prefix='plots', queryset=plots)
         
         if owner_formset.is_valid() and plot_formset.is_valid():
             owner_formset.save()
-            plot_formset.save()
+            saved_plots = plot_formset.save()
             messages.success(request, 'Property updated successfully!')
+            duplicates = list(collateral.other_pledges(saved_plots))
+            if duplicates:
+                messages.warning(request, 'Parcel already pledged: ' + '; '.join(
+                    collateral.describe(plot) for plot in duplicates
+                ))
             return redirect('report:valuation_detail', pk=property_instance.valuation.pk)
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
         owner_formset = OwnerFormSet(instance=property_instance, prefix='owners')
-        plot_formset = PlotFormSet(instance=property_instance, prefix='plots')
+        plot_formset = PlotFormSet(instance=property_instance, prefix='plots', queryset=plots)
     
     return render(request, 'report/property_edit.html', {
         'property_instance': property_instance,
         'owner_formset': owner_formset,
         'plot_formset': plot_formset,
-    })
\ No newline at end of file
+        'plot_count': plot_count,
+        'row_editor_only': plots is not None,
+    })
+
+def _plot_totals(property_instance):
+    return Plot.objects.filter(property=property_instance).aggregate(
+        plots=Count('pk'),
+        area_sqft=Coalesce(Sum('area_sqft'), Decimal(0)),
+        fair_market_value=Coalesce(Sum('fair_market_value'), Decimal(0)),
+    )
+
+def property_plots(request, pk):
+    """Plots of a property as editable rows, a page at a time; each row saves on its own"""
+    property_instance = get_object_or_404(Property.objects.select_related('valuation'), pk=pk)
+    totals = _plot_totals(property_instance)
+    paginator = Paginator(property_instance.plots.order_by('plot_number', 'pk'), PLOT_ROWS_PER_PAGE)
+    paginator.count = totals['plots']
+    page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'report/property_plots.html', {
+        'property_instance': property_instance,
+        'page': page,
+        'rows': [PlotRowForm(instance=plot) for plot in page],
+        'new_row': PlotRowForm(instance=Plot(property=property_instance)),
+        'totals': totals,
+    })
+
+def _plot_row_response(plot, status=200, **extra):
+    """The row's recalculated figures and the property totals after a change"""
+    return JsonResponse({
+        'id': plot.pk,
+        'plot': {
+            'area_display': plot.get_area_display(),
+            **{field: getattr(plot, field) for field in tasks.RECALCULATED_FIELDS},
+        },
+        'totals': _plot_totals(plot.property),
+        'duplicates': [collateral.describe(other) for other in collateral.other_pledges([plot])],
+        **extra,
+    }, status=status)
+
+@require_POST
+def plot_row_create(request, property_pk):
+    """Add one plot from the row editor"""
+    property_instance = get_object_or_404(Property, pk=property_pk)
+    form = PlotRowForm(request.POST, instance=Plot(property=property_instance))
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    plot = form.save()
+    html = render_to_string('report/plot_row.html', {'form': PlotRowForm(instance=plot)}, request)
+    return _plot_row_response(plot, status=201, html=html)
+
+@require_POST
+def plot_row_update(request, pk):
+    """Save one plot from the row editor"""
+    plot = get_object_or_404(Plot.objects.select_related('property'), pk=pk)
+    form = PlotRowForm(request.POST, instance=plot)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    return _plot_row_response(form.save())
+
+@require_POST
+def plot_row_delete(request, pk):
+    """Delete one plot from the row editor"""
+    plot = get_object_or_404(Plot.objects.select_related('property'), pk=pk)
+    plot.delete()
+    return JsonResponse({'id': pk, 'totals': _plot_totals(plot.property)})
+
+@replica_safe
+@staff_member_required
+def party_exposure(request):
+    """Every report a citizenship/PAN holder is on, across all banks"""
+    citizenship = request.GET.get('citizenship', '').strip()
+    pan = request.GET.get('pan', '').strip()
+    identities = list(identity.exposure(citizenship=citizenship, pan=pan))
+    return render(request, 'report/party_exposure.html', {
+        'citizenship': citizenship,
+        'pan': pan,
+        'searched': bool(citizenship or pan),
+        'identities': identities,
+        'archived_identities': identity.archived_exposure(citizenship=citizenship, pan=pan),
+        'banks': sorted({entry.valuation.bank_name for entry in identities}),
+    })
+
+@replica_safe
+@staff_member_required
+def party_exposure_api(request):
+    """JSON variant of the party exposure lookup"""
+    identities = identity.exposure(
+        citizenship=request.GET.get('citizenship'),
+        pan=request.GET.get('pan'),
+    )
+    return JsonResponse({'results': [
+        {
+            'id_type': entry.id_type,
+            'id_number': entry.id_number,
+            'role': entry.role,
+            'name': entry.name,
+            'valuation_id': entry.valuation_id,
+            'report_number': entry.valuation.report_number,
+            'val_date': entry.valuation.val_date.isoformat(),
+            'bank_name': entry.valuation.bank_name,
+            'bank_branch': entry.valuation.bank_branch,
+            'property_id': entry.property_id,
+            'property_name': entry.property.name if entry.property else None,
+            'property_value': str(entry.property_value),
+            'valuation_value': str(entry.valuation_value),
+        }
+        for entry in identities
+    ]})
+
+@staff_member_required
+def job_list(request):
+    """Status of queued and recent background jobs"""
+    jobs = Job.objects.select_related('created_by')[:100]
+    active = any(job.status in (Job.STATUS_PENDING, Job.STATUS_RUNNING) for job in jobs)
+    return render(request, 'report/job_list.html', {'jobs': jobs, 'active': active})
+
+@staff_member_required
+def job_status(request, pk):
+    """Progress of a single job, for polling"""
+    job = get_object_or_404(Job, pk=pk)
+    return JsonResponse({
+        'id': job.pk,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'progress': job.progress,
+        'progress_total': job.progress_total,
+        'percent': job.percent,
+        'message': job.progress_message,
+        'result': job.result,
+        'error': job.error.splitlines()[-1] if job.error else '',
+    })
+
+@replica_safe
+def autocomplete_lookup(request, field):
+    """Prefix suggestions for bank, branch, district and municipality inputs"""
+    if field not in autocomplete.FIELDS:
+        raise Http404('Unknown autocomplete field')
+    response = JsonResponse({'results': autocomplete.suggest(field, request.GET.get('q', ''))})
+    response['Cache-Control'] = 'private, max-age=60'
+    return response
+
+def _map_plots():
+    return Plot.objects.select_related('property__valuation')
+
+def _float_params(request, *names):
+    try:
+        values = [float(request.GET[name]) for name in names]
+    except (KeyError, ValueError):
+        return None
+    return values if all(math.isfinite(value) for value in values) else None
+
+@replica_safe
+def plot_map_api(request):
+    """
+    GeoJSON plots for map views: either inside ?bbox=west,south,east,north
+    or within ?radius= metres (default 500) of ?lat=&lng=
+    """
+    if 'bbox' in request.GET:
+        try:
+            west, south, east, north = (float(value) for value in request.GET['bbox'].split(','))
+        except ValueError:
+            return JsonResponse({'error': 'bbox must be west,south,east,north'}, status=400)
+        plots = spatial.in_bbox(west, south, east, north, queryset=_map_plots())[:spatial.FEATURE_LIMIT + 1]
+        matches = [(plot, {}) for plot in plots]
+    else:
+        point = _float_params(request, 'lat', 'lng')
+        if point is None:
+            return JsonResponse({'error': 'Pass bbox, or lat and lng'}, status=400)
+        try:
+            radius = float(request.GET.get('radius', 500))
+        except ValueError:
+            radius = math.nan
+        # NaN fails this comparison too
+        if not radius > 0:
+            return JsonResponse({'error': 'radius must be a positive number of metres'}, status=400)
+        radius = min(radius, spatial.MAX_RADIUS_M)
+        matches = [
+            (plot, {'distance_m': round(distance, 1)})
+            for plot, distance in spatial.within_radius(
+                *point, radius, queryset=_map_plots(), limit=spatial.FEATURE_LIMIT + 1,
+            )
+        ]
+    return JsonResponse({
+        'type': 'FeatureCollection',
+        'features': [spatial.feature(plot, **extra) for plot, extra in matches[:spatial.FEATURE_LIMIT]],
+        'truncated': len(matches) > spatial.FEATURE_LIMIT,
+    })
+
+@replica_safe
+@require_POST
+def plot_overlap_api(request):
+    """Existing plots whose boundary overlaps a posted GeoJSON polygon"""
+    try:
+        data = json.loads(request.body)
+        boundary = data.get('boundary', data)
+        exclude = data.get('exclude')
+        plots = spatial.overlapping(boundary, queryset=_map_plots(), exclude=exclude)
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Body must be a JSON GeoJSON polygon'}, status=400)
+    except ValidationError as exc:
+        return JsonResponse({'error': ' '.join(exc.messages)}, status=400)
+    return JsonResponse({
+        'type': 'FeatureCollection',
+        'features': [spatial.feature(plot) for plot in plots],
+    })
+
+@replica_safe
+@staff_member_required
+@require_POST
+def scenario_api(request):
+    """
+    Rate-shock simulation over the portfolio. Body: {"rules": [...]};
+    ?top= limits the per-valuation rows (largest loss first).
+    """
+    try:
+        rules = json.loads(request.body).get('rules')
+        result = scenarios.run(rules)
+    except (ValueError, AttributeError) as exc:
+        return JsonResponse({'error': str(exc) or 'Body must be JSON with a "rules" list'}, status=400)
+    try:
+        top = int(request.GET.get('top', 0))
+    except ValueError:
+        top = 0
+    if top > 0:
+        result['valuations'] = result['valuations'][:top]
+    return JsonResponse(result)
+
+def sync_pull(request):
+    """
+    Rows of the user's assigned reports changed after ?since=<watermark>,
+    plus deletions. Without since (or with a very old one) everything is sent.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        since = request.GET.get('since')
+        since = sync.parse_timestamp(since, 'since') if since else None
+        valuation_ids = [int(pk) for pk in request.GET.getlist('valuation')]
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(sync.pull(request.user, since, valuation_ids))
+
+@require_POST
+def sync_push(request):
+    """Apply a batch of offline edits: {"changes": [...]}; one result per change"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    try:
+        result = sync.push(request.user, json.loads(request.body).get('changes'))
+    except (ValueError, AttributeError) as exc:
+        return JsonResponse({'error': str(exc) or 'Body must be JSON with a "changes" list'}, status=400)
+    return JsonResponse(result)
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; needs REPORT_METRICS_TOKEN unless DEBUG is on"""
+    token = settings.REPORT_METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden('Metrics are disabled until REPORT_METRICS_TOKEN is set')
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden('Invalid metrics token')
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@csrf_exempt
+@require_POST
+def attachment_upload(request, valuation_pk):
+    """Upload photos and documents to a report; hashed while they stream in"""
+    # Upload handlers must be installed before CSRF checking reads request.POST
+    handler = attachments.HashingUploadHandler(request)
+    request.upload_handlers.insert(0, handler)
+    return _attachment_upload(request, valuation_pk, handler)
+
+@csrf_protect
+def _attachment_upload(request, valuation_pk, handler):
+    valuation = get_object_or_404(Valuation, pk=valuation_pk)
+    kind = request.POST.get('kind', Attachment.KIND_PHOTO)
+    if kind not in dict(Attachment.KIND_CHOICES):
+        kind = Attachment.KIND_OTHER
+    # Optional target within this report, written as "property-<pk>" or "plot-<pk>"
+    target, _, target_pk = request.POST.get('target', '').partition('-')
+    property = plot = None
+    if not target_pk.isdigit():
+        target = ''
+    if target == 'plot':
+        plot = Plot.objects.select_related('property').filter(pk=target_pk, property__valuation=valuation).first()
+        property = plot.property if plot else None
+    elif target == 'property':
+        property = Property.objects.filter(pk=target_pk, valuation=valuation).first()
+    
+    added, errors = attachments.attach(
+        valuation, request.FILES.getlist('files'), handler=handler, kind=kind,
+        property=property, plot=plot, caption=request.POST.get('caption', '').strip()[:200],
+        user=request.user,
+    )
+    for error in errors:
+        messages.error(request, error)
+    if added:
+        messages.success(request, f'{len(added)} file(s) attached.')
+    return redirect(reverse('report:valuation_detail', kwargs={'pk': valuation.pk}) + '#attachments')
+
+@require_POST
+def attachment_delete(request, pk):
+    """Remove an attachment; its stored file is freed by prune_blobs"""
+    attachment = get_object_or_404(Attachment, pk=pk)
+    attachment.delete()
+    messages.success(request, f'Removed "{attachment.original_name}".')
+    return redirect(reverse('report:valuation_detail', kwargs={'pk': attachment.valuation_id}) + '#attachments')
+
+def _serve_blob(request, file, content_type, size, etag, filename=None):
+    """Stream a stored file with ETag revalidation and single byte-range support"""
+    etag = f'"{etag}"'
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        # Content-addressed: the bytes behind a URL never change
+        'Cache-Control': 'private, max-age=31536000, immutable',
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        return HttpResponseNotModified(headers=headers)
+    
+    byte_range = None
+    if request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = attachments.parse_range(request.headers.get('Range'), size)
+        except attachments.AttachmentError:
+            return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+    download = request.GET.get('download') == '1'
+    if byte_range is None:
+        return FileResponse(file.open('rb'), as_attachment=download, filename=filename or '',
+                            content_type=content_type, headers=headers)
+    
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        attachments.read_range(file.open('rb'), start, end), status=206, content_type=content_type,
+        headers={**headers, 'Content-Range': f'bytes {start}-{end}/{size}'},
+    )
+    response['Content-Length'] = str(end - start + 1)
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(download, filename)
+    return response
+
+def attachment_file(request, sha256):
+    """Stored file by content hash; ?name= sets the download name"""
+    blob = get_object_or_404(Blob, sha256=sha256)
+    return _serve_blob(request, blob.file, blob.content_type, blob.size, blob.sha256,
+                       filename=request.GET.get('name') or blob.sha256)
+
+def attachment_thumbnail(request, sha256):
+    """JPEG thumbnail of an image blob, once the make_thumbnail job has run"""
+    blob = get_object_or_404(Blob, sha256=sha256)
+    if not blob.thumbnail:
+        raise Http404('No thumbnail yet')
+    return _serve_blob(request, blob.thumbnail, 'image/jpeg', blob.thumbnail.size, f'{blob.sha256}-thumb')
@@ -5,7 +5,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-your-secret-key-here-change-in-production'
 
-DEBUG = True
+# Set DJANGO_DEBUG=False for the production rendering path (cached templates)
+DEBUG = os.environ.get('DJANGO_DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
 
@@ -20,7 +21,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'report.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'report.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -31,11 +34,18 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'valuation.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    # Compile each template once per process
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'report.backends.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -43,10 +53,29 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': TEMPLATE_LOADERS,
         },
     },
 ]
 
+# Optional Jinja2 rendering for the largest list pages (pip install jinja2,
+# then set REPORT_JINJA2_LISTS=1). Templates live in report/jinja2/.
+try:
+    import jinja2  # noqa: F401
+except ImportError:
+    jinja2 = None
+
+REPORT_JINJA2_LISTS = jinja2 is not None and os.environ.get('REPORT_JINJA2_LISTS') == '1'
+if REPORT_JINJA2_LISTS:
+    TEMPLATES.append({
+        'BACKEND': 'report.backends.Jinja2',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'report.jinja2_env.environment',
+        },
+    })
+
 WSGI_APPLICATION = 'valuation.wsgi.application'
 
 DATABASES = {
@@ -56,6 +85,50 @@ DATABASES = {
     }
 }
 
+# Optional read replica for list, dashboard and export traffic.
+# Locally this can be a second SQLite file kept fresh with `manage.py refresh_replica`.
+REPORT_REPLICA_DB = os.environ.get('REPORT_REPLICA_DB')
+if REPORT_REPLICA_DB:
+    DATABASES['replica'] = {
+        'ENGINE': os.environ.get('REPORT_REPLICA_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': REPORT_REPLICA_DB,
+        'HOST': os.environ.get('REPORT_REPLICA_HOST', ''),
+        'PORT': os.environ.get('REPORT_REPLICA_PORT', ''),
+        'USER': os.environ.get('REPORT_REPLICA_USER', ''),
+        'PASSWORD': os.environ.get('REPORT_REPLICA_PASSWORD', ''),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['report.routers.ReadReplicaRouter']
+REPORT_READ_REPLICA = 'replica'
+# Seconds a client keeps reading from the primary after its own write
+REPORT_READ_YOUR_WRITES_SECONDS = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'report.backends.LocMemCache',
+        'LOCATION': 'valuation',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+# Per-process cache of QuerySet.cached() results (report/querycache.py). Entries
+# live at most as long as the read-your-writes window, so a client never reads
+# its own edit stale from another worker process.
+REPORT_QUERY_CACHE_ENTRIES = 2000
+REPORT_QUERY_CACHE_BYTES = 32 * 1024 * 1024
+REPORT_QUERY_CACHE_SECONDS = REPORT_READ_YOUR_WRITES_SECONDS
+
+# Columnar plot snapshot for analytics (manage.py export_snapshot)
+REPORT_SNAPSHOT_DIR = Path(os.environ.get('REPORT_SNAPSHOT_DIR', BASE_DIR / 'snapshots'))
+
+# Metrics for /metrics. With several worker processes point REPORT_METRICS_DIR
+# at a directory shared by them (cleared on deploy) so the endpoint sums all workers.
+REPORT_METRICS_DIR = os.environ.get('REPORT_METRICS_DIR')
+# Scrapers must send "Authorization: Bearer <token>"; without a token /metrics
+# is only served when DEBUG is on
+REPORT_METRICS_TOKEN = os.environ.get('REPORT_METRICS_TOKEN')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -79,4 +152,9 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'report/static']
 
+# Site photos, lalpurja scans and blueprints (report.attachments)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = Path(os.environ.get('REPORT_MEDIA_ROOT', BASE_DIR / 'media'))
+REPORT_ATTACHMENT_MAX_BYTES = 25 * 1024 * 1024
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file